@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+"""Бенчмарк трёх виджетов с подставными psutil, Open-Meteo, ip-api и playerctl.
+
+Каждый сценарий запускается в отдельном процессе-воркере с собственной
+песочницей (каталоги выполнения, кэша и spotify_covers). «cold» — новый
+интерпретатор и пустые кэши на каждый запуск, «warm» — один процесс,
+прогретый первым запуском, «tick» — новый интерпретатор на каждый запуск
+при прогретых кэшах на диске и меняющихся метриках (одиночный запуск из
+${execpi} каждый тик conky). На запуск считаются время (wall/CPU, включая
+дочерние процессы), байты, записанные в песочницу, а на воркер — время
+импорта и пиковый RSS. Сеть не нужна: все ответы отдаёт локальный сервер.
+
+    python3 benchmark.py --runs 20 --output bench.json
+    python3 benchmark.py --compare bench.json --threshold 0.10
+
+Время кодирования кадров (encode_sec) и размер PNG видны в bytes_written;
+TERRA_FAST_ENCODE=0 даёт прежний write_to_png для сравнения.
+"""
+import argparse
+import contextlib
+import http.server
+import io
+import json
+import os
+import resource
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import zlib
+from collections import namedtuple
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = ["system_rings", "weather_smart", "spotify_cover"]
+MODES = ["cold", "warm", "tick"]
+COVER_SIZE = 300
+
+# Абсолютные пороги: мелкий шум не считается регрессией
+MIN_DELTA = {
+    "wall_sec": 0.001,
+    "cpu_sec": 0.001,
+    "bytes_written": 4096,
+    "encode_sec": 0.001,
+    "import_sec": 0.002,
+    "peak_rss_bytes": 1024 * 1024,
+}
+
+
+# --- Подставные входные данные ---
+
+
+def make_png(size):
+    # Градиентная «обложка» без зависимостей: PNG собирается вручную
+    rows = b"".join(
+        b"\x00"
+        + bytes(v for x in range(size) for v in (x * 255 // size, y * 255 // size, 128))
+        for y in range(size)
+    )
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(rows))
+        + chunk(b"IEND", b"")
+    )
+
+
+def forecast_series(days):
+    # Почасовой ряд с полуночи UTC, как отвечает Open-Meteo с timeformat=unixtime
+    start = int(time.time()) // 86400 * 86400
+    hours = 24 * days
+    return {
+        "hourly": {
+            "time": [start + 3600 * i for i in range(hours)],
+            "temperature_2m": [-3.4 + (i % 24) / 4 for i in range(hours)],
+            "weather_code": [71 if i % 6 else 3 for i in range(hours)],
+            "is_day": [int(6 <= i % 24 < 18) for i in range(hours)],
+        },
+        "daily": {
+            "sunrise": [start + 86400 * d + 6 * 3600 for d in range(days)],
+            "sunset": [start + 86400 * d + 18 * 3600 for d in range(days)],
+        },
+    }
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    cover = b""
+
+    def do_GET(self):
+        if self.path.startswith("/v1/forecast"):
+            query = self.path.split("?", 1)[-1]
+            params = dict(p.split("=", 1) for p in query.split("&") if "=" in p)
+            count = len(params.get("latitude", "0").split(","))
+            if "hourly" in params:
+                one = forecast_series(int(params.get("forecast_days", "1")))
+            else:
+                one = {
+                    "current": {"temperature_2m": -3.4, "weather_code": 71, "is_day": 1}
+                }
+            body = json.dumps(one if count == 1 else [one] * count).encode()
+            content_type = "application/json"
+        elif self.path.startswith("/json"):
+            body = json.dumps(
+                {
+                    "status": "success",
+                    "city": "Bench",
+                    "country": "Nowhere",
+                    "lat": 52.54,
+                    "lon": 85.21,
+                }
+            ).encode()
+            content_type = "application/json"
+        elif self.path.startswith("/cover"):
+            body = self.cover
+            content_type = "image/png"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stand_in():
+    StandInHandler.cover = make_png(COVER_SIZE)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def fake_psutil(tick=0):
+    # Детерминированные значения, меняющиеся от вызова к вызову; tick — с какого
+    # тика начинать (у запусков режима «tick» разные значения, как у conky)
+    mod = types.ModuleType("psutil")
+    CpuTimes = namedtuple("scputimes", "user nice system idle iowait irq softirq steal")
+    Usage = namedtuple("usage", "total used free percent")
+    NetIO = namedtuple("snetio", "bytes_sent bytes_recv")
+    DiskIO = namedtuple("sdiskio", "read_bytes write_bytes")
+    state = {"tick": tick}
+    cores = 4
+
+    def cpu_times(percpu=False):
+        state["tick"] += 1
+        t = state["tick"]
+        core = CpuTimes(100 * t, 0, 20 * t, 300 * t + 7 * (t % 5), 0, 0, 0, 0)
+        if percpu:
+            return [core] * cores
+        return CpuTimes(*(v * cores for v in core))
+
+    def cpu_percent(interval=None, percpu=False):
+        value = 20.0 + state["tick"] % 60
+        return [value] * cores if percpu else value
+
+    def virtual_memory():
+        return Usage(16 << 30, 8 << 30, 8 << 30, 40.0 + state["tick"] % 30)
+
+    def disk_usage(path):
+        return Usage(512 << 30, 200 << 30, 312 << 30, 39.1)
+
+    def swap_memory():
+        return Usage(8 << 30, 1 << 30, 7 << 30, 12.5)
+
+    def net_io_counters(pernic=False):
+        t = state["tick"]
+        nic = NetIO(4096 * t, 65536 * t)
+        return {"lo": nic, "eth0": nic} if pernic else nic
+
+    def disk_io_counters(perdisk=False):
+        t = state["tick"]
+        disk = DiskIO((1 << 20) * t, (1 << 19) * t)
+        return {"sda": disk} if perdisk else disk
+
+    mod.cpu_times = cpu_times
+    mod.cpu_percent = cpu_percent
+    mod.virtual_memory = virtual_memory
+    mod.disk_usage = disk_usage
+    mod.swap_memory = swap_memory
+    mod.net_io_counters = net_io_counters
+    mod.disk_io_counters = disk_io_counters
+    return mod
+
+
+def write_fake_playerctl(sandbox, base_url):
+    path = os.path.join(sandbox, "playerctl")
+    with open(path, "w") as f:
+        f.write(
+            "#!/bin/sh\n"
+            f'echo "Playing||{base_url}/cover.png||Bench Title||Bench Artist"\n'
+        )
+    os.chmod(path, 0o755)
+    return path
+
+
+# --- Воркер ---
+
+
+def snapshot_files(root):
+    files = {}
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            # Разреженные файлы (mmap-история) считаем по занятым блокам
+            files[path] = (st.st_mtime_ns, min(st.st_size, st.st_blocks * 512))
+    return files
+
+
+def written_bytes(before, after):
+    # Новые и изменённые файлы песочницы, включая записанное дочерними процессами
+    return sum(
+        size
+        for path, (mtime, size) in after.items()
+        if path not in before or before[path][0] != mtime
+    )
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def encode_seconds(runtime):
+    # Кодирование кадров PNG (terra_runtime.publish_image), накопительно
+    return sum(stats["encode_sec"] for stats in runtime.ENCODE_STATS.values())
+
+
+def scenario_runner(name, mod, base_url):
+    if name == "system_rings":
+        # /proc/stat недоступен -> счётчики CPU берутся из подставного psutil
+        mod.PROC_STAT = "/nonexistent"
+        return lambda cold: mod.draw()
+
+    if name == "weather_smart":
+
+        def run(cold):
+            if cold:
+                # Холодный запуск включает синхронное обновление кэша прогноза
+                mod.refresh_weather_cache(mod.LOCATIONS)
+            mod.main()
+
+        return run
+
+    def run(cold):
+        if cold:
+            mod.fetch_cover_once(f"{base_url}/cover.png")
+        mod.main()
+
+    return run
+
+
+def run_worker(args):
+    sandbox = args.sandbox
+    os.chdir(sandbox)
+    sys.argv = [f"{args.worker}.py"]
+    sys.path.insert(0, SCRIPT_DIR)
+    sys.modules["psutil"] = fake_psutil(args.tick or 0)
+
+    started = time.perf_counter()
+    mod = __import__(args.worker)
+    import_sec = time.perf_counter() - started
+
+    import terra_runtime
+
+    run = scenario_runner(args.worker, mod, os.environ["TERRA_BENCH_URL"])
+    if not args.cold and args.tick is None:
+        # Прогрев: наполняем кэши синхронно, чтобы замеры не зависели от фоновых загрузок
+        with contextlib.redirect_stdout(io.StringIO()):
+            run(True)
+
+    runs = []
+    for _ in range(args.runs):
+        before = snapshot_files(sandbox)
+        encode_start = encode_seconds(terra_runtime)
+        cpu_start = cpu_seconds()
+        wall_start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            run(args.cold)
+        wall = time.perf_counter() - wall_start
+        cpu = cpu_seconds() - cpu_start
+        runs.append(
+            {
+                "wall_sec": wall,
+                "cpu_sec": cpu,
+                "bytes_written": written_bytes(before, snapshot_files(sandbox)),
+                "encode_sec": encode_seconds(terra_runtime) - encode_start,
+            }
+        )
+
+    result = {
+        "import_sec": import_sec,
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "runs": runs,
+    }
+    with open(args.result, "w") as f:
+        json.dump(result, f)
+
+
+# --- Родительский процесс ---
+
+
+def spawn_worker(name, runs, cold, base_url, sandbox=None, tick=None):
+    # Своя песочница удаляется после воркера, переданная остаётся вызывающему
+    own_sandbox = sandbox is None
+    if own_sandbox:
+        sandbox = tempfile.mkdtemp(prefix="terra-bench-")
+    result_path = os.path.join(sandbox, "result.json")
+    env = dict(
+        os.environ,
+        XDG_RUNTIME_DIR=os.path.join(sandbox, "runtime"),
+        XDG_CACHE_HOME=os.path.join(sandbox, "cache"),
+        TERRA_WEATHER_API_URL=f"{base_url}/v1/forecast",
+        TERRA_IP_API_URL=f"{base_url}/json/",
+        # Координаты погоды из индекса городов, одинаково на любой машине
+        TZ="Europe/Berlin",
+        TERRA_PLAYERCTL=write_fake_playerctl(sandbox, base_url),
+        TERRA_BENCH_URL=base_url,
+    )
+    cmd = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--worker",
+        name,
+        "--runs",
+        str(runs),
+        "--sandbox",
+        sandbox,
+        "--result",
+        result_path,
+    ]
+    if cold:
+        cmd.append("--cold")
+    if tick is not None:
+        cmd += ["--tick", str(tick)]
+    try:
+        subprocess.run(cmd, env=env, check=True)
+        with open(result_path, "r") as f:
+            return json.load(f)
+    finally:
+        if own_sandbox:
+            shutil.rmtree(sandbox, ignore_errors=True)
+
+
+def summarize(values):
+    values = sorted(values)
+    return {
+        "median": statistics.median(values),
+        "mean": statistics.fmean(values),
+        "p95": values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))],
+        "min": values[0],
+        "max": values[-1],
+    }
+
+
+def tick_workers(name, runs, base_url):
+    # Одна песочница: холодный запуск наполняет кэши, дальше по процессу на тик
+    sandbox = tempfile.mkdtemp(prefix="terra-bench-")
+    try:
+        spawn_worker(name, 1, True, base_url, sandbox)
+        return [
+            spawn_worker(name, 1, False, base_url, sandbox, tick=tick)
+            for tick in range(1, runs + 1)
+        ]
+    finally:
+        shutil.rmtree(sandbox, ignore_errors=True)
+
+
+def bench_mode(name, runs, mode, base_url):
+    if mode == "cold":
+        # Новый интерпретатор и пустая песочница на каждый запуск
+        workers = [spawn_worker(name, 1, True, base_url) for _ in range(runs)]
+    elif mode == "tick":
+        workers = tick_workers(name, runs, base_url)
+    else:
+        workers = [spawn_worker(name, runs, False, base_url)]
+
+    samples = [run for worker in workers for run in worker["runs"]]
+    return {
+        "runs": len(samples),
+        "wall_sec": summarize([s["wall_sec"] for s in samples]),
+        "cpu_sec": summarize([s["cpu_sec"] for s in samples]),
+        "bytes_written": summarize([s["bytes_written"] for s in samples]),
+        "encode_sec": summarize([s["encode_sec"] for s in samples]),
+        "import_sec": statistics.median(w["import_sec"] for w in workers),
+        "peak_rss_bytes": max(w["peak_rss_bytes"] for w in workers),
+    }
+
+
+def compare(current, baseline, threshold):
+    regressions = []
+    for name, modes in current["results"].items():
+        for mode, result in modes.items():
+            base = baseline.get("results", {}).get(name, {}).get(mode)
+            if not base:
+                continue
+            for metric, floor in MIN_DELTA.items():
+                if metric not in base:
+                    continue
+                new, old = result[metric], base[metric]
+                if isinstance(new, dict):
+                    new, old = new["median"], old["median"]
+                if new > old * (1 + threshold) and new - old > floor:
+                    regressions.append(
+                        {
+                            "scenario": name,
+                            "mode": mode,
+                            "metric": metric,
+                            "baseline": old,
+                            "current": new,
+                            "change": (new - old) / old if old else None,
+                        }
+                    )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TERRA UI: бенчмарк виджетов")
+    parser.add_argument("--runs", type=int, default=10, help="запусков на режим")
+    parser.add_argument(
+        "--scenario", action="append", choices=SCENARIOS, help="только эти сценарии"
+    )
+    parser.add_argument("--output", help="сохранить JSON-результат в файл")
+    parser.add_argument("--compare", metavar="BASELINE", help="сравнить с сохранённым JSON")
+    parser.add_argument(
+        "--threshold", type=float, default=0.10, help="допустимый рост медианы (доля)"
+    )
+    # Внутренние параметры воркера
+    parser.add_argument("--worker", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--sandbox", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    parser.add_argument("--cold", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--tick", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    server, base_url = start_stand_in()
+    try:
+        results = {}
+        for name in args.scenario or SCENARIOS:
+            results[name] = {mode: bench_mode(name, args.runs, mode, base_url) for mode in MODES}
+    finally:
+        server.shutdown()
+
+    report = {
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "fast_encode": os.environ.get("TERRA_FAST_ENCODE", "1") != "0",
+        "timestamp": time.time(),
+        "results": results,
+    }
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, "r") as f:
+            report["regressions"] = compare(report, json.load(f), args.threshold)
+        exit_code = 1 if report["regressions"] else 0
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
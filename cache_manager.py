@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Кэш файлов с бюджетом по размеру и LRU-вытеснением по манифесту.
+
+Манифест — небольшой JSON рядом с файлами: размер и время последнего
+доступа каждой записи плюс счётчики попаданий, промахов и вытеснений.
+Каталог не сканируется (кроме одного раза, когда манифеста ещё нет),
+самая старая запись берётся из кучи за O(log n). Изменения манифеста
+идут под flock, так что демон и фоновые процессы не теряют записи.
+
+Статистика: python3 cache_manager.py <каталог> [манифест]
+"""
+import contextlib
+import fcntl
+import heapq
+import json
+import os
+import sys
+import time
+
+# Время доступа нужно только для порядка LRU: попадание переписывает манифест,
+# если отметка сдвинулась больше чем на столько секунд, а не на каждом тике
+ATIME_RESOLUTION_SEC = 60
+
+
+class CacheManager:
+    def __init__(self, directory, budget_bytes, manifest="manifest.json", prefixes=()):
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        self.manifest_path = os.path.join(directory, manifest)
+        # Какие файлы каталога принадлежат кэшу (для первичного сканирования)
+        self.prefixes = tuple(prefixes)
+        self.entries = {}
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+        # Попадания и промахи, ещё не записанные в манифест
+        self._unsaved = {}
+        self.total_bytes = 0
+        self._heap = []
+        self._mtime = None
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def lookup(self, name):
+        """Путь к записи при попадании (и отметка доступа) или None при промахе."""
+        with self._transaction(write=False):
+            entry = self.entries.get(name)
+            if entry is not None and not os.path.exists(self.path(name)):
+                self._drop(name)
+                self._count("misses")
+                self._save()
+                return None
+            if entry is None:
+                self._count("misses")
+                return None
+            self._count("hits")
+            if time.time() - entry[1] >= ATIME_RESOLUTION_SEC:
+                self._touch(name)
+                self._save()
+            return self.path(name)
+
+    def add(self, name):
+        """Регистрирует уже записанный файл и вытесняет старые записи сверх бюджета."""
+        with self._transaction():
+            try:
+                size = os.path.getsize(self.path(name))
+            except OSError:
+                return
+            if name in self.entries:
+                self.total_bytes -= self.entries[name][0]
+            self.entries[name] = [size, 0]
+            self.total_bytes += size
+            self._touch(name)
+            self._evict(keep=name)
+
+    def stats(self):
+        with self._transaction(write=False):
+            return dict(
+                self.counters,
+                entries=len(self.entries),
+                bytes=self.total_bytes,
+                budget_bytes=self.budget_bytes,
+            )
+
+    @contextlib.contextmanager
+    def _transaction(self, write=True):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(f"{self.manifest_path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._load()
+            yield
+            if write:
+                self._save()
+
+    def _load(self):
+        # Перечитываем манифест, только если его изменил другой процесс
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime is not None and mtime == self._mtime:
+            return
+
+        entries, counters = None, dict(self.counters)
+        if mtime is not None:
+            try:
+                with open(self.manifest_path, "r") as f:
+                    data = json.load(f)
+                entries = data.get("entries", {})
+                counters.update(data.get("counters", {}))
+                # Несохранённые счётчики этого процесса поверх прочитанных
+                for key, value in self._unsaved.items():
+                    counters[key] = counters.get(key, 0) + value
+            except (OSError, ValueError):
+                entries = None
+        scanned = entries is None
+        if scanned:
+            entries = self._scan_existing()
+
+        self.entries = entries
+        self.counters = counters
+        self.total_bytes = sum(size for size, _ in entries.values())
+        self._heap = [(atime, name) for name, (_, atime) in entries.items()]
+        heapq.heapify(self._heap)
+        if scanned:
+            # Сохраняем сразу (мы под flock): иначе каждая операция только
+            # для чтения сканировала бы каталог заново
+            self._save()
+
+    def _scan_existing(self):
+        # Единственный обход каталога: перенос файлов, созданных до манифеста
+        entries = {}
+        try:
+            with os.scandir(self.directory) as it:
+                for item in it:
+                    if item.is_file() and item.name.startswith(self.prefixes):
+                        st = item.stat()
+                        entries[item.name] = [st.st_size, st.st_mtime]
+        except OSError:
+            pass
+        return entries
+
+    def _save(self):
+        data = {"entries": self.entries, "counters": self.counters}
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.manifest_path)
+        self._mtime = os.stat(self.manifest_path).st_mtime_ns
+        self._unsaved = {}
+
+    def _count(self, key):
+        self.counters[key] += 1
+        self._unsaved[key] = self._unsaved.get(key, 0) + 1
+
+    def _touch(self, name):
+        now = time.time()
+        self.entries[name][1] = now
+        heapq.heappush(self._heap, (now, name))
+        # Устаревшие элементы кучи копятся при каждом доступе: периодически сжимаем
+        if len(self._heap) > 2 * len(self.entries) + 16:
+            self._heap = [(atime, n) for n, (_, atime) in self.entries.items()]
+            heapq.heapify(self._heap)
+
+    def _drop(self, name):
+        size, _ = self.entries.pop(name)
+        self.total_bytes -= size
+
+    def _evict(self, keep=None):
+        while self.total_bytes > self.budget_bytes and self._heap:
+            atime, name = self._heap[0]
+            entry = self.entries.get(name)
+            if entry is None or entry[1] != atime:
+                heapq.heappop(self._heap)
+                continue
+            if name == keep:
+                break
+            heapq.heappop(self._heap)
+            try:
+                os.remove(self.path(name))
+            except OSError:
+                pass
+            self._drop(name)
+            self.counters["evictions"] += 1
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: cache_manager.py <directory> [manifest]")
+    manifest = sys.argv[2] if len(sys.argv) > 2 else "manifest.json"
+    stats = CacheManager(sys.argv[1], 0, manifest).stats()
+    stats.pop("budget_bytes")
+    print(json.dumps(stats, indent=2))
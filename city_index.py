@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""Координаты города или часового пояса без сети.
+
+cities.idx — отсортированная таблица записей фиксированной длины
+(ключ, широта, долгота), поэтому поиск — двоичный прямо по mmap файла:
+ни разбора JSON, ни загрузки всей таблицы в память. Ключи двух видов:
+часовой пояс ("europe/berlin", "asia/calcutta") и город ("berlin",
+"new york"), в нижнем регистре и с пробелами вместо "_".
+
+Таблица собирается из zone.tab и ссылок tzdata.zi системной базы часовых
+поясов (координаты главного города пояса) и дополнительных TSV-файлов
+"город<TAB>широта<TAB>долгота" (например, выборка из GeoNames):
+
+    python3 city_index.py build [свои_города.tsv ...] > cities.idx
+    python3 city_index.py lookup Berlin
+"""
+import mmap
+import os
+import sys
+
+INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cities.idx")
+ZONEINFO_DIR = "/usr/share/zoneinfo"
+
+KEY_SIZE = 40
+# ключ, широта (8), долгота (9), перевод строки
+RECORD_SIZE = KEY_SIZE + 8 + 9 + 1
+
+_index = {}
+
+
+def normalize(name):
+    return " ".join(name.replace("_", " ").lower().split())
+
+
+def open_index(path=INDEX_FILE):
+    mm = _index.get(path)
+    if mm is None:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mm) % RECORD_SIZE:
+            mm.close()
+            raise ValueError(f"{path}: повреждённый индекс городов")
+        _index[path] = mm
+    return mm
+
+
+def lookup(name, path=INDEX_FILE):
+    """(широта, долгота) города или часового пояса; None, если его нет в индексе."""
+    key = normalize(name).encode()
+    if not key or len(key) > KEY_SIZE:
+        return None
+    mm = open_index(path)
+    lo, hi = 0, len(mm) // RECORD_SIZE
+    while lo < hi:
+        mid = (lo + hi) // 2
+        offset = mid * RECORD_SIZE
+        current = mm[offset : offset + KEY_SIZE].rstrip(b" ")
+        if current < key:
+            lo = mid + 1
+        elif current > key:
+            hi = mid
+        else:
+            record = mm[offset + KEY_SIZE : offset + RECORD_SIZE]
+            return float(record[:8]), float(record[8:17])
+    return None
+
+
+def system_timezone():
+    """Имя часового пояса системы (TZ, /etc/localtime, /etc/timezone) или None."""
+    tz = os.environ.get("TZ", "").lstrip(":")
+    if tz:
+        if not tz.startswith("/"):
+            return tz
+        path = tz
+    else:
+        path = "/etc/localtime"
+    try:
+        target = os.path.realpath(path)
+        if "/zoneinfo/" in target:
+            zone = target.split("/zoneinfo/", 1)[1]
+            # posix/ и right/ — те же пояса с другими правилами секунд
+            for prefix in ("posix/", "right/"):
+                if zone.startswith(prefix):
+                    zone = zone[len(prefix) :]
+            return zone
+    except OSError:
+        pass
+    try:
+        with open("/etc/timezone", "r") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+# --- Сборка индекса ---
+
+
+def parse_iso6709(text):
+    # "+5222+01320" или "+404251-0740023": градусы, минуты и, возможно, секунды
+    split = max(text.rfind("+"), text.rfind("-"))
+    coords = []
+    for part, degree_digits in ((text[:split], 2), (text[split:], 3)):
+        sign = -1 if part[0] == "-" else 1
+        digits = part[1:]
+        value = int(digits[:degree_digits]) + int(digits[degree_digits : degree_digits + 2]) / 60
+        if len(digits) > degree_digits + 2:
+            value += int(digits[degree_digits + 2 :]) / 3600
+        coords.append(sign * value)
+    return tuple(coords)
+
+
+def city_name(zone):
+    return zone.rsplit("/", 1)[-1]
+
+
+def zone_records(zoneinfo_dir=ZONEINFO_DIR):
+    zones = {}
+    with open(os.path.join(zoneinfo_dir, "zone.tab"), "r") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            fields = line.rstrip("\n").split("\t")
+            zones[fields[2]] = parse_iso6709(fields[1])
+
+    links = {}
+    try:
+        with open(os.path.join(zoneinfo_dir, "tzdata.zi"), "r") as f:
+            for line in f:
+                if line.startswith("L "):
+                    _, target, link = line.split()
+                    links[link] = target
+    except OSError:
+        pass
+
+    records = []
+    for zone, coords in zones.items():
+        records += [(zone, coords), (city_name(zone), coords)]
+    for link, target in links.items():
+        if target in zones:
+            records.append((link, zones[target]))
+            if "/" in link:
+                records.append((city_name(link), zones[target]))
+    return records
+
+
+def tsv_records(path):
+    records = []
+    with open(path, "r") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) >= 3 and not line.startswith("#"):
+                records.append((fields[0], (float(fields[1]), float(fields[2]))))
+    return records
+
+
+def build(records):
+    """Байты индекса: первый ключ выигрывает, ключи длиннее KEY_SIZE пропускаются."""
+    table = {}
+    for name, (lat, lon) in records:
+        key = normalize(name).encode()
+        if key and len(key) <= KEY_SIZE and key not in table:
+            table[key] = (lat, lon)
+    return b"".join(
+        key.ljust(KEY_SIZE) + f"{lat:+8.3f}{lon:+9.3f}\n".encode()
+        for key, (lat, lon) in sorted(table.items())
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "build":
+        # Свои города идут первыми и перекрывают одноимённые пояса
+        records = [r for path in sys.argv[2:] for r in tsv_records(path)]
+        sys.stdout.buffer.write(build(records + zone_records()))
+    elif len(sys.argv) >= 3 and sys.argv[1] == "lookup":
+        print(lookup(" ".join(sys.argv[2:])))
+    else:
+        sys.exit("usage: city_index.py build [cities.tsv ...] | lookup <город или пояс>")
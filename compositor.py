@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""Один процесс и одна картинка для всех виджетов TERRA UI.
+
+Кольца, погода и Spotify подключаются как модули и опрашиваются каждый
+со своим интервалом. Виджет перерисовывается только в своём прямоугольнике
+и только когда изменились его данные; если не изменилось ничего, новый
+кадр не кодируется. Conky получает одну строку ${image ...}:
+
+    ${execpi 1 ./terra_client.sh compositor}
+"""
+import argparse
+import threading
+import time
+
+import cairo
+
+import instrument
+import spotify_cover
+import system_rings
+import terra_runtime
+import text_metrics
+import weather_smart
+
+OUTPUT_NAME = terra_runtime.instance_name("compositor")
+
+# Погода занимает по строке на город: кольца и Spotify идут под ней,
+# чтобы области виджетов не пересекались и очистка одной не стирала другую
+WEATHER_HEIGHT = weather_smart.IMG_HEIGHT * max(1, len(weather_smart.LOCATIONS))
+RINGS_Y = WEATHER_HEIGHT
+SPOTIFY_Y = RINGS_Y + 140
+
+# Общая картинка: прямоугольник окна conky, в котором лежат все виджеты
+CANVAS_X, CANVAS_Y = 0, 300
+CANVAS_WIDTH, CANVAS_HEIGHT = 900, SPOTIFY_Y + spotify_cover.CANVAS_HEIGHT
+
+# Положение каждого виджета внутри общей картинки и период опроса (сек)
+WIDGETS = [
+    {"name": "weather", "x": 0, "y": 0, "interval": 60},
+    {"name": "rings", "x": 150, "y": RINGS_Y, "interval": 1},
+    # С бегущей строкой Spotify опрашивается с частотой её кадров
+    {
+        "name": "spotify",
+        "x": 170,
+        "y": SPOTIFY_Y,
+        "interval": spotify_cover.MARQUEE_INTERVAL if spotify_cover.MARQUEE else 2,
+    },
+]
+
+_spotify_state = {"data": None, "revision": 0, "listening": False, "follower": False}
+
+
+# --- Кольца ---
+
+
+def sample_rings():
+    # Тот же путь, что у system_rings.draw(): снимок сэмплера или свой опрос с историей
+    stats = system_rings.read_stats(persist=False)
+    sparks = system_rings.sparkline_samples() if system_rings.SPARKLINES else None
+    # Цвет входит в выборку: новая палитра обложки перерисует кольца
+    system_rings.apply_cover_accent()
+    return system_rings.quantise(stats), sparks, system_rings.COLOR_ACCENT
+
+
+def draw_rings(ctx, sample):
+    values, sparks, _ = sample
+    system_rings.paint_frame(ctx, values, sparks)
+
+
+# --- Погода ---
+
+
+def sample_weather():
+    snapshot = terra_runtime.read_sampler()
+    if snapshot and snapshot.get("weather"):
+        rows = snapshot["weather"]
+    else:
+        rows = weather_smart.weather_rows()
+    if not rows:
+        return None
+    return tuple(map(tuple, rows)), weather_smart.accent_rgb()
+
+
+def draw_weather(ctx, sample):
+    rows, _ = sample
+    for i, row in enumerate(rows):
+        ctx.save()
+        ctx.translate(0, i * weather_smart.IMG_HEIGHT)
+        weather_smart.draw_weather_row(ctx, *row)
+        ctx.restore()
+
+
+# --- Spotify ---
+
+
+def follow_spotify():
+    # Слушатель playerctl --follow в отдельном потоке, как в spotify_cover --daemon
+    while True:
+        try:
+            for data in spotify_cover.follow_metadata():
+                _spotify_state["data"] = tuple(data)
+        except OSError:
+            pass
+        _spotify_state["data"] = None
+        time.sleep(spotify_cover.LISTENER_RESTART_DELAY)
+
+
+def on_cover(path):
+    # Обложка докачалась: новая ревизия заставит перерисовать область
+    _spotify_state["revision"] += 1
+
+
+def sample_spotify():
+    snapshot = terra_runtime.read_sampler()
+    if snapshot and "spotify" in snapshot:
+        data = tuple(snapshot["spotify"] or ()) or None
+    else:
+        if _spotify_state["listening"] and not _spotify_state["follower"]:
+            # Сэмплера нет: свой слушатель playerctl, запускается один раз
+            _spotify_state["follower"] = True
+            threading.Thread(target=follow_spotify, daemon=True).start()
+        data = _spotify_state["data"]
+    if data is None or len(data) < 4:
+        return None
+    # Номер кадра бегущей строки входит в выборку: смена кадра перерисует только область Spotify
+    frame = spotify_cover.marquee_frame(data[2], data[1])
+    return data, _spotify_state["revision"], frame[0] if frame else None
+
+
+def draw_spotify(ctx, sample):
+    data, _, index = sample
+    # Без слушателя (одиночный кадр) обложку докачивает отдельный процесс
+    path = spotify_cover.render_composite(
+        data, on_cover if _spotify_state["listening"] else None
+    )
+    if path:
+        ctx.set_source_surface(cairo.ImageSurface.create_from_png(path), 0, 0)
+        ctx.paint()
+        frame = spotify_cover.marquee_frame(data[2], data[1]) if index is not None else None
+        if frame:
+            ctx.set_source_surface(frame[1], spotify_cover.TEXT_X, spotify_cover.MARQUEE_TOP)
+            ctx.paint()
+
+
+RENDERERS = {
+    "rings": (
+        system_rings.WIDTH,
+        system_rings.HEIGHT,
+        sample_rings,
+        draw_rings,
+    ),
+    "weather": (
+        weather_smart.IMG_WIDTH,
+        WEATHER_HEIGHT,
+        sample_weather,
+        draw_weather,
+    ),
+    "spotify": (
+        spotify_cover.CANVAS_WIDTH,
+        spotify_cover.CANVAS_HEIGHT,
+        sample_spotify,
+        draw_spotify,
+    ),
+}
+
+
+def update_widgets(ctx, last, next_due, now):
+    """Перерисовывает области, чьи данные изменились; True, если нужен новый кадр."""
+    dirty = False
+    for widget in WIDGETS:
+        name = widget["name"]
+        if now < next_due.get(name, 0):
+            continue
+        next_due[name] = now + widget["interval"]
+
+        width, height, sample, draw = RENDERERS[name]
+        try:
+            with instrument.stage(f"compositor.sample.{name}"):
+                data = sample()
+        except Exception:
+            continue
+        if name in last and last[name] == data:
+            continue
+        last[name] = data
+
+        ctx.save()
+        ctx.rectangle(widget["x"], widget["y"], width, height)
+        ctx.clip()
+        ctx.set_operator(cairo.OPERATOR_CLEAR)
+        ctx.paint()
+        ctx.set_operator(cairo.OPERATOR_OVER)
+        ctx.translate(widget["x"], widget["y"])
+        try:
+            if data is not None:
+                with instrument.stage(f"compositor.draw.{name}"):
+                    draw(ctx, data)
+        except Exception:
+            pass
+        ctx.restore()
+        dirty = True
+    return dirty
+
+
+def publish(surface):
+    # Пустые поля холста обрезаются: conky получает только занятый прямоугольник
+    with instrument.stage("compositor.encode"):
+        _, line = terra_runtime.publish_image(OUTPUT_NAME, surface, CANVAS_X, CANVAS_Y)
+    return line
+
+
+def run_daemon():
+    lock = terra_runtime.acquire_lock(OUTPUT_NAME)
+    if lock is None:
+        return
+
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, CANVAS_WIDTH, CANVAS_HEIGHT)
+    ctx = cairo.Context(surface)
+    system_rings.sample_cpu_delta(persist=False)
+    if system_rings.RING_SPRITES:
+        system_rings.load_atlas()
+    _spotify_state["listening"] = True
+
+    last, next_due = {}, {}
+    while True:
+        now = time.monotonic()
+        if update_widgets(ctx, last, next_due, now):
+            try:
+                terra_runtime.publish_line(OUTPUT_NAME, publish(surface))
+            except Exception:
+                pass
+            text_metrics.save()
+        instrument.flush(OUTPUT_NAME, persist=False)
+        # Спим до ближайшего виджета, которому пора опрашиваться
+        time.sleep(max(0.0, min(next_due.values()) - time.monotonic()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TERRA UI: все виджеты в одной картинке")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="работать постоянно и обновлять строку для terra_client.sh",
+    )
+    args = parser.parse_args()
+
+    if args.daemon:
+        run_daemon()
+        return
+
+    # Одиночный кадр: Spotify опрашивается один раз вместо слушателя
+    _spotify_state["data"] = tuple(spotify_cover.get_metadata() or ()) or None
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, CANVAS_WIDTH, CANVAS_HEIGHT)
+    update_widgets(cairo.Context(surface), {}, {}, time.monotonic())
+    print(publish(surface))
+    instrument.flush(OUTPUT_NAME)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""Декодирование и масштабирование обложек прямо в процессе, без ImageMagick.
+
+Декодер: Pillow или GdkPixbuf (есть в любой GNOME-системе), PNG — через cairo.
+С NumPy обложка усредняется по площади векторно, без него масштабирует сам
+декодер. convert остаётся последним запасным вариантом и работает через
+конвейер, без временных файлов.
+
+extract_palette() берёт цвета из уже уменьшенной обложки: пиксели
+раскладываются по корзинам PALETTE_BITS бит на канал (NumPy bincount или
+простой цикл), из самых населённых корзин выбираются различимые цвета.
+"""
+import io
+import subprocess
+import sys
+
+import cairo
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import gi
+
+    gi.require_version("GdkPixbuf", "2.0")
+    from gi.repository import GdkPixbuf
+except (ImportError, ValueError):
+    GdkPixbuf = None
+
+
+def decode_pil(path, size=None):
+    with Image.open(path) as img:
+        img = img.convert("RGBA")
+        if size:
+            img = img.resize((size, size), Image.LANCZOS)
+        return img.width, img.height, img.tobytes()
+
+
+def decode_pixbuf(path, size=None):
+    pixbuf = GdkPixbuf.Pixbuf.new_from_file(path)
+    if size:
+        pixbuf = pixbuf.scale_simple(size, size, GdkPixbuf.InterpType.HYPER)
+    if not pixbuf.get_has_alpha():
+        pixbuf = pixbuf.add_alpha(False, 0, 0, 0)
+
+    w, h = pixbuf.get_width(), pixbuf.get_height()
+    stride = pixbuf.get_rowstride()
+    pixels = pixbuf.get_pixels()
+    # Убираем выравнивание строк: дальше нужен плотный RGBA
+    data = b"".join(pixels[y * stride : y * stride + w * 4] for y in range(h))
+    return w, h, data
+
+
+def decode_rgba(path, size=None):
+    """(ширина, высота, RGBA-байты) или None, если подходящего декодера нет."""
+    for available, decoder in ((Image, decode_pil), (GdkPixbuf, decode_pixbuf)):
+        if available is None:
+            continue
+        try:
+            return decoder(path, size)
+        except Exception:
+            pass
+    return None
+
+
+def area_weights(src, dst):
+    # Доля каждого исходного пикселя в выходном (усреднение по площади)
+    scale = src / dst
+    edges = np.arange(dst + 1) * scale
+    j = np.arange(src)[None, :]
+    overlap = np.minimum(edges[1:, None], j + 1) - np.maximum(edges[:-1, None], j)
+    return np.clip(overlap, 0, None) / scale
+
+
+def resize_premultiplied(w, h, data, size):
+    """RGBA -> премультиплицированный массив size x size (float32) через NumPy."""
+    arr = np.frombuffer(data, dtype=np.uint8).reshape(h, w, 4).astype(np.float32)
+    arr[..., :3] *= arr[..., 3:4] / 255.0
+    rows = np.tensordot(area_weights(h, size), arr, axes=(1, 0))
+    out = np.tensordot(rows, area_weights(w, size), axes=(1, 1))
+    return out.transpose(0, 2, 1)
+
+
+def surface_from_premultiplied(arr):
+    h, w = arr.shape[:2]
+    pixels = np.clip(arr + 0.5, 0, 255).astype(np.uint8)
+    # cairo ARGB32 — 32-битное слово в порядке байт машины
+    order = [2, 1, 0, 3] if sys.byteorder == "little" else [3, 0, 1, 2]
+    buf = bytearray(np.ascontiguousarray(pixels[..., order]).tobytes())
+    return cairo.ImageSurface.create_for_data(
+        buf, cairo.FORMAT_ARGB32, w, h, w * 4
+    )
+
+
+def surface_from_rgba(w, h, data):
+    buf = bytearray(w * h * 4)
+    little = sys.byteorder == "little"
+    for i in range(0, len(buf), 4):
+        r, g, b, a = data[i], data[i + 1], data[i + 2], data[i + 3]
+        r, g, b = r * a // 255, g * a // 255, b * a // 255
+        buf[i : i + 4] = bytes((b, g, r, a) if little else (a, r, g, b))
+    return cairo.ImageSurface.create_for_data(
+        buf, cairo.FORMAT_ARGB32, w, h, w * 4
+    )
+
+
+def convert_surface(path, size):
+    # Запасной путь: ImageMagick через конвейер, без общих временных файлов
+    png = subprocess.run(
+        ["convert", path, "-resize", f"{size}x{size}!", "png:-"],
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout
+    return cairo.ImageSurface.create_from_png(io.BytesIO(png))
+
+
+def load_scaled_surface(path, size):
+    """Обложка size x size как cairo.ImageSurface (пропорции не сохраняются, как у convert ...!)."""
+    if np is not None:
+        decoded = decode_rgba(path)
+        if decoded:
+            return surface_from_premultiplied(resize_premultiplied(*decoded, size))
+    else:
+        decoded = decode_rgba(path, size)
+        if decoded:
+            return surface_from_rgba(*decoded)
+
+    try:
+        return convert_surface(path, size)
+    except Exception:
+        return None
+
+
+# Палитра: бит на канал в корзине, минимальное расстояние между цветами
+# палитры (RGB 0..1) и минимальная яркость акцента (текст на тёмном столе)
+PALETTE_BITS = 4
+PALETTE_MIN_DISTANCE = 0.15
+ACCENT_MIN_LUMINANCE = 0.35
+SECONDARY_SHADE = 0.65
+
+
+def surface_pixels(surface):
+    # (r, g, b, a) поверхности ARGB32 без премультипликации, построчно
+    surface.flush()
+    w, h, stride = surface.get_width(), surface.get_height(), surface.get_stride()
+    data = bytes(surface.get_data())
+    order = (2, 1, 0, 3) if sys.byteorder == "little" else (1, 2, 3, 0)
+    return w, h, stride, data, order
+
+
+def bin_colors_numpy(surface):
+    w, h, stride, data, order = surface_pixels(surface)
+    arr = np.frombuffer(data, dtype=np.uint8).reshape(h, stride // 4, 4)[:, :w]
+    arr = arr[..., list(order)].reshape(-1, 4).astype(np.float32)
+    arr = arr[arr[:, 3] >= 128]
+    if not len(arr):
+        return []
+    rgb = np.clip(arr[:, :3] * 255.0 / arr[:, 3:4], 0, 255)
+    shift = 8 - PALETTE_BITS
+    q = rgb.astype(np.int32) >> shift
+    bins = (q[:, 0] << (2 * PALETTE_BITS)) | (q[:, 1] << PALETTE_BITS) | q[:, 2]
+    size = 1 << (3 * PALETTE_BITS)
+    counts = np.bincount(bins, minlength=size)
+    sums = [np.bincount(bins, weights=rgb[:, c], minlength=size) for c in range(3)]
+    used = np.nonzero(counts)[0]
+    return [
+        (int(counts[i]), tuple(float(sums[c][i] / counts[i] / 255.0) for c in range(3)))
+        for i in used
+    ]
+
+
+def bin_colors_python(surface):
+    w, h, stride, data, order = surface_pixels(surface)
+    shift = 8 - PALETTE_BITS
+    bins = {}
+    for y in range(h):
+        row = y * stride
+        for x in range(row, row + w * 4, 4):
+            a = data[x + order[3]]
+            if a < 128:
+                continue
+            r = min(255, data[x + order[0]] * 255 // a)
+            g = min(255, data[x + order[1]] * 255 // a)
+            b = min(255, data[x + order[2]] * 255 // a)
+            key = (r >> shift, g >> shift, b >> shift)
+            entry = bins.get(key)
+            if entry is None:
+                bins[key] = [1, r, g, b]
+            else:
+                entry[0] += 1
+                entry[1] += r
+                entry[2] += g
+                entry[3] += b
+    return [(n, (r / n / 255.0, g / n / 255.0, b / n / 255.0)) for n, r, g, b in bins.values()]
+
+
+def luminance(rgb):
+    return 0.2126 * rgb[0] + 0.7152 * rgb[1] + 0.0722 * rgb[2]
+
+
+def lighten(rgb, target):
+    # Смешивание с белым до нужной яркости: оттенок сохраняется
+    lum = luminance(rgb)
+    if lum >= target:
+        return rgb
+    t = (target - lum) / (1.0 - lum)
+    return tuple(c + (1.0 - c) * t for c in rgb)
+
+
+def distance(a, b):
+    return sum((x - y) ** 2 for x, y in zip(a, b)) ** 0.5
+
+
+def extract_palette(surface, count=5):
+    """Палитра обложки: {"colors": до count цветов по убыванию площади, "accent", "secondary"}.
+
+    accent — самый частый насыщенный цвет, осветлённый до ACCENT_MIN_LUMINANCE;
+    secondary — следующий различимый цвет или затемнённый accent.
+    """
+    binned = bin_colors_numpy(surface) if np is not None else bin_colors_python(surface)
+    if not binned:
+        return None
+    # При равной площади порядок не зависит от пути (NumPy или цикл)
+    binned.sort(key=lambda item: (-item[0], item[1]))
+
+    colors = []
+    for _, rgb in binned:
+        if all(distance(rgb, c) >= PALETTE_MIN_DISTANCE for c in colors):
+            colors.append(rgb)
+            if len(colors) == count:
+                break
+
+    saturated = [c for c in colors if max(c) - min(c) >= 0.25]
+    accent = lighten((saturated or colors)[0], ACCENT_MIN_LUMINANCE)
+    secondary = next(
+        (
+            lighten(c, ACCENT_MIN_LUMINANCE * SECONDARY_SHADE)
+            for c in saturated or colors
+            if distance(c, accent) >= PALETTE_MIN_DISTANCE * 2
+        ),
+        tuple(c * SECONDARY_SHADE for c in accent),
+    )
+    return {
+        "colors": [[round(v, 4) for v in c] for c in colors],
+        "accent": [round(v, 4) for v in accent],
+        "secondary": [round(v, 4) for v in secondary],
+    }
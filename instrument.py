@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""Замеры этапов и счётчики событий виджетов (включаются TERRA_INSTRUMENT=1).
+
+Этап оборачивается в `with instrument.stage("rings.sample"):`, событие —
+`instrument.count("spotify.cover_hit")`, значение тика (например, площадь
+перерисовки) — `instrument.gauge("rings.repaint_px", 1200)`. В конце тика flush(виджет) пишет:
+
+- <каталог>/terra_<виджет>.prom — формат textfile для node_exporter
+  (длительности последнего тика и накопительные суммы, вызовы, события);
+- <каталог>/terra_timing.jsonl — строка JSON на тик (длительности в мс).
+
+Каталог — TERRA_METRICS_DIR или каталог выполнения terra_runtime. Выключенный
+слой стоит один вызов функции: stage() отдаёт общий пустой контекст.
+"""
+import contextlib
+import json
+import os
+import time
+
+import terra_runtime
+
+ENABLED = os.environ.get("TERRA_INSTRUMENT", "0") == "1"
+METRICS_DIR = os.environ.get("TERRA_METRICS_DIR")
+JSONL_FILE = "terra_timing.jsonl"
+# Журнал не растёт бесконечно: при превышении старый файл уходит в .1
+JSONL_MAX_BYTES = 4 * 1024 * 1024
+
+_NULL = contextlib.nullcontext()
+
+# Текущий тик: этап -> секунды; событие -> количество
+_tick = {}
+_events = {}
+_values = {}
+# Накопительные значения процесса: этап -> [вызовы, секунды]; событие -> количество
+_totals = {}
+_event_totals = {}
+
+
+class _Stage:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        _tick[self.name] = _tick.get(self.name, 0.0) + elapsed
+        total = _totals.setdefault(self.name, [0, 0.0])
+        total[0] += 1
+        total[1] += elapsed
+        return False
+
+
+def stage(name):
+    return _Stage(name) if ENABLED else _NULL
+
+
+def count(event, n=1):
+    if ENABLED:
+        _events[event] = _events.get(event, 0) + n
+        _event_totals[event] = _event_totals.get(event, 0) + n
+
+
+def gauge(name, value):
+    if ENABLED:
+        _values[name] = value
+
+
+def metrics_path(filename):
+    if METRICS_DIR:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        return os.path.join(METRICS_DIR, filename)
+    return terra_runtime.runtime_path(filename)
+
+
+def load_totals(widget):
+    # Одиночные запуски продолжают суммы предыдущих процессов
+    try:
+        with open(metrics_path(f"terra_{widget}.json"), "r") as f:
+            saved = json.load(f)
+        return saved.get("stages", {}), saved.get("events", {})
+    except (OSError, ValueError):
+        return {}, {}
+
+
+def prometheus_text(widget, stages, events):
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def label(key, value):
+        return f'{{widget="{widget}",{key}="{value}"}}'
+
+    family("terra_stage_seconds", "gauge", "Stage duration in the last tick.")
+    for name, seconds in sorted(_tick.items()):
+        lines.append(f"terra_stage_seconds{label('stage', name)} {seconds:.6f}")
+    family("terra_stage_seconds_total", "counter", "Total time spent in the stage.")
+    for name, (_, seconds) in sorted(stages.items()):
+        lines.append(f"terra_stage_seconds_total{label('stage', name)} {seconds:.6f}")
+    family("terra_stage_calls_total", "counter", "Number of times the stage ran.")
+    for name, (calls, _) in sorted(stages.items()):
+        lines.append(f"terra_stage_calls_total{label('stage', name)} {calls}")
+    family("terra_events_total", "counter", "Cache hits, retries, spawns and other events.")
+    for name, n in sorted(events.items()):
+        lines.append(f"terra_events_total{label('event', name)} {n}")
+    family("terra_value", "gauge", "Value reported in the last tick (e.g. repaint area).")
+    for name, value in sorted(_values.items()):
+        lines.append(f"terra_value{label('name', name)} {value}")
+    lines.append(f'terra_last_tick_timestamp_seconds{{widget="{widget}"}} {time.time():.3f}')
+    return "\n".join(lines) + "\n"
+
+
+def append_jsonl(widget):
+    path = metrics_path(JSONL_FILE)
+    try:
+        if os.path.getsize(path) > JSONL_MAX_BYTES:
+            os.replace(path, f"{path}.1")
+    except OSError:
+        pass
+    record = {
+        "ts": round(time.time(), 3),
+        "widget": widget,
+        "stages_ms": {name: round(s * 1000, 3) for name, s in _tick.items()},
+        "events": _events,
+    }
+    if _values:
+        record["values"] = _values
+    # Короткая запись с O_APPEND не перемешивается с записями других виджетов
+    with open(path, "a") as f:
+        f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+
+def flush(widget, persist=True):
+    """Записывает тик виджета и сбрасывает его замеры; persist — одиночный запуск."""
+    global _tick, _events, _values, _totals, _event_totals
+    if not ENABLED or not (_tick or _events or _values):
+        return
+    try:
+        if persist:
+            stages, events = load_totals(widget)
+            for name, (calls, seconds) in _totals.items():
+                prev = stages.get(name, [0, 0.0])
+                stages[name] = [prev[0] + calls, prev[1] + seconds]
+            for name, n in _event_totals.items():
+                events[name] = events.get(name, 0) + n
+            terra_runtime.atomic_write(
+                metrics_path(f"terra_{widget}.json"),
+                json.dumps({"stages": stages, "events": events}),
+            )
+            _totals, _event_totals = {}, {}
+        else:
+            stages, events = _totals, _event_totals
+        terra_runtime.atomic_write(
+            metrics_path(f"terra_{widget}.prom"), prometheus_text(widget, stages, events)
+        )
+        append_jsonl(widget)
+    except OSError:
+        pass
+    _tick, _events, _values = {}, {}, {}
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""История метрик в кольцевом буфере фиксированного размера поверх mmap.
+
+Файл — заголовок, столбец меток времени (float64) и по столбцу float32 на
+метрику, каждый длиной capacity. Запись тика — O(1): одна ячейка в каждом
+столбце и счётчик в заголовке, без перезаписи JSON. Чтение отдаёт срезы
+memoryview прямо над mmap (не больше двух из-за заворота кольца), так что
+окно за сутки при 1 с разрешении ничего не копирует; с NumPy статистика
+считается векторно над теми же срезами.
+
+Сводка: python3 metric_history.py <файл> [секунды]
+"""
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAGIC = b"TRH1"
+# magic, capacity, число метрик, всего записей (голова = total % capacity)
+HEADER = struct.Struct("<4sIIQ")
+NAME_SIZE = 16
+
+
+class MetricHistory:
+    def __init__(self, path, metrics, capacity=86400):
+        self.path = path
+        self.metrics = list(metrics)
+        self.capacity = capacity
+        self._index = {name: i for i, name in enumerate(self.metrics)}
+        self._names_size = NAME_SIZE * len(self.metrics)
+        self._open()
+
+    def _layout_size(self):
+        return HEADER.size + self._names_size + self.capacity * (8 + 4 * len(self.metrics))
+
+    def _expected_names(self):
+        return b"".join(
+            name.encode()[:NAME_SIZE].ljust(NAME_SIZE, b"\0") for name in self.metrics
+        )
+
+    def _open(self):
+        size = self._layout_size()
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            # Другой набор метрик или ёмкость — начинаем историю заново
+            if os.fstat(fd).st_size != size or not self._header_matches(fd):
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                header = HEADER.pack(MAGIC, self.capacity, len(self.metrics), 0)
+                os.pwrite(fd, header + self._expected_names(), 0)
+            self._mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+        self._view = view = memoryview(self._mm)
+        offset = HEADER.size + self._names_size
+        self._times = view[offset : offset + 8 * self.capacity].cast("d")
+        offset += 8 * self.capacity
+        self._columns = []
+        for _ in self.metrics:
+            self._columns.append(view[offset : offset + 4 * self.capacity].cast("f"))
+            offset += 4 * self.capacity
+
+    def _header_matches(self, fd):
+        data = os.pread(fd, HEADER.size + self._names_size, 0)
+        if len(data) < HEADER.size + self._names_size:
+            return False
+        magic, capacity, count, _ = HEADER.unpack_from(data)
+        return (
+            magic == MAGIC
+            and capacity == self.capacity
+            and count == len(self.metrics)
+            and data[HEADER.size :] == self._expected_names()
+        )
+
+    @property
+    def total(self):
+        return HEADER.unpack_from(self._mm)[3]
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def append(self, values, timestamp=None):
+        """Записывает тик: values — словарь метрика -> значение (нет ключа — 0)."""
+        total = self.total
+        slot = total % self.capacity
+        self._times[slot] = time.time() if timestamp is None else timestamp
+        for name, column in zip(self.metrics, self._columns):
+            column[slot] = float(values.get(name, 0.0))
+        # Счётчик пишется последним: читатель не увидит недописанную ячейку
+        struct.pack_into("<Q", self._mm, HEADER.size - 8, total + 1)
+
+    def _segments(self, column, count):
+        # Последние count значений по порядку времени: 1 или 2 среза без копий
+        total = self.total
+        count = min(count, total, self.capacity)
+        if count <= 0:
+            return []
+        end = total % self.capacity or self.capacity
+        start = end - count
+        if start >= 0:
+            return [column[start:end]]
+        return [column[self.capacity + start :], column[:end]]
+
+    def count_since(self, since):
+        """Сколько последних записей сделано не раньше момента since."""
+        n = len(self)
+        first = self.total - n
+        # Метки времени растут в логическом порядке: бинарный поиск без копий
+        lo = bisect.bisect_left(
+            range(n), since, key=lambda i: self._times[(first + i) % self.capacity]
+        )
+        return n - lo
+
+    def window(self, metric, seconds=None, count=None):
+        """Срезы memoryview (float32) за последние seconds секунд или count записей."""
+        if count is None:
+            count = len(self) if seconds is None else self.count_since(time.time() - seconds)
+        return self._segments(self._columns[self._index[metric]], count)
+
+    def values(self, metric, seconds=None, count=None):
+        segments = self.window(metric, seconds, count)
+        if np is not None:
+            arrays = [np.frombuffer(s, dtype=np.float32) for s in segments]
+            if len(arrays) == 1:
+                return arrays[0]
+            return np.concatenate(arrays) if arrays else np.empty(0, dtype=np.float32)
+        return [v for s in segments for v in s]
+
+    def min(self, metric, seconds=None, count=None):
+        values = self.values(metric, seconds, count)
+        if not len(values):
+            return None
+        return float(values.min() if np is not None else min(values))
+
+    def max(self, metric, seconds=None, count=None):
+        values = self.values(metric, seconds, count)
+        if not len(values):
+            return None
+        return float(values.max() if np is not None else max(values))
+
+    def mean(self, metric, seconds=None, count=None):
+        values = self.values(metric, seconds, count)
+        if not len(values):
+            return None
+        # Сумма в float64, как у sum() над значениями без NumPy
+        if np is not None:
+            return float(values.mean(dtype=np.float64))
+        return float(sum(values) / len(values))
+
+    def percentile(self, metric, q, seconds=None, count=None):
+        """Перцентиль q (0..100) с линейной интерполяцией, как numpy.percentile."""
+        values = self.values(metric, seconds, count)
+        if not len(values):
+            return None
+        if np is not None:
+            return float(np.percentile(values, q))
+        ordered = sorted(values)
+        pos = (len(ordered) - 1) * q / 100.0
+        lo = int(pos)
+        hi = min(lo + 1, len(ordered) - 1)
+        return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+    def downsample(self, metric, points, seconds=None, count=None):
+        """Скользящие средние: окно делится на points равных корзин (для спарклайнов)."""
+        values = self.values(metric, seconds, count)
+        n = len(values)
+        if n == 0:
+            return []
+        points = min(points, n)
+        if np is not None:
+            edges = np.linspace(0, n, points + 1).astype(int)
+            sums = np.add.reduceat(values.astype(np.float64), edges[:-1])
+            return (sums / np.diff(edges)).tolist()
+        result = []
+        for i in range(points):
+            chunk = values[i * n // points : (i + 1) * n // points]
+            result.append(sum(chunk) / len(chunk))
+        return result
+
+    def close(self):
+        self._times.release()
+        for column in self._columns:
+            column.release()
+        self._view.release()
+        self._mm.close()
+
+
+def open_existing(path):
+    # Читаем метрики и ёмкость из заголовка, чтобы открыть чужой файл как есть
+    with open(path, "rb") as f:
+        magic, capacity, count, _ = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path}: не файл истории")
+        names = f.read(NAME_SIZE * count)
+    metrics = [
+        names[i : i + NAME_SIZE].rstrip(b"\0").decode() for i in range(0, len(names), NAME_SIZE)
+    ]
+    return MetricHistory(path, metrics, capacity)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("usage: metric_history.py <file> [seconds]")
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else None
+    history = open_existing(sys.argv[1])
+    summary = {
+        metric: {
+            "min": history.min(metric, seconds),
+            "max": history.max(metric, seconds),
+            "mean": history.mean(metric, seconds),
+            "p50": history.percentile(metric, 50, seconds),
+            "p95": history.percentile(metric, 95, seconds),
+        }
+        for metric in history.metrics
+    }
+    print(json.dumps({"samples": len(history), "metrics": summary}, indent=2))
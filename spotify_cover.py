@@ -1,14 +1,32 @@
 #!/usr/bin/env python3
-import glob
+import argparse
 import hashlib
+import http.client
+import json
+import math
 import os
+import queue
 import subprocess
-import urllib.request
+import sys
+import threading
+import time
+import urllib.parse
 import cairo
 
+import cache_manager
+import cover_image
+import instrument
+import terra_runtime
+import text_metrics
+
 # --- НАСТРОЙКИ ---
 CACHE_DIR = os.path.expanduser("./spotify_covers")
-MAX_FILES = 6
+# Общий бюджет на оригиналы, уменьшенные обложки и готовые картинки;
+# старые записи вытесняются по манифесту (LRU), без обхода каталога
+CACHE_BUDGET_BYTES = 20 * 1024 * 1024
+COVER_CACHE = cache_manager.CacheManager(
+    CACHE_DIR, CACHE_BUDGET_BYTES, prefixes=("raw_", "scaled_", "comp_", "palette_")
+)
 
 # Размер итогового изображения
 CANVAS_WIDTH = 600
@@ -26,142 +44,703 @@ TEXT_Y_ARTIST = 65
 # Цвета (RGB 0-1)
 COLOR_TITLE = (224 / 255, 152 / 255, 122 / 255)  # #E0987A
 COLOR_ARTIST = (168 / 255, 83 / 255, 47 / 255)  # #A8532F
-
-MAX_LEN_TITLE = 25
-MAX_LEN_ARTIST = 35
-
-
-def truncate_text(text, max_length):
-    if len(text) > max_length:
-        return text[:max_length].strip() + "..."
-    return text
+# Цвета названия и исполнителя из обложки: палитра считается один раз на
+# альбом (palette_<md5>.json рядом с raw_<md5>.jpg) и публикуется через
+# terra_runtime для колец и погоды (их ACCENT_FROM_COVER)
+COVER_COLORS = False
+PALETTE_SIZE = 5
+
+# Позиция картинки в окне conky (-p у ${image ...}), под погодой с учётом
+# terra_runtime.WEATHER_ROWS
+LINE_X, LINE_Y = 170, terra_runtime.below_weather(540)
+
+FONT = "Clash Display"
+TITLE_SIZE = 18
+ARTIST_SIZE = 14
+# Текст обрезается по реальной ширине строки в этом шрифте, а не по числу символов
+TEXT_MAX_WIDTH = CANVAS_WIDTH - TEXT_X - 20
+ELLIPSIS = "..."
+
+# Бегущая строка для названий шире TEXT_MAX_WIDTH: при смене трека название
+# один раз рисуется в полосу в памяти, каждый тик из неё вырезается и
+# публикуется один кадр (без раскладки текста). Conky показывает кадры не
+# чаще своего update_interval и периода ${execpi}: для прокрутки их нужно
+# опустить до MARQUEE_INTERVAL (см. terra-ui.conf)
+MARQUEE = False
+MARQUEE_STEP = 6  # px за кадр
+MARQUEE_GAP = 60  # px между концом названия и его повтором
+MARQUEE_INTERVAL = 0.5  # сек на кадр
+MARQUEE_TOP = TEXT_Y_TITLE - 20
+MARQUEE_HEIGHT = 26
+
+# playerctl (переменная окружения позволяет подставить скрипт-заглушку)
+PLAYERCTL = os.environ.get("TERRA_PLAYERCTL", "playerctl")
+METADATA_FORMAT = "{{status}}||{{mpris:artUrl}}||{{title}}||{{artist}}"
+
+# Режим слушателя: один долгоживущий playerctl --follow вместо запуска
+# playerctl каждые 2 секунды; conky читает строку через terra_client.sh
+OUTPUT_NAME = terra_runtime.instance_name("spotify_cover")
+LISTENER_RESTART_DELAY = 5
+# Пока работает terra_sampler.py, трек берётся из его снимка с этим периодом,
+# а свой playerctl --follow не запускается (один на все экземпляры)
+SAMPLER_POLL_INTERVAL = 1.0
+
+# Загрузка обложек: ограниченный таймаут, проверка картинки до публикации
+# в кэш и keep-alive соединения к хосту картинок между загрузками
+COVER_TIMEOUT_SEC = 5
+# Общий срок на загрузку: сервер, отдающий по байту, не растянет её на минуты
+COVER_DEADLINE_SEC = 15
+COVER_MAX_BYTES = 5 * 1024 * 1024
+COVER_READ_CHUNK = 64 * 1024
+# Обложка, которая не скачалась (404, таймаут), не запрашивается снова
+# COVER_RETRY_SEC; после каждой новой неудачи пауза удваивается до COVER_RETRY_MAX_SEC
+COVER_RETRY_SEC = 300
+COVER_RETRY_MAX_SEC = 3600
+
+_connections = {}
+_download_queue = None
+_render_lock = threading.Lock()
+_measure_ctx = None
+_marquee = None
+_last_render = {"data": None, "path": None}
+_palettes = {}
+
+
+def measure_ctx():
+    global _measure_ctx
+    if _measure_ctx is None:
+        _measure_ctx = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1))
+    return _measure_ctx
+
+
+def text_width(text, size, store=True):
+    return text_metrics.text_extents(
+        measure_ctx(), FONT, "Normal", size, text, store
+    ).x_advance
+
+
+def fit_text(text, size, max_width=TEXT_MAX_WIDTH):
+    """Самый длинный префикс text (с многоточием), который помещается в max_width."""
+    if text_width(text, size) <= max_width:
+        return text
+    # Ширина префикса растёт с длиной: двоичный поиск; в кэш размеров
+    # попадает только итоговая строка, а не каждый пробный префикс
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if text_width(text[:mid].rstrip() + ELLIPSIS, size, store=False) <= max_width:
+            lo = mid
+        else:
+            hi = mid - 1
+    fitted = text[:lo].rstrip() + ELLIPSIS
+    text_width(fitted, size)
+    return fitted
+
+
+def marquee_active(title):
+    return MARQUEE and text_width(title, TITLE_SIZE) > TEXT_MAX_WIDTH
 
 
 def get_metadata():
+    instrument.count("spotify.playerctl_spawn")
     try:
-        fmt = "{{status}}||{{mpris:artUrl}}||{{title}}||{{artist}}"
-        output = subprocess.check_output(
-            ["playerctl", "-p", "spotify", "metadata", "--format", fmt], text=True
-        ).strip()
+        with instrument.stage("spotify.metadata"):
+            output = subprocess.check_output(
+                [PLAYERCTL, "-p", "spotify", "metadata", "--format", METADATA_FORMAT],
+                text=True,
+            ).strip()
         return output.split("||")
     except:
         return None
 
 
+def cover_url(url):
+    return url.replace("https://open.spotify.com", "http://i.scdn.co")
+
+
+def cover_path(url):
+    file_hash = hashlib.md5(cover_url(url).encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, f"raw_{file_hash}.jpg")
+
+
+def cached_cover(url):
+    if not url:
+        return None
+    return COVER_CACHE.lookup(os.path.basename(cover_path(url)))
+
+
+def is_valid_image(data):
+    # Обрезанный JPEG без маркера конца в кэш не попадает
+    if data.startswith(b"\xff\xd8\xff"):
+        return data.rstrip(b"\x00").endswith(b"\xff\xd9")
+    return data.startswith(b"\x89PNG\r\n\x1a\n")
+
+
+def time_left(deadline):
+    # Таймаут очередной операции сокета, но не дальше общего срока
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError("cover download deadline exceeded")
+    return min(COVER_TIMEOUT_SEC, left)
+
+
+def read_body(response, sock, deadline):
+    chunks, size = [], 0
+    while size <= COVER_MAX_BYTES:
+        if sock is not None:
+            sock.settimeout(time_left(deadline))
+        # read1 — не больше одного recv, чтобы срок проверялся между ними
+        chunk = response.read1(COVER_READ_CHUNK)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+    return b"".join(chunks)
+
+
+def fetch_bytes(url):
+    parts = urllib.parse.urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    deadline = time.monotonic() + COVER_DEADLINE_SEC
+
+    # Вторая попытка — на случай, если сервер закрыл keep-alive соединение
+    for _ in range(2):
+        conn = _connections.get(key)
+        if conn is None:
+            conn_cls = (
+                http.client.HTTPSConnection
+                if parts.scheme == "https"
+                else http.client.HTTPConnection
+            )
+            conn = conn_cls(parts.netloc, timeout=COVER_TIMEOUT_SEC)
+            _connections[key] = conn
+        try:
+            # timeout соединения действует на connect, дальше — на сокет
+            conn.timeout = time_left(deadline)
+            if conn.sock is not None:
+                conn.sock.settimeout(conn.timeout)
+            conn.request("GET", path, headers={"Connection": "keep-alive"})
+            # Ответ с Connection: close отвязывает сокет от conn, поэтому берём его заранее
+            sock = conn.sock
+            response = conn.getresponse()
+            data = read_body(response, sock, deadline)
+            if response.status != 200 or len(data) > COVER_MAX_BYTES:
+                conn.close()
+                _connections.pop(key, None)
+                return None
+            return data
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            _connections.pop(key, None)
+    return None
+
+
+def failure_path(url):
+    # Отметка неудачной загрузки живёт в каталоге выполнения (до перезагрузки)
+    return terra_runtime.runtime_path(f"cover_failed_{cover_hash(cover_path(url))}.json")
+
+
+def read_cover_failure(url):
+    try:
+        with open(failure_path(url), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def record_cover_failure(url):
+    failure = read_cover_failure(url) or {}
+    try:
+        terra_runtime.atomic_write(
+            failure_path(url),
+            json.dumps({"failed_at": time.time(), "failures": failure.get("failures", 0) + 1}),
+        )
+    except OSError:
+        pass
+
+
+def cover_backed_off(url):
+    failure = read_cover_failure(url)
+    if not failure:
+        return False
+    delay = min(COVER_RETRY_MAX_SEC, COVER_RETRY_SEC * 2 ** (failure.get("failures", 1) - 1))
+    return time.time() - failure.get("failed_at", 0) < delay
+
+
 def download_cover(url):
     if not url:
         return None
-    url = url.replace("https://open.spotify.com", "http://i.scdn.co")
-    file_hash = hashlib.md5(url.encode("utf-8")).hexdigest()
-    final_path = os.path.join(CACHE_DIR, f"raw_{file_hash}.jpg")
+    final_path = cover_path(url)
 
     if not os.path.exists(CACHE_DIR):
         os.makedirs(CACHE_DIR)
 
-    if not os.path.exists(final_path):
-        try:
-            urllib.request.urlretrieve(url, final_path)
-        except:
+    if os.path.exists(final_path):
+        # Файл есть, но манифест о нём не знает (сюда приходят после промаха)
+        instrument.count("spotify.download_hit")
+        COVER_CACHE.add(os.path.basename(final_path))
+    else:
+        instrument.count("spotify.download_miss")
+        with instrument.stage("spotify.download"):
+            data = fetch_bytes(cover_url(url))
+        if not data or not is_valid_image(data):
+            instrument.count("spotify.download_failed")
+            record_cover_failure(url)
             return None
+        # Временный файл + переименование: недокачанный файл не станет «кэшем»
+        terra_runtime.atomic_write(final_path, data)
+        COVER_CACHE.add(os.path.basename(final_path))
+        try:
+            os.remove(failure_path(url))
+        except FileNotFoundError:
+            pass
     return final_path
 
 
+def download_worker():
+    # Один поток на все загрузки: keep-alive соединения не делятся между потоками
+    while True:
+        url, on_done = _download_queue.get()
+        path = None
+        try:
+            path = download_cover(url)
+        except Exception:
+            pass
+        if path and on_done:
+            on_done(path)
+
+
+def download_cover_async(url, on_done):
+    global _download_queue
+    if _download_queue is None:
+        _download_queue = queue.Queue()
+        threading.Thread(target=download_worker, daemon=True).start()
+    _download_queue.put((url, on_done))
+
+
+def spawn_cover_fetch(url):
+    # Одиночный запуск не ждёт CDN: обложку докачает отдельный процесс
+    instrument.count("spotify.fetch_spawn")
+    try:
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--fetch", url],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    except OSError:
+        pass
+
+
+def fetch_cover_once(url):
+    # Кэш обложек общий для всех экземпляров, поэтому и блокировка общая
+    lock = terra_runtime.acquire_lock("spotify_cover_fetch")
+    if lock is None:
+        return None
+    return download_cover(url)
+
+
+def cover_hash(raw_cover_path):
+    return os.path.basename(raw_cover_path)[4:].rsplit(".", 1)[0]
+
+
+def scaled_cover_path(raw_cover_path):
+    # raw_<md5>.jpg -> scaled_<md5>_<size>.png рядом с оригиналом
+    file_hash = cover_hash(raw_cover_path)
+    return os.path.join(CACHE_DIR, f"scaled_{file_hash}_{COVER_SIZE}.png")
+
+
+def load_cover_surface(raw_cover_path):
+    scaled_path = scaled_cover_path(raw_cover_path)
+    if COVER_CACHE.lookup(os.path.basename(scaled_path)):
+        instrument.count("spotify.scaled_hit")
+        return cairo.ImageSurface.create_from_png(scaled_path)
+
+    instrument.count("spotify.scaled_miss")
+    with instrument.stage("spotify.decode"):
+        img_surf = cover_image.load_scaled_surface(raw_cover_path, COVER_SIZE)
+    if img_surf is not None:
+        try:
+            terra_runtime.atomic_write_with(scaled_path, img_surf.write_to_png)
+            COVER_CACHE.add(os.path.basename(scaled_path))
+        except OSError:
+            pass
+    return img_surf
+
+
+def palette_path(raw_cover_path):
+    return os.path.join(CACHE_DIR, f"palette_{cover_hash(raw_cover_path)}.json")
+
+
+def cover_palette(raw_cover_path):
+    """Палитра обложки (см. cover_image.extract_palette) или None; повторное прослушивание — из кэша."""
+    palette = _palettes.get(raw_cover_path)
+    if palette is not None:
+        return palette
+
+    path = palette_path(raw_cover_path)
+    if COVER_CACHE.lookup(os.path.basename(path)):
+        instrument.count("spotify.palette_hit")
+        try:
+            with open(path, "r") as f:
+                palette = json.load(f)
+        except (OSError, ValueError):
+            palette = None
+    if palette is None:
+        instrument.count("spotify.palette_miss")
+        # Палитра считается по уменьшенной обложке: она уже в кэше для картинки
+        img_surf = load_cover_surface(raw_cover_path)
+        if img_surf is None:
+            return None
+        with instrument.stage("spotify.palette"):
+            palette = cover_image.extract_palette(img_surf, PALETTE_SIZE)
+        if palette is None:
+            return None
+        try:
+            terra_runtime.atomic_write(path, json.dumps(palette))
+            COVER_CACHE.add(os.path.basename(path))
+        except OSError:
+            pass
+    _palettes[raw_cover_path] = palette
+    return palette
+
+
+def track_colors(raw_cover_path):
+    """(цвет названия, цвет исполнителя): из палитры обложки или COLOR_TITLE и COLOR_ARTIST."""
+    if COVER_COLORS and raw_cover_path:
+        try:
+            palette = cover_palette(raw_cover_path)
+        except Exception:
+            palette = None
+        if palette:
+            return tuple(palette["accent"]), tuple(palette["secondary"])
+    return COLOR_TITLE, COLOR_ARTIST
+
+
+def title_color(url):
+    # Цвет бегущей строки каждый кадр: без манифеста кэша, палитра уже посчитана картинкой
+    if not (COVER_COLORS and url):
+        return COLOR_TITLE
+    raw_cover_path = cover_path(url)
+    palette = _palettes.get(raw_cover_path)
+    if palette is None:
+        try:
+            with open(palette_path(raw_cover_path), "r") as f:
+                palette = _palettes[raw_cover_path] = json.load(f)
+        except (OSError, ValueError):
+            return COLOR_TITLE
+    return tuple(palette["accent"])
+
+
 def create_composite_image(raw_cover_path, title, artist):
-    unique_str = f"{title}_{artist}_{raw_cover_path}"
+    """title=None — без названия: его показывает бегущая строка поверх картинки."""
+    unique_str = f"{title}_{artist}_{raw_cover_path}_{TEXT_MAX_WIDTH}_{COVER_COLORS}"
     composite_hash = hashlib.md5(unique_str.encode("utf-8")).hexdigest()
     composite_path = os.path.join(CACHE_DIR, f"comp_{composite_hash}.png")
 
-    if os.path.exists(composite_path):
+    if COVER_CACHE.lookup(os.path.basename(composite_path)):
+        instrument.count("spotify.composite_hit")
         return composite_path
+    instrument.count("spotify.composite_miss")
+
+    with instrument.stage("spotify.render"):
+        return draw_composite(composite_path, raw_cover_path, title, artist)
 
+
+def draw_composite(composite_path, raw_cover_path, title, artist):
     surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, CANVAS_WIDTH, CANVAS_HEIGHT)
     ctx = cairo.Context(surface)
 
     if raw_cover_path and os.path.exists(raw_cover_path):
         try:
-            temp_png = os.path.join(CACHE_DIR, "temp_cover.png")
-            subprocess.run(
-                [
-                    "convert",
-                    raw_cover_path,
-                    "-resize",
-                    f"{COVER_SIZE}x{COVER_SIZE}!",
-                    temp_png,
-                ],
-                check=True,
-            )
-
-            img_surf = cairo.ImageSurface.create_from_png(temp_png)
-
-            ctx.save()
-            x, y, w, h = COVER_X, COVER_Y, COVER_SIZE, COVER_SIZE
-            r = 15
-
-            ctx.new_path()
-            ctx.arc(x + w - r, y + r, r, -1.57, 0)
-            ctx.arc(x + w - r, y + h - r, r, 0, 1.57)
-            ctx.arc(x + r, y + h - r, r, 1.57, 3.14)
-            ctx.arc(x + r, y + r, r, 3.14, -1.57)
-            ctx.close_path()
-
-            ctx.clip()
-            ctx.set_source_surface(img_surf, x, y)
-            ctx.paint()
-            ctx.restore()
-
-            if os.path.exists(temp_png):
-                os.remove(temp_png)
+            img_surf = load_cover_surface(raw_cover_path)
+            if img_surf is not None:
+                ctx.save()
+                x, y, w, h = COVER_X, COVER_Y, COVER_SIZE, COVER_SIZE
+                r = 15
+
+                ctx.new_path()
+                ctx.arc(x + w - r, y + r, r, -1.57, 0)
+                ctx.arc(x + w - r, y + h - r, r, 0, 1.57)
+                ctx.arc(x + r, y + h - r, r, 1.57, 3.14)
+                ctx.arc(x + r, y + r, r, 3.14, -1.57)
+                ctx.close_path()
+
+                ctx.clip()
+                ctx.set_source_surface(img_surf, x, y)
+                ctx.paint()
+                ctx.restore()
         except Exception:
             pass
 
     # 2. Рисуем Текст
-    ctx.select_font_face(
-        "Clash Display", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL
-    )
-    ctx.set_font_size(18)
-    ctx.set_source_rgb(*COLOR_TITLE)
-    ctx.move_to(TEXT_X, TEXT_Y_TITLE)
-    ctx.show_text(title)
+    color_title, color_artist = track_colors(raw_cover_path)
+    if title is not None:
+        text_metrics.set_font(ctx, FONT, "Normal", TITLE_SIZE)
+        ctx.set_source_rgb(*color_title)
+        ctx.move_to(TEXT_X, TEXT_Y_TITLE)
+        ctx.show_text(fit_text(title, TITLE_SIZE))
+
+    text_metrics.set_font(ctx, FONT, "Normal", ARTIST_SIZE)
+    ctx.set_source_rgb(*color_artist)
+    ctx.move_to(TEXT_X, TEXT_Y_ARTIST)
+    ctx.show_text(fit_text(artist, ARTIST_SIZE))
+    text_metrics.save()
 
-    ctx.select_font_face(
-        "Clash Display", cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL
+    with instrument.stage("spotify.encode"):
+        terra_runtime.atomic_write_with(composite_path, surface.write_to_png)
+    COVER_CACHE.add(os.path.basename(composite_path))
+
+    return composite_path
+
+
+def follow_metadata():
+    # playerctl сам печатает новую строку при смене трека или статуса
+    proc = subprocess.Popen(
+        [
+            PLAYERCTL,
+            "-p",
+            "spotify",
+            "metadata",
+            "--follow",
+            "--format",
+            METADATA_FORMAT,
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
     )
-    ctx.set_font_size(14)
-    ctx.set_source_rgb(*COLOR_ARTIST)
-    ctx.move_to(TEXT_X, TEXT_Y_ARTIST)
-    ctx.show_text(artist)
+    try:
+        for line in proc.stdout:
+            yield line.strip().split("||")
+    finally:
+        proc.kill()
+        proc.wait()
 
-    surface.write_to_png(composite_path)
 
-    files = glob.glob(os.path.join(CACHE_DIR, "comp_*.png"))
-    files.sort(key=os.path.getmtime)
-    while len(files) > MAX_FILES:
-        try:
-            os.remove(files[0])
-        except:
-            pass
-        files.pop(0)
+def sampler_metadata():
+    # Метаданные из снимка сэмплера; генератор кончается, когда сэмплер пропал
+    while True:
+        snapshot = terra_runtime.read_sampler()
+        if snapshot is None:
+            return
+        yield snapshot.get("spotify")
+        time.sleep(SAMPLER_POLL_INTERVAL)
 
-    return composite_path
 
+def render_composite(data, on_cover=None):
+    """Путь к картинке для метаданных; без обложки в кэше сначала рисуется только текст.
 
-def main():
-    data = get_metadata()
+    on_cover(path) — колбэк демона, вызывается из потока загрузки. Без него
+    обложку докачивает отдельный процесс к следующему тику.
+    """
     if not data or len(data) < 4:
-        return
+        retract_palette()
+        return None
 
     status, url, title, artist = data[:4]
 
     if status.lower() not in ["playing", "paused"]:
+        retract_palette()
+        return None
+
+    raw_cover = cached_cover(url)
+    if raw_cover is None and url and cover_backed_off(url):
+        instrument.count("spotify.fetch_backoff")
+    elif raw_cover is None and url:
+        if on_cover:
+            download_cover_async(url, on_cover)
+        else:
+            spawn_cover_fetch(url)
+    if COVER_COLORS and raw_cover:
+        publish_palette(raw_cover)
+    if marquee_active(title):
+        title = None
+
+    return create_composite_image(raw_cover, title, artist.lower())
+
+
+def publish_palette(raw_cover_path):
+    # Кольца и погода читают палитру из каталога выполнения; пишем только при смене альбома
+    palette = cover_palette(raw_cover_path)
+    if palette is None or palette == terra_runtime.read_palette():
+        return
+    try:
+        terra_runtime.publish_palette(palette)
+    except OSError:
+        pass
+
+
+def retract_palette():
+    # Без этого кольца и погода держали бы акцент последнего альбома
+    if COVER_COLORS:
+        try:
+            terra_runtime.retract_palette()
+        except OSError:
+            pass
+
+
+def render_marquee(title, color):
+    # Полоса: название и его повтор через MARQUEE_GAP, чтобы прокрутка шла по кругу
+    text_metrics.set_font(measure_ctx(), FONT, "Normal", TITLE_SIZE)
+    cycle = math.ceil(text_width(title, TITLE_SIZE) + MARQUEE_GAP)
+    strip = cairo.ImageSurface(cairo.FORMAT_ARGB32, cycle + TEXT_MAX_WIDTH, MARQUEE_HEIGHT)
+    ctx = cairo.Context(strip)
+    text_metrics.set_font(ctx, FONT, "Normal", TITLE_SIZE)
+    ctx.set_source_rgb(*color)
+    for x in (0, cycle):
+        ctx.move_to(x, TEXT_Y_TITLE - MARQUEE_TOP)
+        ctx.show_text(title)
+    return strip, math.ceil(cycle / MARQUEE_STEP)
+
+
+def marquee_strip(title, color=COLOR_TITLE):
+    """(полоса, число кадров) для title: рисуется один раз на трек и живёт в памяти."""
+    global _marquee
+    key = (title, color, TITLE_SIZE, TEXT_MAX_WIDTH, MARQUEE_STEP, MARQUEE_GAP)
+    if _marquee is None or _marquee[0] != key:
+        with instrument.stage("spotify.marquee"):
+            _marquee = (key, *render_marquee(title, color))
+    return _marquee[1], _marquee[2]
+
+
+def marquee_frame(title, url=None):
+    """(номер, поверхность) текущего кадра бегущей строки или None.
+
+    Кадр выбирается по часам, одинаково в демоне и одиночном запуске, и
+    вырезается из полосы в памяти: на диск попадает только публикуемый кадр.
+    """
+    if not marquee_active(title):
+        return None
+    strip, count = marquee_strip(title, title_color(url))
+    index = int(time.time() / MARQUEE_INTERVAL) % count
+    frame = cairo.ImageSurface(cairo.FORMAT_ARGB32, TEXT_MAX_WIDTH, MARQUEE_HEIGHT)
+    ctx = cairo.Context(frame)
+    ctx.set_source_surface(strip, -index * MARQUEE_STEP, 0)
+    ctx.paint()
+    return index, frame
+
+
+def compose_line(data, final_img):
+    line = terra_runtime.image_line(final_img, LINE_X, LINE_Y, CANVAS_WIDTH, CANVAS_HEIGHT)
+    frame = marquee_frame(data[2], data[1])
+    if frame:
+        # Кадр уходит в обычное кольцо слотов <имя>_marquee_N.png
+        _, frame_line = terra_runtime.publish_image(
+            f"{OUTPUT_NAME}_marquee", frame[1], LINE_X + TEXT_X, LINE_Y + MARQUEE_TOP
+        )
+        line += frame_line
+    return line
+
+
+def render_line(data, on_cover=None):
+    final_img = render_composite(data, on_cover)
+    if not final_img:
+        return ""
+    _last_render["data"], _last_render["path"] = data, final_img
+    return compose_line(data, final_img)
+
+
+def publish_render(data, on_cover=None):
+    with _render_lock:
+        try:
+            terra_runtime.publish_line(OUTPUT_NAME, render_line(data, on_cover))
+        except Exception:
+            pass
+        instrument.flush(OUTPUT_NAME, persist=False)
+
+
+def run_listener():
+    lock = terra_runtime.acquire_lock(OUTPUT_NAME)
+    if lock is None:
         return
 
-    raw_cover = download_cover(url)
-    title = truncate_text(title, MAX_LEN_TITLE)
-    artist = truncate_text(artist, MAX_LEN_ARTIST).lower()
+    current = [None]
+
+    def marquee_ticker():
+        # Прокрутка: раз в MARQUEE_INTERVAL публикуется строка с другим кадром
+        while True:
+            time.sleep(MARQUEE_INTERVAL)
+            data = current[0]
+            if data is None or data != _last_render["data"]:
+                continue
+            with _render_lock:
+                try:
+                    if marquee_active(data[2]):
+                        terra_runtime.publish_line(
+                            OUTPUT_NAME, compose_line(data, _last_render["path"])
+                        )
+                except Exception:
+                    pass
+
+    if MARQUEE:
+        threading.Thread(target=marquee_ticker, daemon=True).start()
+
+    def make_on_cover(data):
+        def on_cover(path):
+            # Обложка докачалась: подменяем картинку, если трек ещё тот же
+            if current[0] == data:
+                publish_render(data)
+
+        return on_cover
+
+    while True:
+        last = ()
+        from_sampler = terra_runtime.read_sampler() is not None
+        try:
+            for data in sampler_metadata() if from_sampler else follow_metadata():
+                # Картинка пересобирается только при реальном изменении
+                if data == last:
+                    continue
+                last = data
+                current[0] = data
+                publish_render(data, make_on_cover(data))
+        except OSError:
+            pass
+        if from_sampler:
+            # Сэмплер остановился: дальше слушаем playerctl сами
+            continue
+        # playerctl завершился (нет плеера или самого playerctl): прячем блок и ждём
+        current[0] = None
+        with _render_lock:
+            terra_runtime.publish_line(OUTPUT_NAME, "")
+            retract_palette()
+        time.sleep(LISTENER_RESTART_DELAY)
+
 
-    final_img = create_composite_image(raw_cover, title, artist)
+def main():
+    parser = argparse.ArgumentParser(description="TERRA UI: обложка Spotify")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="слушать изменения через playerctl --follow и обновлять строку для terra_client.sh",
+    )
+    parser.add_argument(
+        "--fetch",
+        metavar="URL",
+        help="скачать обложку в кэш (так работает фоновая загрузка)",
+    )
+    args = parser.parse_args()
+
+    if args.daemon:
+        run_listener()
+        return
+    if args.fetch:
+        fetch_cover_once(args.fetch)
+        instrument.flush(f"{OUTPUT_NAME}_fetch")
+        return
 
-    print(f"${{image {final_img} -p 170,540 -s {CANVAS_WIDTH}x{CANVAS_HEIGHT}}}")
+    snapshot = terra_runtime.read_sampler()
+    if snapshot and "spotify" in snapshot:
+        data = snapshot["spotify"]
+    else:
+        data = get_metadata()
+    line = render_line(data)
+    if line:
+        print(line)
+    instrument.flush(OUTPUT_NAME)
 
 
 if __name__ == "__main__":
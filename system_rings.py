@@ -1,53 +1,421 @@
 #!/usr/bin/env python3
+import argparse
 import cairo
+import hashlib
+import json
 import psutil
 import math
 import os
 import time
-import glob
 
-# Папка и шаблон имени (в /tmp)
-TMP_DIR = "/tmp"
-FILE_PATTERN = "conky_rings_*.png"
+import instrument
+import metric_history
+import terra_runtime
+import text_metrics
+
+# Имя виджета: слоты вывода system_rings_<N>.png в каталоге terra_runtime
+# (system_rings@<экземпляр>_<N>.png, если задан TERRA_INSTANCE)
+OUTPUT_NAME = terra_runtime.instance_name("system_rings")
 # Увеличиваем высоту, чтобы влез текст снизу
 WIDTH, HEIGHT = 600, 130
 
 COLOR_ACCENT = (224 / 255, 152 / 255, 122 / 255)  # #E0987A
 COLOR_BG = (0.2, 0.2, 0.2)
+# Акцент из палитры обложки текущего трека (spotify_cover.COVER_COLORS);
+# без палитры остаётся COLOR_ACCENT. Атлас и базовый слой кэшируются по цвету.
+ACCENT_FROM_COVER = False
+DEFAULT_ACCENT = COLOR_ACCENT
 
+# "metric" по умолчанию — имя кольца в нижнем регистре. Доступны cpu, cpu0..,
+# ram, swap, ssd (домашний каталог), mount:/путь, net[:iface], diskio[:диск],
+# load/load5/load15 и thermal[:зона] — см. PROVIDERS. "max" задаёт значение,
+# соответствующее полному кольцу (по умолчанию 100), например для байт/с:
+# {"name": "NET", "metric": "net", "max": 12_500_000, ...}
 RINGS = [
     {"name": "CPU", "x": 185, "radius": 28, "val": 0},
     {"name": "RAM", "x": 300, "radius": 28, "val": 0},
     {"name": "SSD", "x": 415, "radius": 28, "val": 0},
 ]
 THICKNESS = 4
+# Центр колец по вертикали
+RING_CY = 50
+FONT = "Clash Display"
+
+# Спрайты: у кольца всего 101 состояние (int(value) %), поэтому все они
+# рисуются один раз в атлас на диске, а кадр собирается копированием ячеек.
+# Если квантованные значения не изменились, новый кадр не пишется вовсе.
+RING_SPRITES = True
+# Бэкенд вывода: "png" — картинка через ${image ...}; "lua" — текстовый
+# draw list (DRAW_LIST_FILE), который рисует сам conky скриптом terra_rings.lua
+# без кодирования и декодирования PNG. Переопределяется TERRA_RING_BACKEND.
+RING_BACKEND = os.environ.get("TERRA_RING_BACKEND", "png")
+DRAW_LIST_FILE = f"{OUTPUT_NAME}.draw"
+# Левый верхний угол колец в окне conky (как -p у ${image ...}), под погодой
+# с учётом terra_runtime.WEATHER_ROWS
+ORIGIN_X, ORIGIN_Y = 150, terra_runtime.below_weather(400)
+
+# История значений: кольцевой буфер в mmap-файле каталога выполнения, по
+# одной записи на тик (HISTORY_CAPACITY записей — сутки при тике в 1 с).
+# Общая для экземпляров: при работающем terra_sampler.py её пишет он.
+# Сводка: python3 metric_history.py <каталог выполнения>/system_rings.history
+HISTORY = True
+HISTORY_FILE = "system_rings.history"
+HISTORY_CAPACITY = 86400
+HISTORY_METRICS = ["cpu", "ram", "ssd"]
+# Спарклайн под подписью каждого кольца: средние за SPARKLINE_SECONDS,
+# разбитые на SPARKLINE_POINTS точек. Меняется почти каждый тик, поэтому
+# выключен по умолчанию, чтобы не мешать пропуску одинаковых кадров.
+SPARKLINES = False
+SPARKLINE_SECONDS = 300
+SPARKLINE_POINTS = 30
+SPARKLINE_TOP, SPARKLINE_HEIGHT = 108, 16
+
+_history = None
+
+# Плавные переходы (только --daemon с бэкендом png): кольцо за
+# ANIMATION_SECONDS доезжает от прошлого значения до нового, кадры идут с
+# частотой ANIMATION_FPS. Кадр очищает и перерисовывает только прямоугольники
+# колец, чья дуга сдвинулась; площадь перерисовки видна в instrument
+# (rings.repaint_px). Каждое кольцо публикуется отдельной картинкой, поэтому
+# кадр кодирует только сдвинутые кольца. В conky нужны update_interval и
+# период ${execpi} не больше 1 / ANIMATION_FPS (вариант — в terra-ui.conf).
+ANIMATE = False
+ANIMATION_FPS = 15
+ANIMATION_SECONDS = 0.6
+
+# Место под подписью кольца внутри ячейки атласа
+SPRITE_LABEL_SPACE = 30
+
+_atlas = None
+_base_layer = None
+_last_frame = None
+
+# Замер CPU: "delta" — разница накопительных счётчиков между тиками без
+# ожидания; "blocking" — старый psutil.cpu_percent(interval=0.1)
+CPU_SAMPLING = "delta"
+CPU_STATE_FILE = f"{OUTPUT_NAME}_cpu.json"
+PROC_STAT = "/proc/stat"
+
+_cpu_prev = None
+
+# Кэш значений провайдеров метрик между одиночными запусками
+METRICS_STATE_FILE = f"{OUTPUT_NAME}_metrics.json"
+THERMAL_ROOT = "/sys/class/thermal"
+
+_metric_state = None
+
+# Режим демона: интерпретатор, поверхность cairo и состояние psutil живут
+# между тиками, conky читает готовую строку ${image ...} через terra_client.sh
+DAEMON_INTERVAL = 1.0
+
+
+def read_cpu_times():
+    # Накопительные счётчики [(total, idle), ...]: сначала суммарный, затем ядра
+    try:
+        times = []
+        with open(PROC_STAT, "r") as f:
+            for line in f:
+                if not line.startswith("cpu"):
+                    break
+                # user nice system idle iowait irq softirq steal (guest уже в user)
+                values = [int(v) for v in line.split()[1:9]]
+                times.append((sum(values), values[3] + values[4]))
+        if times:
+            return times
+    except (OSError, ValueError):
+        pass
+
+    times = []
+    for t in [psutil.cpu_times()] + psutil.cpu_times(percpu=True):
+        guest = getattr(t, "guest", 0) + getattr(t, "guest_nice", 0)
+        times.append((sum(t) - guest, t.idle + getattr(t, "iowait", 0)))
+    return times
+
+
+def load_cpu_state():
+    try:
+        with open(terra_runtime.runtime_path(CPU_STATE_FILE), "r") as f:
+            return [tuple(t) for t in json.load(f)["times"]]
+    except:
+        return None
+
+
+def save_cpu_state(times):
+    try:
+        terra_runtime.atomic_write(
+            terra_runtime.runtime_path(CPU_STATE_FILE), json.dumps({"times": times})
+        )
+    except OSError:
+        pass
+
+
+def sample_cpu_delta(persist=True):
+    """Загрузка CPU за весь интервал с прошлого вызова, без sleep.
+
+    Одиночный запуск хранит прошлый снимок в CPU_STATE_FILE, демон — в памяти
+    (persist=False). Без прошлого снимка считаем среднее с момента загрузки.
+    Возвращает (суммарно, [по ядрам]) в процентах.
+    """
+    global _cpu_prev
+    current = read_cpu_times()
+    prev = _cpu_prev
+    if prev is None and persist:
+        prev = load_cpu_state()
+    if prev is None or len(prev) != len(current):
+        prev = [(0, 0)] * len(current)
+
+    percents = []
+    for (total, idle), (prev_total, prev_idle) in zip(current, prev):
+        d_total = total - prev_total
+        d_idle = idle - prev_idle
+        if d_total <= 0:
+            percents.append(0.0)
+        else:
+            percents.append(max(0.0, min(100.0, 100.0 * (d_total - d_idle) / d_total)))
+
+    _cpu_prev = current
+    if persist:
+        save_cpu_state(current)
+    return percents[0], percents[1:]
 
 
-def get_stats():
-    # Важно: interval > 0, чтобы psutil успел замерить нагрузку
-    cpu = psutil.cpu_percent(interval=0.1)
-    ram = psutil.virtual_memory().percent
-    ssd = psutil.disk_usage(os.path.expanduser("~")).percent
-    return [cpu, ram, ssd]
+# --- Провайдеры метрик ---
+#
+# Провайдер отвечает за семейство метрик и получает сразу все нужные имена:
+# sample(metrics, rates, now, persist) -> {метрика: значение}. rates — общее
+# состояние для метрик-скоростей (прошлые значения счётчиков). Значения
+# кэшируются, и провайдер вызывается, только когда прошёл его interval.
 
 
-def cleanup_old_files():
-    files = glob.glob(os.path.join(TMP_DIR, FILE_PATTERN))
-    for f in files:
+def sample_cpu(metrics, rates, now, persist):
+    if CPU_SAMPLING == "delta":
+        cpu, cores = sample_cpu_delta(persist)
+    else:
+        # Важно: interval > 0, чтобы psutil успел замерить нагрузку
+        cores = psutil.cpu_percent(interval=0.1, percpu=True)
+        cpu = sum(cores) / len(cores) if cores else 0.0
+    values = {"cpu": cpu}
+    for i, value in enumerate(cores):
+        values[f"cpu{i}"] = value
+    return values
+
+
+def sample_ram(metrics, rates, now, persist):
+    return {"ram": psutil.virtual_memory().percent}
+
+
+def sample_swap(metrics, rates, now, persist):
+    return {"swap": psutil.swap_memory().percent}
+
+
+def sample_mount(metrics, rates, now, persist):
+    # "ssd" — домашний каталог, "mount:/путь" — любая точка монтирования
+    values = {}
+    for metric in metrics:
+        path = "~" if metric == "ssd" else metric.split(":", 1)[1]
         try:
-            os.remove(f)
-        except:
-            pass
+            values[metric] = psutil.disk_usage(os.path.expanduser(path)).percent
+        except OSError:
+            values[metric] = metric_error(metric)
+    return values
+
+
+def metric_error(metric):
+    # Ошибка одной метрики (нет интерфейса, диска, пути) не трогает остальные
+    # метрики семейства: её кольцо показывает 0 до следующего опроса
+    instrument.count("rings.metric_error")
+    return 0.0
+
+
+def counter_rate(rates, key, counter, now):
+    # Скорость накопительного счётчика в единицах/с с прошлого замера
+    prev = rates.get(key)
+    rates[key] = [counter, now]
+    if prev is None or now <= prev[1] or counter < prev[0]:
+        return 0.0
+    return (counter - prev[0]) / (now - prev[1])
+
+
+def sample_net(metrics, rates, now, persist):
+    # "net" — все интерфейсы, кроме lo; "net:wlan0" — один; байт/с приём+передача
+    counters = psutil.net_io_counters(pernic=True)
+    values = {}
+    for metric in metrics:
+        if ":" in metric:
+            nic = counters.get(metric.split(":", 1)[1])
+            if nic is None:
+                values[metric] = metric_error(metric)
+                continue
+            nics = [nic]
+        else:
+            nics = [c for name, c in counters.items() if name != "lo"]
+        total = sum(c.bytes_sent + c.bytes_recv for c in nics)
+        values[metric] = counter_rate(rates, metric, total, now)
+    return values
+
+
+def sample_diskio(metrics, rates, now, persist):
+    # "diskio" — все диски, "diskio:nvme0n1" — один; байт/с чтение+запись
+    values = {}
+    for metric in metrics:
+        if ":" in metric:
+            c = (psutil.disk_io_counters(perdisk=True) or {}).get(metric.split(":", 1)[1])
+        else:
+            c = psutil.disk_io_counters()
+        if c is None:
+            values[metric] = metric_error(metric)
+            continue
+        values[metric] = counter_rate(rates, metric, c.read_bytes + c.write_bytes, now)
+    return values
+
+
+def sample_load(metrics, rates, now, persist):
+    # Средняя загрузка в процентах от числа ядер: load (1 мин), load5, load15
+    cores = os.cpu_count() or 1
+    load1, load5, load15 = os.getloadavg()
+    return {
+        "load": 100.0 * load1 / cores,
+        "load5": 100.0 * load5 / cores,
+        "load15": 100.0 * load15 / cores,
+    }
+
+
+def read_thermal_zones():
+    zones = {}
+    try:
+        names = sorted(n for n in os.listdir(THERMAL_ROOT) if n.startswith("thermal_zone"))
+    except OSError:
+        return zones
+    for name in names:
+        base = os.path.join(THERMAL_ROOT, name)
+        try:
+            with open(os.path.join(base, "temp"), "r") as f:
+                temp = int(f.read()) / 1000.0
+            with open(os.path.join(base, "type"), "r") as f:
+                kind = f.read().strip()
+        except (OSError, ValueError):
+            continue
+        zones[name[len("thermal_zone") :]] = (kind, temp)
+    return zones
+
+
+def sample_thermal(metrics, rates, now, persist):
+    # "thermal" — самая горячая зона; "thermal:0" — по номеру, "thermal:x86_pkg_temp" — по типу (°C)
+    zones = read_thermal_zones()
+    values = {}
+    for metric in metrics:
+        if ":" in metric:
+            key = metric.split(":", 1)[1]
+            temps = [t for index, (kind, t) in zones.items() if key in (index, kind)]
+        else:
+            temps = [t for _, t in zones.values()]
+        values[metric] = max(temps) if temps else 0.0
+    return values
+
+
+# Реестр: семейство -> период опроса (сек) и функция. Свои метрики добавляются
+# так же: PROVIDERS["gpu"] = {"interval": 2, "sample": sample_gpu}
+PROVIDERS = {
+    "cpu": {"interval": 1, "sample": sample_cpu},
+    "ram": {"interval": 2, "sample": sample_ram},
+    "swap": {"interval": 10, "sample": sample_swap},
+    "mount": {"interval": 300, "sample": sample_mount},
+    "net": {"interval": 1, "sample": sample_net},
+    "diskio": {"interval": 1, "sample": sample_diskio},
+    "load": {"interval": 5, "sample": sample_load},
+    "thermal": {"interval": 5, "sample": sample_thermal},
+}
+# Тик демона и conky плавает на миллисекунды: не пропускаем метрику из-за них
+SCHEDULE_SLACK = 0.1
+
+
+def metric_family(metric):
+    if ":" in metric:
+        return metric.split(":", 1)[0]
+    if metric == "ssd":
+        return "mount"
+    if metric in ("load5", "load15"):
+        return "load"
+    if metric.startswith("cpu") and metric[3:].isdigit():
+        return "cpu"
+    return metric
+
+
+def load_metric_state(persist):
+    global _metric_state
+    if _metric_state is None:
+        _metric_state = {"values": {}, "at": {}, "rates": {}}
+        if persist:
+            try:
+                with open(terra_runtime.runtime_path(METRICS_STATE_FILE), "r") as f:
+                    _metric_state.update(json.load(f))
+            except:
+                pass
+    return _metric_state
+
+
+def save_metric_state(state):
+    try:
+        terra_runtime.atomic_write(
+            terra_runtime.runtime_path(METRICS_STATE_FILE), json.dumps(state)
+        )
+    except OSError:
+        pass
+
+
+def wanted_metrics():
+    metrics = [ring_metric(ring) for ring in RINGS]
+    if HISTORY:
+        metrics += [m for m in HISTORY_METRICS if m not in metrics]
+    return metrics
+
+
+def get_stats(persist=True, metrics=None):
+    """Значения метрик колец; опрашиваются только провайдеры, чей период истёк.
+
+    Одиночный запуск хранит кэш значений в METRICS_STATE_FILE, демон — в
+    памяти (persist=False). Неизвестные метрики дают 0.
+    """
+    state = load_metric_state(persist)
+    now = time.time()
+
+    families = {}
+    for metric in metrics or wanted_metrics():
+        families.setdefault(metric_family(metric), []).append(metric)
+
+    sampled_count = 0
+    for family, names in families.items():
+        provider = PROVIDERS.get(family)
+        if provider is None:
+            continue
+        at = state["at"].get(family)
+        if (
+            at is not None
+            and now - at < provider["interval"] - SCHEDULE_SLACK
+            and all(name in state["values"] for name in names)
+        ):
+            continue
+        try:
+            with instrument.stage(f"rings.provider.{family}"):
+                values = provider["sample"](names, state["rates"], now, persist)
+            state["values"].update(values)
+        except Exception:
+            instrument.count(f"rings.provider_error.{family}")
+            # Без значений семейство опрашивалось бы заново на каждом тике
+            for name in names:
+                state["values"].setdefault(name, 0.0)
+        state["at"][family] = now
+        sampled_count += 1
+
+    if sampled_count and persist:
+        save_metric_state(state)
+    instrument.count("rings.provider_cached", len(families) - sampled_count)
+    return dict(state["values"])
 
 
 def draw_text_centered(ctx, text, x, y, font_size, weight="Medium"):
-    ctx.select_font_face(
-        "Clash Display",
-        cairo.FONT_SLANT_NORMAL,
-        cairo.FONT_WEIGHT_BOLD if weight == "Bold" else cairo.FONT_WEIGHT_NORMAL,
-    )
-    ctx.set_font_size(font_size)
-    extents = ctx.text_extents(text)
+    extents = text_metrics.text_extents(ctx, FONT, weight, font_size, text)
+    text_metrics.set_font(ctx, FONT, weight, font_size)
     ctx.move_to(
         x - extents.width / 2 - extents.x_bearing,
         y - extents.height / 2 - extents.y_bearing,
@@ -55,49 +423,652 @@ def draw_text_centered(ctx, text, x, y, font_size, weight="Medium"):
     ctx.show_text(text)
 
 
-def draw():
-    stats = get_stats()
-    timestamp = int(time.time() * 1000)
-    filename = os.path.join(TMP_DIR, f"conky_rings_{timestamp}.png")
-
-    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, WIDTH, HEIGHT)
-    ctx = cairo.Context(surface)
+def clear_surface(ctx):
+    ctx.save()
+    ctx.set_operator(cairo.OPERATOR_CLEAR)
+    ctx.paint()
+    ctx.restore()
 
-    # Центр колец по вертикали
-    cy = 50
 
-    for i, ring in enumerate(RINGS):
-        cx = ring["x"]
-        radius = ring["radius"]
-        value = stats[i]
-        label = ring["name"]
+# Кольцо описывается примитивами, которые одинаково исполняют cairo (PNG)
+# и terra_rings.lua (draw list):
+#   ("arc", cx, cy, radius, angle1, angle2, width, rgba)
+#   ("text", cx, cy, size, weight, rgba, text) — текст центрируется в (cx, cy)
+#   ("poly", [(x, y), ...], width, rgba) — ломаная (спарклайн)
 
-        start_angle = -math.pi / 2
 
+def ring_static_ops(cx, cy, radius, label):
+    return [
         # Фон кольца
-        ctx.new_path()
-        ctx.set_line_width(THICKNESS)
-        ctx.set_source_rgba(*COLOR_BG, 0.3)
-        ctx.arc(cx, cy, radius, 0, 2 * math.pi)
-        ctx.stroke()
+        ("arc", cx, cy, radius, 0, 2 * math.pi, THICKNESS, (*COLOR_BG, 0.3)),
+        ("text", cx, cy + radius + 20, 12, "Bold", (*COLOR_ACCENT, 1), label),
+    ]
+
 
-        # Прогресс
+def ring_dynamic_ops(cx, cy, radius, value):
+    start_angle = -math.pi / 2
+    ops = []
+    # Прогресс
+    if value > 0:
         progress_end = start_angle + (value / 100.0) * (2 * math.pi)
-        ctx.new_path()
-        ctx.set_source_rgb(*COLOR_ACCENT)
-        if value > 0:
-            ctx.arc(cx, cy, radius, start_angle, progress_end)
+        ops.append(
+            ("arc", cx, cy, radius, start_angle, progress_end, THICKNESS, (*COLOR_ACCENT, 1))
+        )
+    ops.append(("text", cx, cy + 2, 12, "Medium", (*COLOR_ACCENT, 1), f"{int(value)}%"))
+    return ops
+
+
+def sparkline_ops(cx, radius, samples):
+    if len(samples) < 2:
+        return []
+    left = cx - radius
+    step = 2 * radius / (len(samples) - 1)
+    points = [
+        (left + i * step, SPARKLINE_TOP + SPARKLINE_HEIGHT * (1 - value / 100.0))
+        for i, value in enumerate(samples)
+    ]
+    return [("poly", points, 1.5, (*COLOR_ACCENT, 0.6))]
+
+
+def paint_ops(ctx, ops):
+    for op in ops:
+        if op[0] == "poly":
+            _, points, width, rgba = op
+            ctx.new_path()
+            ctx.set_line_width(width)
+            ctx.set_source_rgba(*rgba)
+            for x, y in points:
+                ctx.line_to(x, y)
             ctx.stroke()
+        elif op[0] == "arc":
+            _, cx, cy, radius, angle1, angle2, width, rgba = op
+            ctx.new_path()
+            ctx.set_line_width(width)
+            ctx.set_source_rgba(*rgba)
+            ctx.arc(cx, cy, radius, angle1, angle2)
+            ctx.stroke()
+        else:
+            _, cx, cy, size, weight, rgba, text = op
+            ctx.set_source_rgba(*rgba)
+            draw_text_centered(ctx, text, cx, cy, size, weight)
+
+
+def draw_ring_static(ctx, cx, cy, radius, label):
+    paint_ops(ctx, ring_static_ops(cx, cy, radius, label))
+
+
+def draw_ring_dynamic(ctx, cx, cy, radius, value):
+    paint_ops(ctx, ring_dynamic_ops(cx, cy, radius, value))
+
+
+def draw_ring(ctx, cx, cy, radius, value, label):
+    draw_ring_static(ctx, cx, cy, radius, label)
+    draw_ring_dynamic(ctx, cx, cy, radius, value)
+
+
+def ring_metric(ring):
+    return ring.get("metric", ring["name"].lower())
+
+
+def ring_percent(ring, value):
+    return max(0.0, min(100.0, value * 100.0 / ring.get("max", 100)))
+
+
+def ring_value(stats, ring):
+    return ring_percent(ring, stats.get(ring_metric(ring), 0))
+
+
+def load_history():
+    global _history
+    if _history is None:
+        metrics = HISTORY_METRICS + [
+            m for m in map(ring_metric, RINGS) if m not in HISTORY_METRICS
+        ]
+        _history = metric_history.MetricHistory(
+            terra_runtime.runtime_path(HISTORY_FILE), metrics, HISTORY_CAPACITY
+        )
+    return _history
+
+
+def record_history(stats):
+    try:
+        load_history().append(stats)
+    except (OSError, ValueError):
+        pass
+
+
+def sparkline_samples():
+    """Округлённые средние по истории для каждого кольца (пусто без истории)."""
+    try:
+        history = load_history()
+    except (OSError, ValueError):
+        return [() for _ in RINGS]
+    return [
+        tuple(
+            int(round(ring_percent(ring, v)))
+            for v in history.downsample(ring_metric(ring), SPARKLINE_POINTS, SPARKLINE_SECONDS)
+        )
+        for ring in RINGS
+    ]
+
+
+def apply_cover_accent():
+    global COLOR_ACCENT
+    if ACCENT_FROM_COVER:
+        COLOR_ACCENT = terra_runtime.palette_color("accent", DEFAULT_ACCENT)
+
+
+def frame_key(values, sparks):
+    # Ключ пропуска кадра: проценты колец плюс точки спарклайнов (плоский список для JSON)
+    if ACCENT_FROM_COVER:
+        values = values + COLOR_ACCENT
+    if not sparks:
+        return values
+    return values + tuple(v for samples in sparks for v in (len(samples),) + samples)
 
-        draw_text_centered(ctx, f"{int(value)}%", cx, cy + 2, 12, "Medium")
 
-        draw_text_centered(ctx, label, cx, cy + radius + 20, 12, "Bold")
+def prune_accent_variants(prefix, keep):
+    # С акцентом из обложки у каждого альбома свой цвет: на диске храним только текущий вариант
+    if not ACCENT_FROM_COVER:
+        return
+    for name in os.listdir(terra_runtime.CACHE_DIR):
+        path = os.path.join(terra_runtime.CACHE_DIR, name)
+        if name.startswith(prefix) and path != keep:
+            os.remove(path)
 
-    cleanup_old_files()
-    surface.write_to_png(filename)
 
-    print(f"${{image {filename} -p 150,400 -s {WIDTH}x{HEIGHT}}}")
+def base_layer_key():
+    desc = {
+        "rings": [(ring["name"], ring["x"], ring["radius"]) for ring in RINGS],
+        "size": (WIDTH, HEIGHT),
+        "cy": RING_CY,
+        "thickness": THICKNESS,
+        "accent": COLOR_ACCENT,
+        "bg": COLOR_BG,
+        "font": FONT,
+    }
+    return hashlib.sha1(json.dumps(desc, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def load_base_layer():
+    # Фоны колец и подписи не меняются между кадрами: рисуем их один раз на
+    # раскладку и тему, дальше в кадре только дуги прогресса и проценты
+    global _base_layer
+    key = base_layer_key()
+    if _base_layer is not None and _base_layer[0] == key:
+        return _base_layer[1]
+
+    path = terra_runtime.cache_path(f"rings_base_{key}.png")
+    try:
+        surface = cairo.ImageSurface.create_from_png(path)
+    except Exception:
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, WIDTH, HEIGHT)
+        ctx = cairo.Context(surface)
+        for ring in RINGS:
+            draw_ring_static(ctx, ring["x"], RING_CY, ring["radius"], ring["name"])
+        try:
+            terra_runtime.atomic_write_with(path, surface.write_to_png)
+            prune_accent_variants("rings_base_", path)
+        except OSError:
+            pass
+    _base_layer = (key, surface)
+    return surface
+
+
+def render_values(ctx, values):
+    ctx.set_source_surface(load_base_layer(), 0, 0)
+    ctx.paint()
+    for ring, value in zip(RINGS, values):
+        draw_ring_dynamic(ctx, ring["x"], RING_CY, ring["radius"], value)
+
+
+def frame_values(stats):
+    return [ring_value(stats, ring) for ring in RINGS]
+
+
+def render_rings(ctx, stats):
+    render_values(ctx, frame_values(stats))
+
+
+def use_sprites():
+    # Атлас (~6464x270) окупается только в памяти демона или компоновщика,
+    # которые грузят его при старте: одиночный запуск декодировал бы его
+    # целиком ради трёх ячеек и рисует дуги поверх базового слоя
+    return RING_SPRITES and _atlas is not None
+
+
+def paint_frame(ctx, values, sparks=None):
+    """Кадр колец на чистый ctx: спрайты или дуги плюс спарклайны (общий для демона и компоновщика)."""
+    if use_sprites():
+        blit_rings(ctx, values)
+    else:
+        render_values(ctx, values)
+    for ring, samples in zip(RINGS, sparks or ()):
+        paint_ops(ctx, sparkline_ops(ring["x"], ring["radius"], samples))
+
+
+def format_number(value):
+    text = f"{value:.4f}".rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+# Раскладка без сдвига и масштаба: с ней --values печатает эталонный draw list
+NEUTRAL_LAYOUT = {"dx": 0, "dy": 0, "scale": 1}
+
+
+def draw_list(values, sparks=None, layout=None):
+    """Кадр колец для terra_rings.lua: одна команда на строку, без cairo.
+
+    layout — сдвиг и масштаб экземпляра (по умолчанию instance_layout()).
+    С NEUTRAL_LAYOUT результат зависит только от values и настроек колец и
+    сравнивается с эталоном tests/golden: python3 system_rings.py --values 12,40,71
+    """
+    if layout is None:
+        layout = terra_runtime.instance_layout()
+    scale = layout["scale"]
+    origin_x = format_number(layout["dx"] + ORIGIN_X * scale)
+    origin_y = format_number(layout["dy"] + ORIGIN_Y * scale)
+    lines = [f"origin {origin_x} {origin_y}"]
+    if scale != 1:
+        lines.append(f"scale {format_number(scale)}")
+    lines += [f"size {WIDTH} {HEIGHT}", f"font {FONT}"]
+    for i, (ring, value) in enumerate(zip(RINGS, values)):
+        ops = ring_static_ops(ring["x"], RING_CY, ring["radius"], ring["name"])
+        ops += ring_dynamic_ops(ring["x"], RING_CY, ring["radius"], value)
+        if sparks:
+            ops += sparkline_ops(ring["x"], ring["radius"], sparks[i])
+        for op in ops:
+            if op[0] == "poly":
+                _, points, width, rgba = op
+                numbers = [width, *rgba] + [v for point in points for v in point]
+                lines.append("poly " + " ".join(format_number(v) for v in numbers))
+            elif op[0] == "arc":
+                numbers = list(op[1:7]) + list(op[7])
+                lines.append("arc " + " ".join(format_number(v) for v in numbers))
+            else:
+                _, cx, cy, size, weight, rgba, text = op
+                numbers = " ".join(format_number(v) for v in (cx, cy, size))
+                color = " ".join(format_number(v) for v in rgba)
+                lines.append(f"text {numbers} {weight} {color} {text}")
+    return "\n".join(lines) + "\n"
+
+
+def publish_draw_list(values, sparks, persist):
+    # Conky сам перерисовывает окно каждый тик: файл меняется, только если
+    # изменились квантованные значения, а строка ${image ...} не нужна
+    key = frame_key(values, sparks)
+    last = load_last_frame(persist)
+    path = terra_runtime.runtime_path(DRAW_LIST_FILE)
+    if last and last[0] == key and last[2] == path and os.path.exists(path):
+        return last[1]
+    terra_runtime.atomic_write(path, draw_list(values, sparks))
+    save_last_frame((key, "", path), persist)
+    return ""
+
+
+def quantise(stats):
+    return tuple(int(ring_value(stats, ring)) for ring in RINGS)
+
+
+def atlas_cell():
+    # Одна сетка на все кольца: центр кольца в (cell_w / 2, half) каждой ячейки
+    half = max(ring["radius"] for ring in RINGS) + THICKNESS
+    cell_h = half + max(ring["radius"] for ring in RINGS) + SPRITE_LABEL_SPACE
+    return 2 * half, cell_h, half
+
+
+def atlas_key():
+    desc = {
+        "rings": [(ring["name"], ring["radius"]) for ring in RINGS],
+        "thickness": THICKNESS,
+        "accent": COLOR_ACCENT,
+        "bg": COLOR_BG,
+        "font": FONT,
+        "label_space": SPRITE_LABEL_SPACE,
+    }
+    return hashlib.sha1(json.dumps(desc, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def build_atlas():
+    cell_w, cell_h, half = atlas_cell()
+    surface = cairo.ImageSurface(
+        cairo.FORMAT_ARGB32, cell_w * 101, cell_h * len(RINGS)
+    )
+    ctx = cairo.Context(surface)
+    for row, ring in enumerate(RINGS):
+        for value in range(101):
+            draw_ring(
+                ctx,
+                value * cell_w + cell_w / 2,
+                row * cell_h + half,
+                ring["radius"],
+                value,
+                ring["name"],
+            )
+    return surface
+
+
+def load_atlas():
+    global _atlas
+    key = atlas_key()
+    if _atlas is not None and _atlas[0] == key:
+        return _atlas[1]
+
+    path = terra_runtime.cache_path(f"rings_atlas_{key}.png")
+    try:
+        surface = cairo.ImageSurface.create_from_png(path)
+    except Exception:
+        surface = build_atlas()
+        try:
+            terra_runtime.atomic_write_with(path, surface.write_to_png)
+            prune_accent_variants("rings_atlas_", path)
+        except OSError:
+            pass
+    _atlas = (key, surface)
+    return surface
+
+
+def blit_ring(ctx, atlas, row, value):
+    cell_w, cell_h, half = atlas_cell()
+    x = RINGS[row]["x"] - cell_w / 2
+    y = RING_CY - half
+    ctx.set_source_surface(atlas, x - int(value) * cell_w, y - row * cell_h)
+    ctx.rectangle(x, y, cell_w, cell_h)
+    ctx.fill()
+
+
+def blit_rings(ctx, values):
+    atlas = load_atlas()
+    for row, value in enumerate(values):
+        blit_ring(ctx, atlas, row, value)
+
+
+def ring_rect(row):
+    """Прямоугольник (x, y, w, h), который меняется вместе со значением кольца."""
+    if RING_SPRITES:
+        cell_w, cell_h, half = atlas_cell()
+        return RINGS[row]["x"] - cell_w // 2, RING_CY - half, cell_w, cell_h
+    # Дуга и процент внутри неё; +1 пиксель на сглаживание краёв
+    half = RINGS[row]["radius"] + THICKNESS + 1
+    return RINGS[row]["x"] - half, RING_CY - half, 2 * half, 2 * half
+
+
+def shown_value(value):
+    # Значение, различимое на картинке: спрайты — целые проценты, дуга — четверть процента
+    return int(value) if RING_SPRITES else round(value * 4) / 4
+
+
+def ease_out(t):
+    return 1 - (1 - t) ** 3
+
+
+class RingAnimator:
+    """Плавно ведёт кольца к новым значениям, перерисовывая только сдвинутые."""
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.shown = None
+        self.start = self.target = None
+        self.sparks = None
+        self.accent = None
+        self.started = 0.0
+        # Что перерисовано с прошлой публикации: всё (full) или отдельные кольца
+        self.full = False
+        self.dirty = set()
+
+    def retarget(self, values, sparks, now):
+        self.start = self.shown or values
+        self.target = values
+        self.started = now
+        if self.shown is None or sparks != self.sparks or COLOR_ACCENT != self.accent:
+            # Первый кадр, новые спарклайны или цвет: один полный кадр
+            self.sparks = sparks
+            self.accent = COLOR_ACCENT
+            self.shown = self.start
+            self.repaint_all()
+            return WIDTH * HEIGHT
+        return 0
+
+    def pending(self):
+        return self.shown is not None and self.shown != self.target
+
+    def repaint_all(self):
+        self.full = True
+        clear_surface(self.ctx)
+        paint_frame(self.ctx, self.shown, self.sparks)
+
+    def repaint_ring(self, row, value):
+        x, y, w, h = ring_rect(row)
+        ctx = self.ctx
+        ctx.save()
+        ctx.rectangle(x, y, w, h)
+        ctx.clip()
+        ctx.set_operator(cairo.OPERATOR_CLEAR)
+        ctx.paint()
+        ctx.set_operator(cairo.OPERATOR_OVER)
+        if RING_SPRITES:
+            blit_ring(ctx, load_atlas(), row, value)
+        else:
+            ring = RINGS[row]
+            ctx.set_source_surface(load_base_layer(), 0, 0)
+            ctx.paint()
+            draw_ring_dynamic(ctx, ring["x"], RING_CY, ring["radius"], value)
+        ctx.restore()
+        self.dirty.add(row)
+        return w * h
+
+    def frame(self, now):
+        """Рисует следующий кадр перехода; возвращает площадь перерисовки в пикселях."""
+        t = min(1.0, (now - self.started) / ANIMATION_SECONDS)
+        if t >= 1.0:
+            values = self.target
+        else:
+            k = ease_out(t)
+            values = tuple(a + (b - a) * k for a, b in zip(self.start, self.target))
+        area = 0
+        for row, (old, new) in enumerate(zip(self.shown, values)):
+            if shown_value(old) != shown_value(new):
+                area += self.repaint_ring(row, new)
+        self.shown = values
+        return area
+
+
+def load_last_frame(persist):
+    if _last_frame is not None or not persist:
+        return _last_frame
+    try:
+        with open(terra_runtime.runtime_path(f"{OUTPUT_NAME}.last"), "r") as f:
+            d = json.load(f)
+            return tuple(d["values"]), d["line"], d["path"]
+    except:
+        return None
+
+
+def save_last_frame(frame, persist):
+    global _last_frame
+    _last_frame = frame
+    if persist:
+        try:
+            values, line, path = frame
+            terra_runtime.atomic_write(
+                terra_runtime.runtime_path(f"{OUTPUT_NAME}.last"),
+                json.dumps({"values": values, "line": line, "path": path}),
+            )
+        except OSError:
+            pass
+
+
+def read_stats(persist):
+    # Метрики общего сэмплера, если он работает; иначе опрашиваем сами
+    snapshot = terra_runtime.read_sampler()
+    if snapshot and "metrics" in snapshot:
+        instrument.count("rings.snapshot_hit")
+        return snapshot["metrics"]
+    with instrument.stage("rings.sample"):
+        stats = get_stats(persist)
+    if HISTORY:
+        with instrument.stage("rings.history"):
+            record_history(stats)
+    return stats
+
+
+def draw(surface=None, ctx=None, persist=True):
+    stats = read_stats(persist)
+    apply_cover_accent()
+    sparks = sparkline_samples() if SPARKLINES else None
+    values = quantise(stats)
+
+    if RING_BACKEND == "lua":
+        with instrument.stage("rings.draw_list"):
+            return publish_draw_list(values, sparks, persist)
+
+    if RING_SPRITES:
+        key = frame_key(values, sparks)
+        last = load_last_frame(persist)
+        if last and last[0] == key and last[1] and os.path.exists(last[2]):
+            instrument.count("rings.frame_skipped")
+            return last[1]
+
+    if surface is None:
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, WIDTH, HEIGHT)
+        ctx = cairo.Context(surface)
+    else:
+        clear_surface(ctx)
+
+    with instrument.stage("rings.render"):
+        paint_frame(ctx, values if RING_SPRITES else frame_values(stats), sparks)
+
+    with instrument.stage("rings.encode"):
+        filename, line = terra_runtime.publish_image(
+            OUTPUT_NAME, surface, ORIGIN_X, ORIGIN_Y
+        )
+
+    if RING_SPRITES:
+        save_last_frame((key, line, filename), persist)
+    text_metrics.save()
+    return line
+
+
+def run_daemon():
+    lock = terra_runtime.acquire_lock(OUTPUT_NAME)
+    if lock is None:
+        return
+
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, WIDTH, HEIGHT)
+    ctx = cairo.Context(surface)
+    if RING_SPRITES and RING_BACKEND != "lua":
+        load_atlas()
+    # Первый снимок счётчиков: дальше CPU считается за интервал между тиками
+    sample_cpu_delta(persist=False)
+
+    if ANIMATE and RING_BACKEND != "lua":
+        run_animation(surface, ctx)
+        return
+
+    while True:
+        started = time.monotonic()
+        try:
+            terra_runtime.publish_line(
+                OUTPUT_NAME, draw(surface, ctx, persist=False)
+            )
+        except Exception:
+            pass
+        instrument.flush(OUTPUT_NAME, persist=False)
+        time.sleep(max(0.0, DAEMON_INTERVAL - (time.monotonic() - started)))
+
+
+def publish_animation(surface, animator, lines):
+    """Строка conky из отдельных картинок: фон без колец и по картинке на кольцо.
+
+    Кадр перехода кодирует только прямоугольники сдвинутых колец; фон (подписи,
+    спарклайны) кодируется заново лишь после полной перерисовки.
+    """
+    rows = animator.dirty
+    if animator.full or "base" not in lines:
+        base = cairo.ImageSurface(cairo.FORMAT_ARGB32, WIDTH, HEIGHT)
+        ctx = cairo.Context(base)
+        ctx.set_source_surface(surface, 0, 0)
+        ctx.paint()
+        ctx.set_operator(cairo.OPERATOR_CLEAR)
+        for row in range(len(RINGS)):
+            ctx.rectangle(*ring_rect(row))
+        ctx.fill()
+        _, lines["base"] = terra_runtime.publish_image(OUTPUT_NAME, base, ORIGIN_X, ORIGIN_Y)
+        rows = range(len(RINGS))
+    for row in rows:
+        _, lines[row] = terra_runtime.publish_image(
+            f"{OUTPUT_NAME}_ring{row}", surface, ORIGIN_X, ORIGIN_Y, rect=ring_rect(row)
+        )
+    animator.full = False
+    animator.dirty = set()
+    return lines["base"] + "".join(lines[row] for row in range(len(RINGS)))
+
+
+def run_animation(surface, ctx):
+    # Метрики по-прежнему раз в DAEMON_INTERVAL, между ними — кадры перехода
+    animator = RingAnimator(ctx)
+    lines = {}
+    frame_interval = 1.0 / ANIMATION_FPS
+    next_sample = 0.0
+    while True:
+        now = time.monotonic()
+        area = 0
+        try:
+            if now >= next_sample:
+                next_sample = now + DAEMON_INTERVAL
+                stats = read_stats(persist=False)
+                apply_cover_accent()
+                values = tuple(ring_value(stats, ring) for ring in RINGS)
+                sparks = sparkline_samples() if SPARKLINES else None
+                area += animator.retarget(values, sparks, now)
+            if animator.pending():
+                with instrument.stage("rings.render"):
+                    area += animator.frame(now)
+            if area:
+                instrument.gauge("rings.repaint_px", area)
+                instrument.count("rings.repaint_px", area)
+                instrument.count("rings.frames")
+                with instrument.stage("rings.encode"):
+                    line = publish_animation(surface, animator, lines)
+                terra_runtime.publish_line(OUTPUT_NAME, line)
+                text_metrics.save()
+        except Exception:
+            pass
+        instrument.flush(OUTPUT_NAME, persist=False)
+        wake = next_sample
+        if animator.pending():
+            wake = min(wake, now + frame_interval)
+        time.sleep(max(0.0, wake - time.monotonic()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TERRA UI: кольца CPU/RAM/SSD")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="работать постоянно и обновлять строку для terra_client.sh",
+    )
+    parser.add_argument(
+        "--values",
+        type=lambda s: tuple(int(v) for v in s.split(",")),
+        help="вывести draw list для заданных процентов (например, 12,40,71) и выйти",
+    )
+    parser.add_argument(
+        "--instance-layout",
+        action="store_true",
+        help="с --values: применить раскладку экземпляра TERRA_INSTANCE вместо нейтральной",
+    )
+    args = parser.parse_args()
+
+    if args.values is not None:
+        layout = None if args.instance_layout else NEUTRAL_LAYOUT
+        print(draw_list(args.values, layout=layout), end="")
+    elif args.daemon:
+        run_daemon()
+    else:
+        print(draw())
+        instrument.flush(OUTPUT_NAME)
 
 
 if __name__ == "__main__":
-    draw()
+    main()
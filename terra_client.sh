@@ -0,0 +1,41 @@
+#!/bin/sh
+# Крошечный клиент для conky: печатает последнюю строку ${image ...},
+# опубликованную демоном, и поднимает демон, если тот ещё не запущен.
+# Использование: ${execpi 1 ./terra_client.sh system_rings}
+#
+# Экземпляр (например, conky на втором мониторе) задаётся TERRA_INSTANCE
+# или вторым аргументом: у него свои файлы <имя>@<экземпляр>, а метрики,
+# погоду и трек для всех экземпляров собирает один terra_sampler.py.
+
+NAME="$1"
+[ -n "$2" ] && TERRA_INSTANCE="$2"
+export TERRA_INSTANCE
+# Тот же каталог, что terra_runtime.RUNTIME_DIR
+if [ -n "$XDG_RUNTIME_DIR" ]; then
+    DIR="$XDG_RUNTIME_DIR/terra-ui"
+elif [ -d /dev/shm ]; then
+    DIR="/dev/shm/terra-ui-$(id -u)"
+else
+    DIR="/tmp/terra-ui-$(id -u)"
+fi
+OUT="$NAME"
+[ -n "$TERRA_INSTANCE" ] && OUT="${NAME}@${TERRA_INSTANCE}"
+LINE_FILE="$DIR/${OUT}.line"
+
+# Дубликаты отсекает flock внутри самого демона
+ensure_daemon() {
+    PID=$(cat "$1" 2>/dev/null)
+    if [ -z "$PID" ] || ! kill -0 "$PID" 2>/dev/null; then
+        shift
+        nohup "$@" >/dev/null 2>&1 &
+    fi
+}
+
+if [ -n "$TERRA_INSTANCE" ]; then
+    # Сэмплер общий: без экземпляра в окружении
+    ensure_daemon "$DIR/terra_sampler.pid" env TERRA_INSTANCE= python3 ./terra_sampler.py --daemon
+fi
+ensure_daemon "$DIR/${OUT}.pid" python3 "./${NAME}.py" --daemon
+
+[ -f "$LINE_FILE" ] && cat "$LINE_FILE"
+exit 0
@@ -0,0 +1,144 @@
+--[[
+   TERRA UI: кольца CPU/RAM/SSD, нарисованные самим conky.
+
+   system_rings.py с RING_BACKEND = "lua" (или TERRA_RING_BACKEND=lua) пишет
+   draw list в каталог выполнения, а этот скрипт исполняет его каждый тик
+   через cairo — без PNG на диске. Подключение в terra-ui.conf:
+
+       lua_load = './terra_rings.lua',
+       lua_draw_hook_post = 'terra_rings',
+
+   Формат draw list (одна команда на строку):
+       origin X Y
+       scale S                                -- только если у экземпляра scale != 1
+       size W H
+       font Семейство
+       arc CX CY R ANGLE1 ANGLE2 WIDTH R G B A
+       text CX CY SIZE WEIGHT R G B A Текст   -- центр текста в (CX, CY)
+       poly WIDTH R G B A X1 Y1 X2 Y2 ...     -- спарклайн (SPARKLINES = True)
+]]
+
+require 'cairo'
+pcall(require, 'cairo_xlib')
+
+-- У экземпляра (TERRA_INSTANCE) свой draw list, как у system_rings.OUTPUT_NAME
+local INSTANCE = os.getenv('TERRA_INSTANCE') or ''
+local DRAW_LIST = INSTANCE ~= '' and ('system_rings@' .. INSTANCE .. '.draw') or 'system_rings.draw'
+
+-- Те же каталоги и в том же порядке, что terra_runtime.RUNTIME_DIR
+local function candidate_paths()
+    local paths = {}
+    local xdg = os.getenv('XDG_RUNTIME_DIR')
+    if xdg and xdg ~= '' then
+        table.insert(paths, xdg .. '/terra-ui/' .. DRAW_LIST)
+    end
+    local pipe = io.popen('id -u')
+    local uid = pipe and pipe:read('*l') or ''
+    if pipe then pipe:close() end
+    table.insert(paths, '/dev/shm/terra-ui-' .. uid .. '/' .. DRAW_LIST)
+    table.insert(paths, '/tmp/terra-ui-' .. uid .. '/' .. DRAW_LIST)
+    return paths
+end
+
+local paths = nil
+local draw_path = nil
+
+local function open_draw_list()
+    if draw_path then
+        local f = io.open(draw_path, 'r')
+        if f then return f end
+    end
+    paths = paths or candidate_paths()
+    for _, path in ipairs(paths) do
+        local f = io.open(path, 'r')
+        if f then
+            draw_path = path
+            return f
+        end
+    end
+    return nil
+end
+
+local function numbers(text, count)
+    local values = {}
+    local rest = text
+    for i = 1, count do
+        local value, tail = rest:match('^(%S+)%s*(.*)$')
+        if not value then return nil end
+        values[i] = tonumber(value)
+        rest = tail
+    end
+    return values, rest
+end
+
+local function draw_text(cr, font, size, weight, text, cx, cy)
+    local slant = CAIRO_FONT_SLANT_NORMAL
+    local bold = weight == 'Bold' and CAIRO_FONT_WEIGHT_BOLD or CAIRO_FONT_WEIGHT_NORMAL
+    cairo_select_font_face(cr, font, slant, bold)
+    cairo_set_font_size(cr, size)
+    local ext = cairo_text_extents_t:create()
+    tolua.takeownership(ext)
+    cairo_text_extents(cr, text, ext)
+    cairo_move_to(cr, cx - ext.width / 2 - ext.x_bearing, cy - ext.height / 2 - ext.y_bearing)
+    cairo_show_text(cr, text)
+end
+
+local function run(cr, f)
+    local font = 'Sans'
+    for line in f:lines() do
+        local op, rest = line:match('^(%S+)%s*(.*)$')
+        if op == 'origin' then
+            local v = numbers(rest, 2)
+            if v then cairo_translate(cr, v[1], v[2]) end
+        elseif op == 'scale' then
+            local v = numbers(rest, 1)
+            if v then cairo_scale(cr, v[1], v[1]) end
+        elseif op == 'font' then
+            font = rest
+        elseif op == 'arc' then
+            local v = numbers(rest, 10)
+            if v then
+                cairo_new_path(cr)
+                cairo_set_line_width(cr, v[6])
+                cairo_set_source_rgba(cr, v[7], v[8], v[9], v[10])
+                cairo_arc(cr, v[1], v[2], v[3], v[4], v[5])
+                cairo_stroke(cr)
+            end
+        elseif op == 'poly' then
+            local v, tail = numbers(rest, 5)
+            if v then
+                cairo_new_path(cr)
+                cairo_set_line_width(cr, v[1])
+                cairo_set_source_rgba(cr, v[2], v[3], v[4], v[5])
+                for x, y in tail:gmatch('(%S+)%s+(%S+)') do
+                    cairo_line_to(cr, tonumber(x), tonumber(y))
+                end
+                cairo_stroke(cr)
+            end
+        elseif op == 'text' then
+            local v, tail = numbers(rest, 3)
+            if v then
+                local weight, tail2 = tail:match('^(%S+)%s*(.*)$')
+                local color, text = numbers(tail2 or '', 4)
+                if weight and color then
+                    cairo_set_source_rgba(cr, color[1], color[2], color[3], color[4])
+                    draw_text(cr, font, v[3], weight, text, v[1], v[2])
+                end
+            end
+        end
+    end
+end
+
+function conky_terra_rings()
+    if conky_window == nil then return end
+    local f = open_draw_list()
+    if not f then return end
+
+    local cs = cairo_xlib_surface_create(conky_window.display, conky_window.drawable,
+        conky_window.visual, conky_window.width, conky_window.height)
+    local cr = cairo_create(cs)
+    run(cr, f)
+    f:close()
+    cairo_destroy(cr)
+    cairo_surface_destroy(cs)
+end
@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+"""Общие файлы выполнения TERRA UI: каталог пользователя, слоты вывода, строки для conky.
+
+Каждый виджет пишет кадры в фиксированное кольцо из SLOT_COUNT файлов
+(<name>_0.png ... <name>_N.png). Кадр сначала пишется во временный файл
+и публикуется атомарным переименованием, поэтому conky не видит
+недописанных PNG, а смена имени слота сбрасывает его кэш картинок.
+Никаких сканирований /tmp и бесконечно растущих имён.
+
+Несколько экземпляров (например, conky на каждом мониторе) различаются по
+TERRA_INSTANCE: у каждого свои имена вывода (<виджет>@<экземпляр>) и своя
+раскладка из INSTANCES, а общий terra_sampler.py публикует метрики, погоду
+и трек в снимок <name>.snapshot, который все экземпляры только читают.
+
+Быстрый режим кодирования (FAST_ENCODE) обрезает кадр по непрозрачному
+содержимому и пишет PNG с уровнем сжатия PNG_COMPRESS_LEVEL: файл читается
+conky один раз, тратить CPU на zlib по умолчанию незачем.
+"""
+import fcntl
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SLOT_COUNT = 4
+
+# Кадры живут в памяти: $XDG_RUNTIME_DIR, иначе /dev/shm, и только потом /tmp
+if os.environ.get("XDG_RUNTIME_DIR"):
+    RUNTIME_DIR = os.path.join(os.environ["XDG_RUNTIME_DIR"], "terra-ui")
+elif os.path.isdir("/dev/shm"):
+    RUNTIME_DIR = f"/dev/shm/terra-ui-{os.getuid()}"
+else:
+    RUNTIME_DIR = f"/tmp/terra-ui-{os.getuid()}"
+
+# TERRA_FAST_ENCODE=0 возвращает прежний surface.write_to_png для сравнения
+FAST_ENCODE = os.environ.get("TERRA_FAST_ENCODE", "1") != "0"
+PNG_COMPRESS_LEVEL = 1
+
+# Время кодирования и записанные байты по виджетам: {"frames", "encode_sec", "bytes"}
+ENCODE_STATS = {}
+
+# Долгоживущие кэши (атласы, растровые иконки) переживают перезагрузку
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "terra-ui"
+)
+
+# Обычная раскладка (без компоновщика): погода с y=300, по строке высотой
+# WEATHER_ROW_HEIGHT на город, под ней кольца и Spotify. WEATHER_ROWS — сколько
+# строк погоды помещается над кольцами: кольца и Spotify сдвигаются вниз на
+# лишние строки, а погода рисует не больше WEATHER_ROWS городов. Для двух
+# городов в weather_smart.LOCATIONS поставьте WEATHER_ROWS = 2.
+WEATHER_ROWS = 1
+WEATHER_ROW_HEIGHT = 100
+
+# Экземпляр TERRA UI и его раскладка: сдвиг и масштаб всех виджетов, например
+# INSTANCES = {"laptop": {"dx": 0, "dy": -100, "scale": 0.75}}
+INSTANCE = os.environ.get("TERRA_INSTANCE", "")
+INSTANCES = {}
+
+# Снимок общего сэмплера: заголовок (seq, время публикации, длина, версия
+# формата) и JSON. Нечётный seq — идёт запись; читатель повторяет чтение,
+# если seq изменился. Снимок другого размера или версии не читается.
+SNAPSHOT_SIZE = 256 * 1024
+SNAPSHOT_HEADER = struct.Struct("<QdII")
+SNAPSHOT_VERSION = 1
+SAMPLER_SNAPSHOT = "sampler"
+# Более старый снимок считается брошенным: виджеты опрашивают всё сами
+SAMPLER_MAX_AGE = 3.0
+
+# Палитра обложки текущего трека (spotify_cover.COVER_COLORS): общая для всех
+# экземпляров, кольца и погода берут из неё акцент (ACCENT_FROM_COVER)
+PALETTE_FILE = "cover_palette.json"
+
+_dir_ready = False
+_cache_ready = False
+_slot_index = {}
+_snapshots = {}
+_palette = (None, None)
+
+
+def runtime_path(filename):
+    global _dir_ready
+    if not _dir_ready:
+        os.makedirs(RUNTIME_DIR, mode=0o700, exist_ok=True)
+        _dir_ready = True
+    return os.path.join(RUNTIME_DIR, filename)
+
+
+def cache_path(filename):
+    global _cache_ready
+    if not _cache_ready:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        _cache_ready = True
+    return os.path.join(CACHE_DIR, filename)
+
+
+def atomic_write(path, data):
+    mode = "wb" if isinstance(data, bytes) else "w"
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, mode) as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def atomic_write_with(path, write_fn):
+    """Вызывает write_fn(tmp_path) и атомарно переименовывает результат в path."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        write_fn(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return path
+
+
+def instance_name(name):
+    return f"{name}@{INSTANCE}" if INSTANCE else name
+
+
+def below_weather(y):
+    """y виджета под погодой: сдвиг на строки погоды сверх первой."""
+    return y + (max(1, WEATHER_ROWS) - 1) * WEATHER_ROW_HEIGHT
+
+
+def instance_layout():
+    layout = {"dx": 0, "dy": 0, "scale": 1.0}
+    layout.update(INSTANCES.get(INSTANCE, {}))
+    return layout
+
+
+def image_line(path, x, y, width, height):
+    """Строка ${image ...} с учётом сдвига и масштаба экземпляра (масштабирует conky)."""
+    layout = instance_layout()
+    scale = layout["scale"]
+    px = round(layout["dx"] + x * scale)
+    py = round(layout["dy"] + y * scale)
+    return f"${{image {path} -p {px},{py} -s {round(width * scale)}x{round(height * scale)}}}"
+
+
+def snapshot_map(name, writable):
+    key = (name, writable)
+    mm = _snapshots.get(key)
+    if mm is None:
+        path = runtime_path(f"{name}.snapshot")
+        fd = os.open(path, os.O_RDWR | os.O_CREAT if writable else os.O_RDONLY, 0o600)
+        try:
+            if writable:
+                if os.fstat(fd).st_size != SNAPSHOT_SIZE:
+                    os.ftruncate(fd, SNAPSHOT_SIZE)
+                mm = mmap.mmap(fd, SNAPSHOT_SIZE)
+            else:
+                if os.fstat(fd).st_size != SNAPSHOT_SIZE:
+                    return None
+                mm = mmap.mmap(fd, SNAPSHOT_SIZE, prot=mmap.PROT_READ)
+        finally:
+            os.close(fd)
+        _snapshots[key] = mm
+    return mm
+
+
+def write_snapshot(name, data):
+    payload = json.dumps(data, separators=(",", ":")).encode()
+    if len(payload) > SNAPSHOT_SIZE - SNAPSHOT_HEADER.size:
+        raise ValueError(f"snapshot {name} is too large: {len(payload)} bytes")
+    mm = snapshot_map(name, True)
+    seq = SNAPSHOT_HEADER.unpack_from(mm)[0]
+    seq += 1 if seq % 2 == 0 else 2
+    struct.pack_into("<Q", mm, 0, seq)
+    mm[SNAPSHOT_HEADER.size : SNAPSHOT_HEADER.size + len(payload)] = payload
+    SNAPSHOT_HEADER.pack_into(mm, 0, seq + 1, time.time(), len(payload), SNAPSHOT_VERSION)
+
+
+def read_snapshot(name, max_age=SAMPLER_MAX_AGE):
+    """Последний снимок name или None, если его нет, он пишется или устарел."""
+    try:
+        mm = snapshot_map(name, False)
+    except OSError:
+        return None
+    if mm is None:
+        return None
+    for attempt in range(5):
+        if attempt:
+            time.sleep(0.001)
+        seq, published_at, length, version = SNAPSHOT_HEADER.unpack_from(mm)
+        if seq == 0 or version != SNAPSHOT_VERSION:
+            return None
+        if length > SNAPSHOT_SIZE - SNAPSHOT_HEADER.size:
+            return None
+        if seq % 2:
+            continue
+        payload = mm[SNAPSHOT_HEADER.size : SNAPSHOT_HEADER.size + length]
+        if SNAPSHOT_HEADER.unpack_from(mm)[0] != seq:
+            continue
+        if time.time() - published_at > max_age:
+            return None
+        try:
+            return json.loads(payload)
+        except ValueError:
+            return None
+    return None
+
+
+def read_sampler():
+    return read_snapshot(SAMPLER_SNAPSHOT)
+
+
+def publish_palette(palette):
+    atomic_write(runtime_path(PALETTE_FILE), json.dumps(palette))
+
+
+def retract_palette():
+    # Трека больше нет: кольца и погода возвращаются к своим цветам
+    try:
+        os.remove(runtime_path(PALETTE_FILE))
+    except FileNotFoundError:
+        pass
+
+
+def read_palette():
+    """Последняя опубликованная палитра {"colors", "accent", "secondary"} или None."""
+    global _palette
+    path = runtime_path(PALETTE_FILE)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+        if _palette[0] != mtime:
+            with open(path, "r") as f:
+                _palette = (mtime, json.load(f))
+    except (OSError, ValueError):
+        return None
+    return _palette[1]
+
+
+def palette_color(role, default):
+    # Цвет роли палитры как кортеж (r, g, b) 0..1; без палитры — default
+    palette = read_palette()
+    if palette and palette.get(role):
+        return tuple(palette[role])
+    return default
+
+
+def next_slot_path(name, ext="png"):
+    # Индекс слота хранится в памяти (демон) и в крошечном файле (одиночный запуск)
+    index_file = runtime_path(f"{name}.slot")
+    idx = _slot_index.get(name)
+    if idx is None:
+        try:
+            with open(index_file, "r") as f:
+                idx = int(f.read().strip())
+        except (OSError, ValueError):
+            idx = -1
+    idx = (idx + 1) % SLOT_COUNT
+    _slot_index[name] = idx
+    try:
+        with open(index_file, "w") as f:
+            f.write(str(idx))
+    except OSError:
+        pass
+    return runtime_path(f"{name}_{idx}.{ext}")
+
+
+def publish_file(name, write_fn, ext="png"):
+    """Пишет кадр через write_fn(tmp_path) и атомарно публикует его в следующий слот."""
+    return atomic_write_with(next_slot_path(name, ext), write_fn)
+
+
+def publish_surface(name, surface):
+    return publish_file(name, surface.write_to_png)
+
+
+def png_chunk(kind, data):
+    body = kind + data
+    return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+
+def content_bbox(data, width, height, stride):
+    """(x, y, w, h) непрозрачного содержимого ARGB32-буфера или None, если он пуст."""
+    a_off = 3 if sys.byteorder == "little" else 0
+    top = left = None
+    bottom = right = 0
+    for y in range(height):
+        start = y * stride + a_off
+        alpha = data[start : start + width * 4 : 4]
+        stripped = alpha.lstrip(b"\x00")
+        if not stripped:
+            continue
+        x0 = width - len(stripped)
+        x1 = len(alpha.rstrip(b"\x00"))
+        if top is None:
+            top, left, right = y, x0, x1
+        left, right, bottom = min(left, x0), max(right, x1), y + 1
+    if top is None:
+        return None
+    return left, top, right - left, bottom - top
+
+
+def unpremultiply_rows(data, stride, bbox):
+    # cairo хранит премультиплицированный BGRA/ARGB в порядке байт машины, PNG — RGBA
+    x, y, w, h = bbox
+    if np is not None:
+        arr = np.frombuffer(data, dtype=np.uint8).reshape(-1, stride)
+        arr = arr[y : y + h, x * 4 : (x + w) * 4].reshape(h, w, 4)
+        order = [2, 1, 0, 3] if sys.byteorder == "little" else [1, 2, 3, 0]
+        rgba = arr[..., order].astype(np.uint16)
+        alpha = rgba[..., 3:4]
+        partial = (alpha > 0) & (alpha < 255)
+        rgb = np.where(partial, np.minimum(255, rgba[..., :3] * 255 // np.maximum(alpha, 1)), rgba[..., :3])
+        out = np.empty((h, w * 4 + 1), dtype=np.uint8)
+        out[:, 0] = 0
+        out[:, 1:] = np.concatenate([rgb, alpha], axis=2).reshape(h, w * 4)
+        return out.tobytes()
+
+    little = sys.byteorder == "little"
+    rows = []
+    for row_y in range(y, y + h):
+        start = row_y * stride + x * 4
+        src = data[start : start + w * 4]
+        out = bytearray(len(src))
+        if little:
+            out[0::4], out[1::4], out[2::4], out[3::4] = src[2::4], src[1::4], src[0::4], src[3::4]
+        else:
+            out[0::4], out[1::4], out[2::4], out[3::4] = src[1::4], src[2::4], src[3::4], src[0::4]
+        alpha = out[3::4]
+        # Полупрозрачные пиксели есть только на краях сглаживания
+        if alpha.translate(None, b"\x00\xff"):
+            for i, a in enumerate(alpha):
+                if 0 < a < 255:
+                    j = i * 4
+                    out[j] = min(255, out[j] * 255 // a)
+                    out[j + 1] = min(255, out[j + 1] * 255 // a)
+                    out[j + 2] = min(255, out[j + 2] * 255 // a)
+        rows.append(b"\x00" + bytes(out))
+    return b"".join(rows)
+
+
+def encode_png_fast(surface, level=PNG_COMPRESS_LEVEL, rect=None):
+    """PNG, обрезанный по содержимому: (байты, (x, y, w, h) внутри поверхности).
+
+    rect — кодировать ровно этот прямоугольник (например, грязную область
+    кадра) без поиска содержимого и без копии остальной поверхности.
+    """
+    surface.flush()
+    width, height = surface.get_width(), surface.get_height()
+    stride = surface.get_stride()
+
+    if rect is not None:
+        x, y, w, h = rect
+        x, y = max(0, int(x)), max(0, int(y))
+        w, h = max(1, min(int(w), width - x)), max(1, min(int(h), height - y))
+        data = bytes(surface.get_data()[y * stride : (y + h) * stride])
+        bbox = (x, y, w, h)
+        raw = unpremultiply_rows(data, stride, (x, 0, w, h))
+    else:
+        data = bytes(surface.get_data())
+        bbox = content_bbox(data, width, height, stride) or (0, 0, 1, 1)
+        raw = unpremultiply_rows(data, stride, bbox)
+    header = struct.pack(">IIBBBBB", bbox[2], bbox[3], 8, 6, 0, 0, 0)
+    png = (
+        b"\x89PNG\r\n\x1a\n"
+        + png_chunk(b"IHDR", header)
+        + png_chunk(b"IDAT", zlib.compress(raw, level))
+        + png_chunk(b"IEND", b"")
+    )
+    return png, bbox
+
+
+def record_encode(name, seconds, size):
+    stats = ENCODE_STATS.setdefault(name, {"frames": 0, "encode_sec": 0.0, "bytes": 0})
+    stats["frames"] += 1
+    stats["encode_sec"] += seconds
+    stats["bytes"] += size
+
+
+def publish_image(name, surface, x, y, rect=None):
+    """Публикует кадр в слот и возвращает (путь, строка ${image ...} для conky).
+
+    rect=(x, y, w, h) — опубликовать только этот прямоугольник поверхности.
+    """
+    started = time.perf_counter()
+    if FAST_ENCODE:
+        png, (bx, by, bw, bh) = encode_png_fast(surface, rect=rect)
+
+        def write_png(tmp_path):
+            with open(tmp_path, "wb") as f:
+                f.write(png)
+
+        path = publish_file(name, write_png)
+        record_encode(name, time.perf_counter() - started, len(png))
+        return path, image_line(path, x + bx, y + by, bw, bh)
+
+    if rect is not None:
+        rx, ry, width, height = rect
+        path = publish_surface(name, surface.create_for_rectangle(rx, ry, width, height))
+        record_encode(name, time.perf_counter() - started, os.path.getsize(path))
+        return path, image_line(path, x + rx, y + ry, width, height)
+    path = publish_surface(name, surface)
+    record_encode(name, time.perf_counter() - started, os.path.getsize(path))
+    width, height = surface.get_width(), surface.get_height()
+    return path, image_line(path, x, y, width, height)
+
+
+def line_path(name):
+    return runtime_path(f"{name}.line")
+
+
+def publish_line(name, line):
+    # terra_client.sh читает этот файл: переименование гарантирует целую строку
+    atomic_write(line_path(name), line + "\n")
+
+
+def acquire_lock(name):
+    # Второй экземпляр (например, от соседнего conky) получает None и выходит
+    lock = open(runtime_path(f"{name}.pid"), "a+")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return None
+    lock.seek(0)
+    lock.truncate()
+    lock.write(str(os.getpid()))
+    lock.flush()
+    return lock
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Общий сэмплер для нескольких экземпляров TERRA UI (например, по conky на монитор).
+
+Один процесс опрашивает провайдеры метрик колец, читает погоду из кэша
+(и сам запускает её обновление) и слушает playerctl --follow, а результат
+раз в INTERVAL публикует в снимок terra_runtime (mmap, seqlock). Виджеты
+экземпляров (TERRA_INSTANCE) рисуют только из снимка, со своей раскладкой
+и своими именами вывода; если снимок устарел, они опрашивают всё сами.
+
+terra_client.sh поднимает сэмплер сам, когда задан экземпляр:
+
+    TERRA_INSTANCE=left conky -c terra-ui.conf
+"""
+import argparse
+import threading
+import time
+
+import spotify_cover
+import system_rings
+import terra_runtime
+import weather_smart
+
+INTERVAL = 1.0
+WEATHER_INTERVAL = 60
+
+_spotify = {"data": None}
+
+
+def follow_spotify():
+    while True:
+        try:
+            for data in spotify_cover.follow_metadata():
+                _spotify["data"] = data
+        except OSError:
+            pass
+        _spotify["data"] = None
+        time.sleep(spotify_cover.LISTENER_RESTART_DELAY)
+
+
+def run_daemon():
+    lock = terra_runtime.acquire_lock("terra_sampler")
+    if lock is None:
+        return
+
+    # Первый снимок счётчиков: дальше CPU считается за интервал между тиками
+    system_rings.sample_cpu_delta(persist=False)
+    threading.Thread(target=follow_spotify, daemon=True).start()
+
+    weather, weather_due = None, 0.0
+    while True:
+        started = time.monotonic()
+        snapshot = {}
+        try:
+            stats = system_rings.get_stats(persist=False)
+            snapshot["metrics"] = stats
+            if system_rings.HISTORY:
+                system_rings.record_history(stats)
+        except Exception:
+            pass
+        if started >= weather_due:
+            weather_due = started + WEATHER_INTERVAL
+            try:
+                weather = weather_smart.weather_rows()
+            except Exception:
+                weather = None
+        if weather:
+            snapshot["weather"] = weather
+        snapshot["spotify"] = _spotify["data"]
+
+        try:
+            terra_runtime.write_snapshot(terra_runtime.SAMPLER_SNAPSHOT, snapshot)
+        except (OSError, ValueError):
+            pass
+        time.sleep(max(0.0, INTERVAL - (time.monotonic() - started)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TERRA UI: общий сэмплер для экземпляров")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="работать постоянно и публиковать снимок для виджетов",
+    )
+    parser.add_argument(
+        "--print",
+        action="store_true",
+        help="напечатать текущий снимок и выйти",
+    )
+    args = parser.parse_args()
+
+    if args.daemon:
+        run_daemon()
+    elif args.print:
+        print(terra_runtime.read_sampler())
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
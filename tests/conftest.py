@@ -0,0 +1,27 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Модули виджетов лежат в корне репозитория; каталоги выполнения и кэша —
+# временные, чтобы тесты не трогали файлы работающего TERRA UI
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_sandbox = tempfile.mkdtemp(prefix="terra-tests-")
+os.environ["XDG_RUNTIME_DIR"] = os.path.join(_sandbox, "runtime")
+os.environ["XDG_CACHE_HOME"] = os.path.join(_sandbox, "cache")
+os.environ.pop("TERRA_INSTANCE", None)
+os.environ.pop("TERRA_INSTRUMENT", None)
+
+import benchmark  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def stand_in():
+    """Локальный сервер benchmark.py вместо Open-Meteo, ip-api и CDN обложек."""
+    server, base_url = benchmark.start_stand_in()
+    yield base_url
+    server.shutdown()
+    server.server_close()
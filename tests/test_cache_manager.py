@@ -0,0 +1,77 @@
+import json
+import os
+
+import pytest
+
+import cache_manager
+
+
+@pytest.fixture
+def cache(tmp_path):
+    (tmp_path / "raw_a").write_bytes(b"a" * 10)
+    manager = cache_manager.CacheManager(str(tmp_path), 1024, prefixes=("raw_",))
+    manager.add("raw_a")
+    return manager
+
+
+def manifest(manager):
+    with open(manager.manifest_path, "r") as f:
+        return json.load(f)
+
+
+def test_recent_hit_does_not_rewrite_manifest(cache):
+    before = os.stat(cache.manifest_path).st_mtime_ns
+    for _ in range(5):
+        assert cache.lookup("raw_a") == cache.path("raw_a")
+    assert os.stat(cache.manifest_path).st_mtime_ns == before
+    assert cache.stats()["hits"] == 5
+
+
+def test_old_access_time_is_persisted(cache):
+    cache.entries["raw_a"][1] -= cache_manager.ATIME_RESOLUTION_SEC + 1
+    cache._save()
+    old_atime = manifest(cache)["entries"]["raw_a"][1]
+    cache.lookup("raw_a")
+    saved = manifest(cache)
+    assert saved["entries"]["raw_a"][1] > old_atime
+    assert saved["counters"]["hits"] == 1
+
+
+def test_unsaved_counters_survive_other_writers(cache, tmp_path):
+    cache.lookup("raw_a")
+    cache.lookup("raw_missing")
+    (tmp_path / "raw_b").write_bytes(b"b")
+    other = cache_manager.CacheManager(str(tmp_path), 1024, prefixes=("raw_",))
+    other.add("raw_b")
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 2)
+    cache.add("raw_b")
+    assert manifest(cache)["counters"] == {"hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_missing_file_is_dropped_from_manifest(cache):
+    os.remove(cache.path("raw_a"))
+    assert cache.lookup("raw_a") is None
+    assert manifest(cache)["entries"] == {}
+
+
+def test_first_scan_is_saved_by_read_only_lookup(tmp_path, monkeypatch):
+    (tmp_path / "raw_old").write_bytes(b"x" * 5)
+    manager = cache_manager.CacheManager(str(tmp_path), 1024, prefixes=("raw_",))
+    assert manager.lookup("raw_old") == manager.path("raw_old")
+    assert manifest(manager)["entries"]["raw_old"][0] == 5
+
+    # Следующие процессы читают манифест и каталог больше не обходят
+    monkeypatch.setattr(os, "scandir", lambda path: pytest.fail("directory rescanned"))
+    other = cache_manager.CacheManager(str(tmp_path), 1024, prefixes=("raw_",))
+    assert other.lookup("raw_old") == other.path("raw_old")
+    assert other.stats()["entries"] == 1
+
+
+def test_corrupt_manifest_is_rebuilt_once(tmp_path, monkeypatch):
+    (tmp_path / "raw_a").write_bytes(b"a")
+    (tmp_path / "manifest.json").write_text("{not json")
+    manager = cache_manager.CacheManager(str(tmp_path), 1024, prefixes=("raw_",))
+    assert manager.stats()["entries"] == 1
+    assert list(manifest(manager)["entries"]) == ["raw_a"]
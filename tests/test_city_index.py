@@ -0,0 +1,124 @@
+import pytest
+
+import cache_manager
+import city_index
+
+ZONE_TAB = """# tz zone descriptions
+DE\t+5230+01322\tEurope/Berlin
+IN\t+2232+08822\tAsia/Kolkata
+US\t+404251-0740023\tAmerica/New_York\tEastern (most areas)
+"""
+TZDATA_ZI = """# version 2024a
+Z Europe/Berlin 0:53:28 - LMT 1893 Ap
+L Asia/Kolkata Asia/Calcutta
+L Etc/UTC UTC
+"""
+
+
+@pytest.fixture
+def index(tmp_path):
+    """Индекс из маленькой базы поясов и своего TSV; путь к файлу индекса."""
+    zoneinfo = tmp_path / "zoneinfo"
+    zoneinfo.mkdir()
+    (zoneinfo / "zone.tab").write_text(ZONE_TAB)
+    (zoneinfo / "tzdata.zi").write_text(TZDATA_ZI)
+    tsv = tmp_path / "cities.tsv"
+    tsv.write_text(
+        "# свои города\n"
+        "Berlin\t1.0\t2.0\n"
+        f"{'x' * (city_index.KEY_SIZE + 1)}\t3.0\t4.0\n"
+        "Novosibirsk\t55.03\t82.92\n"
+    )
+    records = city_index.tsv_records(str(tsv)) + city_index.zone_records(str(zoneinfo))
+    path = tmp_path / "cities.idx"
+    path.write_bytes(city_index.build(records))
+    yield str(path)
+    mm = city_index._index.pop(str(path), None)
+    if mm is not None:
+        mm.close()
+
+
+def test_records_are_fixed_size_and_sorted(index):
+    with open(index, "rb") as f:
+        data = f.read()
+    assert city_index.RECORD_SIZE == 58
+    assert len(data) % city_index.RECORD_SIZE == 0
+    keys = [
+        data[i : i + city_index.KEY_SIZE].rstrip(b" ")
+        for i in range(0, len(data), city_index.RECORD_SIZE)
+    ]
+    assert keys == sorted(keys)
+    assert b"europe/berlin" in keys and b"new york" in keys
+
+
+def test_lookup_zone_and_city(index):
+    assert city_index.lookup("Europe/Berlin", index) == (52.5, pytest.approx(13.367, abs=1e-3))
+    assert city_index.lookup("Novosibirsk", index) == (55.03, 82.92)
+    # iso6709 с секундами: +404251-0740023
+    lat, lon = city_index.lookup("America/New_York", index)
+    assert lat == pytest.approx(40.714, abs=1e-3) and lon == pytest.approx(-74.006, abs=1e-3)
+
+
+def test_own_cities_override_zone_cities(index):
+    assert city_index.lookup("berlin", index) == (1.0, 2.0)
+
+
+def test_lookup_normalizes_case_spaces_and_underscores(index):
+    expected = city_index.lookup("new york", index)
+    assert expected is not None
+    for name in ("New York", "  NEW   york ", "New_York"):
+        assert city_index.lookup(name, index) == expected
+
+
+def test_timezone_alias_resolves_to_target(index):
+    assert city_index.lookup("Asia/Calcutta", index) == city_index.lookup("Asia/Kolkata", index)
+    assert city_index.lookup("Calcutta", index) == city_index.lookup("Kolkata", index)
+
+
+def test_misses(index):
+    assert city_index.lookup("Atlantis", index) is None
+    assert city_index.lookup("", index) is None
+    # Ссылка на пояс без координат в zone.tab в индекс не попадает
+    assert city_index.lookup("Etc/UTC", index) is None
+    assert city_index.lookup("UTC", index) is None
+
+
+def test_key_longer_than_record_field(index):
+    long_name = "x" * (city_index.KEY_SIZE + 1)
+    assert city_index.lookup(long_name, index) is None
+    # Ключ ровно на всё поле ещё помещается
+    records = [("y" * city_index.KEY_SIZE, (1.0, 2.0))]
+    assert len(city_index.build(records)) == city_index.RECORD_SIZE
+
+
+def test_corrupt_index_is_rejected(tmp_path):
+    path = tmp_path / "broken.idx"
+    path.write_bytes(b"x" * (city_index.RECORD_SIZE + 3))
+    with pytest.raises(ValueError):
+        city_index.lookup("berlin", str(path))
+
+
+def test_unknown_timezone_falls_back_to_ip(index, monkeypatch, tmp_path, stand_in):
+    pytest.importorskip("cairo")
+    import terra_runtime
+    import weather_smart
+
+    lookup = city_index.lookup
+    monkeypatch.setattr(city_index, "lookup", lambda name: lookup(name, index))
+    monkeypatch.setenv("TZ", "Etc/UTC")
+    monkeypatch.setattr(weather_smart, "LOCATION_CITY", "")
+    monkeypatch.setattr(weather_smart, "DEBUG", False)
+    monkeypatch.setattr(weather_smart, "IP_API_URL", f"{stand_in}/json/")
+    monkeypatch.setattr(terra_runtime, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(terra_runtime, "_cache_ready", False)
+    monkeypatch.setattr(
+        weather_smart,
+        "WEATHER_CACHE",
+        cache_manager.CacheManager(str(tmp_path), weather_smart.WEATHER_CACHE_BUDGET_BYTES),
+    )
+
+    assert weather_smart.get_location_offline() is None
+    assert weather_smart.get_coords() == ("52.54", "85.21")
+
+    monkeypatch.setenv("TZ", "Asia/Calcutta")
+    assert weather_smart.get_coords() == tuple(map(str, lookup("Asia/Kolkata", index)))
@@ -0,0 +1,204 @@
+import json
+import os
+import socket
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("cairo")
+
+import benchmark
+import cache_manager
+import spotify_cover
+import terra_runtime
+
+
+@pytest.fixture
+def covers(monkeypatch, tmp_path):
+    """spotify_cover с пустыми кэшем обложек и каталогом выполнения, без keep-alive соединений."""
+    monkeypatch.setattr(spotify_cover, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(
+        spotify_cover,
+        "COVER_CACHE",
+        cache_manager.CacheManager(str(tmp_path), spotify_cover.CACHE_BUDGET_BYTES),
+    )
+    monkeypatch.setattr(spotify_cover, "_connections", {})
+    monkeypatch.setattr(terra_runtime, "RUNTIME_DIR", str(tmp_path / "runtime"))
+    monkeypatch.setattr(terra_runtime, "_dir_ready", False)
+    return tmp_path
+
+
+@pytest.fixture
+def stalled_server():
+    """Принимает соединения и молчит: так выглядит зависший CDN."""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    held = []
+    stop = threading.Event()
+
+    def accept():
+        server.settimeout(0.1)
+        while not stop.is_set():
+            try:
+                held.append(server.accept()[0])
+            except OSError:
+                pass
+
+    thread = threading.Thread(target=accept, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.getsockname()[1]}"
+    stop.set()
+    thread.join()
+    for conn in held:
+        conn.close()
+    server.close()
+
+
+@pytest.fixture
+def dripping_server():
+    """Отвечает на запрос, но отдаёт тело по байту: каждый read успевает в таймаут."""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    stop = threading.Event()
+
+    def serve():
+        conn, _ = server.accept()
+        with conn:
+            conn.recv(65536)
+            conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 1000\r\n\r\n\x89PNG")
+            while not stop.wait(0.05):
+                try:
+                    conn.sendall(b"\x00")
+                except OSError:
+                    break
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.getsockname()[1]}"
+    stop.set()
+    thread.join()
+    server.close()
+
+
+def cover_files(directory):
+    return sorted(
+        name
+        for name in os.listdir(directory)
+        if not name.startswith("manifest") and name != "runtime"
+    )
+
+
+def test_download_writes_valid_cover_and_registers_it(covers, stand_in):
+    url = f"{stand_in}/cover.png"
+    path = spotify_cover.download_cover(url)
+    assert path == spotify_cover.cover_path(url)
+    with open(path, "rb") as f:
+        assert f.read() == benchmark.StandInHandler.cover
+    assert spotify_cover.cached_cover(url) == path
+    assert cover_files(covers) == [os.path.basename(path)]
+
+
+def test_download_renames_complete_file_into_place(covers, stand_in, monkeypatch):
+    url = f"{stand_in}/cover.png"
+    final_path = spotify_cover.cover_path(url)
+    renames = []
+    replace = os.replace
+
+    def recording_replace(src, dst):
+        # В момент переименования итогового файла ещё нет, а временный уже полный
+        if dst == final_path:
+            assert not os.path.exists(dst)
+        with open(src, "rb") as f:
+            renames.append((src, dst, f.read()))
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", recording_replace)
+    spotify_cover.download_cover(url)
+    covers_renamed = [r for r in renames if r[1] == final_path]
+    assert len(covers_renamed) == 1
+    src, _, data = covers_renamed[0]
+    assert src != final_path and src.endswith(".tmp")
+    assert data == benchmark.StandInHandler.cover
+
+
+def test_truncated_cover_is_not_cached(covers, stand_in, monkeypatch):
+    monkeypatch.setattr(benchmark.StandInHandler, "cover", b"\xff\xd8\xff\xe0" + b"\x00" * 512)
+    url = f"{stand_in}/cover.png"
+    assert spotify_cover.download_cover(url) is None
+    assert cover_files(covers) == []
+    assert spotify_cover.cached_cover(url) is None
+
+
+def test_stalled_download_times_out(covers, stalled_server, monkeypatch):
+    monkeypatch.setattr(spotify_cover, "COVER_TIMEOUT_SEC", 0.2)
+    started = time.monotonic()
+    assert spotify_cover.download_cover(f"{stalled_server}/cover.png") is None
+    assert time.monotonic() - started < 2
+    assert cover_files(covers) == []
+
+
+def test_slow_download_stops_at_deadline(covers, dripping_server, monkeypatch):
+    monkeypatch.setattr(spotify_cover, "COVER_TIMEOUT_SEC", 0.5)
+    monkeypatch.setattr(spotify_cover, "COVER_DEADLINE_SEC", 0.5)
+    started = time.monotonic()
+    assert spotify_cover.download_cover(f"{dripping_server}/cover.png") is None
+    assert time.monotonic() - started < 2
+    assert cover_files(covers) == []
+
+
+def test_cached_cover_is_not_downloaded_again(covers, stand_in, monkeypatch):
+    url = f"{stand_in}/cover.png"
+    path = spotify_cover.download_cover(url)
+    monkeypatch.setattr(spotify_cover, "fetch_bytes", lambda url: pytest.fail("downloaded twice"))
+    assert spotify_cover.download_cover(url) == path
+
+
+def test_existing_cover_is_registered(covers, monkeypatch):
+    url = "http://covers/existing.jpg"
+    path = spotify_cover.cover_path(url)
+    with open(path, "wb") as f:
+        f.write(benchmark.make_png(4))
+    monkeypatch.setattr(spotify_cover, "fetch_bytes", lambda url: pytest.fail("downloaded"))
+    assert spotify_cover.cached_cover(url) is None
+    assert spotify_cover.download_cover(url) == path
+    assert spotify_cover.cached_cover(url) == path
+
+
+def test_failing_cover_is_not_refetched_until_backoff_expires(covers, stand_in, monkeypatch):
+    url = f"{stand_in}/missing.png"
+    spawned = []
+    monkeypatch.setattr(spotify_cover, "spawn_cover_fetch", spawned.append)
+    data = ["Playing", url, "Title", "Artist"]
+
+    assert spotify_cover.download_cover(url) is None
+    for _ in range(3):
+        spotify_cover.render_composite(data)
+    assert spawned == []
+
+    failure = spotify_cover.read_cover_failure(url)
+    failure["failed_at"] -= spotify_cover.COVER_RETRY_SEC
+    terra_runtime.atomic_write(spotify_cover.failure_path(url), json.dumps(failure))
+    spotify_cover.render_composite(data)
+    assert spawned == [url]
+
+
+def test_repeated_failures_double_the_backoff(covers, stand_in):
+    url = f"{stand_in}/missing.png"
+    spotify_cover.download_cover(url)
+    spotify_cover.download_cover(url)
+    failure = spotify_cover.read_cover_failure(url)
+    assert failure["failures"] == 2
+    failure["failed_at"] -= spotify_cover.COVER_RETRY_SEC
+    terra_runtime.atomic_write(spotify_cover.failure_path(url), json.dumps(failure))
+    assert spotify_cover.cover_backed_off(url)
+
+
+def test_successful_download_clears_failure(covers, stand_in):
+    url = f"{stand_in}/cover.png"
+    spotify_cover.record_cover_failure(url)
+    assert spotify_cover.download_cover(url)
+    assert spotify_cover.read_cover_failure(url) is None
+    assert not spotify_cover.cover_backed_off(url)
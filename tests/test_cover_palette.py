@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip("cairo")
+
+import cache_manager
+import spotify_cover
+import terra_runtime
+
+PALETTE = {"colors": [[0.9, 0.2, 0.1]], "accent": [0.9, 0.2, 0.1], "secondary": [0.5, 0.1, 0.05]}
+
+
+@pytest.fixture
+def palette(monkeypatch, tmp_path):
+    """Опубликованная палитра прошлого трека и кэш обложек во временном каталоге."""
+    monkeypatch.setattr(spotify_cover, "COVER_COLORS", True)
+    monkeypatch.setattr(spotify_cover, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(
+        spotify_cover,
+        "COVER_CACHE",
+        cache_manager.CacheManager(str(tmp_path), spotify_cover.CACHE_BUDGET_BYTES),
+    )
+    terra_runtime.publish_palette(PALETTE)
+    yield
+    terra_runtime.retract_palette()
+
+
+@pytest.mark.parametrize(
+    "data", [None, [], ["Stopped", "", "Title", "Artist"]], ids=["no-player", "empty", "stopped"]
+)
+def test_palette_is_retracted_without_track(palette, data):
+    assert terra_runtime.read_palette() == PALETTE
+    assert spotify_cover.render_composite(data) is None
+    assert terra_runtime.read_palette() is None
+    assert terra_runtime.palette_color("accent", (1, 1, 1)) == (1, 1, 1)
+
+
+def test_paused_track_keeps_palette(palette):
+    assert spotify_cover.render_composite(["Paused", "", "Title", "Artist"])
+    assert terra_runtime.read_palette() == PALETTE
+
+
+def test_palette_stays_when_cover_colors_are_off(palette, monkeypatch):
+    monkeypatch.setattr(spotify_cover, "COVER_COLORS", False)
+    spotify_cover.render_composite(None)
+    assert terra_runtime.read_palette() == PALETTE
@@ -0,0 +1,80 @@
+import os
+import re
+
+import pytest
+
+pytest.importorskip("cairo")
+
+import system_rings
+
+from conftest import ROOT
+
+GOLDEN_DIR = os.path.join(ROOT, "tests", "golden")
+
+
+def golden(name):
+    with open(os.path.join(GOLDEN_DIR, name), "r") as f:
+        return f.read()
+
+
+def lua_ops():
+    """Команды terra_rings.lua: описанные в шапке и число чисел, которое читает run()."""
+    with open(os.path.join(ROOT, "terra_rings.lua"), "r") as f:
+        source = f.read()
+    header = source.split("]]", 1)[0]
+    documented = set(re.findall(r"^\s{7}(\w+) ", header, re.M))
+    counts = {
+        op: int(n)
+        for op, n in re.findall(r"op == '(\w+)' then\s+local v[^=]*= numbers\(rest, (\d+)\)", source)
+    }
+    return documented, counts
+
+
+def check_against_lua(text):
+    documented, counts = lua_ops()
+    for line in text.splitlines():
+        op, _, rest = line.partition(" ")
+        assert op in documented, line
+        fields = rest.split()
+        if op == "arc":
+            assert len(fields) == counts["arc"], line
+        elif op == "poly":
+            assert len(fields) >= counts["poly"] + 4 and (len(fields) - counts["poly"]) % 2 == 0, line
+        elif op == "text":
+            assert fields[counts["text"]] in ("Bold", "Medium"), line
+            assert len(fields) > counts["text"] + 5, line
+        elif op in counts:
+            assert len(fields) == counts[op], line
+        if op != "font":
+            numeric = fields if op != "text" else fields[:3] + fields[4:8]
+            for value in numeric:
+                float(value)
+
+
+def test_draw_list_matches_golden():
+    text = system_rings.draw_list((12, 40, 71), layout=system_rings.NEUTRAL_LAYOUT)
+    assert text == golden("draw_list_12_40_71.txt")
+    check_against_lua(text)
+
+
+def test_draw_list_sparklines_match_golden():
+    sparks = [(10, 50, 90), (), (0, 100)]
+    text = system_rings.draw_list((0, 100, 55), sparks, layout=system_rings.NEUTRAL_LAYOUT)
+    assert text == golden("draw_list_sparks.txt")
+    check_against_lua(text)
+
+
+def test_draw_list_ignores_instance_without_explicit_layout(monkeypatch):
+    monkeypatch.setattr(system_rings.terra_runtime, "INSTANCE", "left")
+    monkeypatch.setattr(
+        system_rings.terra_runtime, "INSTANCES", {"left": {"dx": 10, "dy": -20, "scale": 0.5}}
+    )
+    assert system_rings.draw_list(
+        (12, 40, 71), layout=system_rings.NEUTRAL_LAYOUT
+    ) == golden("draw_list_12_40_71.txt")
+
+    text = system_rings.draw_list((12, 40, 71))
+    lines = text.splitlines()
+    assert lines[0] == "origin 85 180"
+    assert lines[1] == "scale 0.5"
+    check_against_lua(text)
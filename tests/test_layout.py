@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip("cairo")
+
+import spotify_cover
+import system_rings
+import terra_runtime
+import weather_smart
+
+WEATHER_Y = 300
+
+
+def test_default_standalone_layout():
+    assert (system_rings.ORIGIN_X, system_rings.ORIGIN_Y) == (150, 400)
+    assert (spotify_cover.LINE_X, spotify_cover.LINE_Y) == (170, 540)
+
+
+@pytest.mark.parametrize("rows", [1, 2, 3])
+def test_widgets_stack_below_weather_rows(monkeypatch, rows):
+    monkeypatch.setattr(terra_runtime, "WEATHER_ROWS", rows)
+    weather_bottom = WEATHER_Y + rows * weather_smart.IMG_HEIGHT
+    rings_y = terra_runtime.below_weather(400)
+    spotify_y = terra_runtime.below_weather(540)
+    assert weather_bottom <= rings_y
+    assert rings_y + system_rings.HEIGHT <= spotify_y
+
+
+def test_standalone_weather_is_capped_to_its_rows(monkeypatch):
+    published = []
+
+    def publish_image(name, surface, x, y, rect=None):
+        published.append((surface.get_height(), y))
+        return "", "line"
+
+    monkeypatch.setattr(terra_runtime, "publish_image", publish_image)
+    monkeypatch.setattr(weather_smart, "DEBUG", False)
+    rows = [(-3.4, 71, "Berlin · Snow", 1), (12.0, 3, "Rome · Overcast", 1)]
+
+    weather_smart.create_weather_image(rows)
+    monkeypatch.setattr(terra_runtime, "WEATHER_ROWS", 2)
+    weather_smart.create_weather_image(rows)
+    assert published == [(weather_smart.IMG_HEIGHT, WEATHER_Y), (2 * weather_smart.IMG_HEIGHT, WEATHER_Y)]
@@ -0,0 +1,43 @@
+import pytest
+
+import metric_history
+
+
+@pytest.fixture(params=["numpy", "python"])
+def history(request, monkeypatch, tmp_path):
+    """Кольцо на 8 записей после 11 тиков: окно заворачивается через конец файла."""
+    if request.param == "python":
+        monkeypatch.setattr(metric_history, "np", None)
+    elif metric_history.np is None:
+        pytest.skip("NumPy не установлен")
+    h = metric_history.MetricHistory(str(tmp_path / "history.bin"), ["cpu", "ram"], capacity=8)
+    for i in range(11):
+        h.append({"cpu": i * 1.5, "ram": 100 - i}, timestamp=1000 + i)
+    yield h
+    h.close()
+
+
+def test_summary_over_wrapped_window(history):
+    # В кольце остались тики 3..10
+    assert history.min("cpu") == 4.5
+    assert history.max("cpu") == 15.0
+    assert history.mean("cpu") == pytest.approx(9.75)
+    assert history.mean("ram") == pytest.approx(93.5)
+    assert history.percentile("ram", 50) == pytest.approx(93.5)
+
+
+def test_summary_over_count_and_time_windows(history):
+    assert history.min("cpu", count=3) == 12.0
+    assert history.max("ram", count=3) == 92.0
+    assert history.count_since(1008) == 3
+    assert history.mean("cpu", count=history.count_since(1008)) == pytest.approx(13.5)
+
+
+def test_empty_window_has_no_summary(tmp_path):
+    h = metric_history.MetricHistory(str(tmp_path / "empty.bin"), ["cpu"], capacity=4)
+    try:
+        assert h.min("cpu") is None
+        assert h.max("cpu") is None
+        assert h.mean("cpu") is None
+    finally:
+        h.close()
@@ -0,0 +1,153 @@
+import types
+
+import pytest
+
+pytest.importorskip("cairo")
+
+import benchmark
+import system_rings
+
+
+@pytest.fixture
+def rings(monkeypatch):
+    """system_rings с подставным psutil и пустым состоянием метрик."""
+    fake = benchmark.fake_psutil()
+    disk_usage = fake.disk_usage
+
+    def checked_disk_usage(path):
+        if path.startswith("/missing"):
+            raise FileNotFoundError(path)
+        return disk_usage(path)
+
+    fake.disk_usage = checked_disk_usage
+    monkeypatch.setattr(system_rings, "psutil", fake)
+    monkeypatch.setattr(system_rings, "_metric_state", None)
+    monkeypatch.setattr(system_rings, "_cpu_prev", None)
+    return system_rings
+
+
+@pytest.fixture
+def clock(rings, monkeypatch):
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(rings, "time", types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def counting(monkeypatch, family):
+    calls = []
+    provider = system_rings.PROVIDERS[family]
+
+    def sample(metrics, rates, now, persist):
+        calls.append(now)
+        return provider["sample"](metrics, rates, now, persist)
+
+    monkeypatch.setitem(system_rings.PROVIDERS, family, dict(provider, sample=sample))
+    return calls
+
+
+def test_bad_metric_name_only_zeroes_its_own_ring(rings, clock):
+    metrics = ["net", "net:wlan0", "diskio", "diskio:sdX", "ssd", "mount:/missing/x"]
+    rings.get_stats(persist=False, metrics=metrics)
+    # Счётчики подставного psutil растут с его тиком
+    rings.psutil.cpu_times()
+    clock.now += 1
+    stats = rings.get_stats(persist=False, metrics=metrics)
+    assert stats["net:wlan0"] == 0.0
+    assert stats["diskio:sdX"] == 0.0
+    assert stats["mount:/missing/x"] == 0.0
+    assert stats["net"] > 0
+    assert stats["diskio"] > 0
+    assert stats["ssd"] == 39.1
+
+
+def test_failed_provider_waits_for_its_interval(rings, clock, monkeypatch):
+    calls = []
+
+    def broken(metrics, rates, now, persist):
+        calls.append(now)
+        raise OSError("no sensor")
+
+    monkeypatch.setitem(rings.PROVIDERS, "thermal", {"interval": 5, "sample": broken})
+    for _ in range(6):
+        assert rings.get_stats(persist=False, metrics=["thermal"]) == {"thermal": 0.0}
+        clock.now += 1
+    assert calls == [1000.0, 1005.0]
+
+
+def test_providers_are_polled_on_their_interval(rings, clock, monkeypatch):
+    ram = counting(monkeypatch, "ram")
+    swap = counting(monkeypatch, "swap")
+    for step in (0, 1, 1.95, 3, 10):
+        clock.now = 1000.0 + step
+        rings.get_stats(persist=False, metrics=["ram", "swap"])
+    # 1.95 с — уже срок: тик плавает в пределах SCHEDULE_SLACK
+    assert ram == [1000.0, 1001.95, 1010.0]
+    assert swap == [1000.0, 1010.0]
+
+
+def test_new_metric_in_family_is_sampled_immediately(rings, clock, monkeypatch):
+    net = counting(monkeypatch, "net")
+    rings.get_stats(persist=False, metrics=["net"])
+    rings.get_stats(persist=False, metrics=["net", "net:eth0"])
+    assert len(net) == 2
+
+
+def cpu_times(*snapshots):
+    # [(total, idle), ...]: суммарный счётчик и два ядра
+    queue = list(snapshots)
+    return lambda: queue.pop(0)
+
+
+def test_delta_cpu_uses_interval_since_last_call(rings, monkeypatch):
+    monkeypatch.setattr(
+        rings,
+        "read_cpu_times",
+        cpu_times(
+            [(1000, 750), (500, 400), (500, 350)],
+            [(1200, 850), (600, 450), (600, 400)],
+        ),
+    )
+    cpu, cores = rings.sample_cpu_delta(persist=False)
+    # Первый вызов — среднее с загрузки
+    assert (cpu, cores) == (25.0, [20.0, 30.0])
+    cpu, cores = rings.sample_cpu_delta(persist=False)
+    assert (cpu, cores) == (50.0, [50.0, 50.0])
+
+
+def test_delta_cpu_persists_between_one_shot_runs(rings, monkeypatch):
+    monkeypatch.setattr(
+        rings,
+        "read_cpu_times",
+        cpu_times([(1000, 500), (1000, 500)], [(1100, 590), (1100, 590)]),
+    )
+    rings.sample_cpu_delta(persist=True)
+    # Новый процесс: снимок в памяти пропал, остался файл состояния
+    monkeypatch.setattr(rings, "_cpu_prev", None)
+    cpu, cores = rings.sample_cpu_delta(persist=True)
+    assert cpu == pytest.approx(10.0)
+    assert cores == [pytest.approx(10.0)]
+
+
+def test_counter_reset_gives_zero_rate(rings):
+    rates = {}
+    assert rings.counter_rate(rates, "net", 1000, 1.0) == 0.0
+    assert rings.counter_rate(rates, "net", 3000, 3.0) == 1000.0
+    assert rings.counter_rate(rates, "net", 10, 4.0) == 0.0
+
+
+def test_one_shot_frame_does_not_decode_atlas(rings, monkeypatch):
+    monkeypatch.setattr(rings, "_atlas", None)
+    monkeypatch.setattr(rings, "load_atlas", lambda: pytest.fail("atlas decoded"))
+    painted = []
+    monkeypatch.setattr(rings, "render_values", lambda ctx, values: painted.append(values))
+    rings.paint_frame(None, (12, 40, 71))
+    assert painted == [(12, 40, 71)]
+
+
+def test_daemon_frame_blits_resident_atlas(rings, monkeypatch):
+    monkeypatch.setattr(rings, "_atlas", (rings.atlas_key(), object()))
+    blitted = []
+    monkeypatch.setattr(rings, "blit_rings", lambda ctx, values: blitted.append(values))
+    monkeypatch.setattr(rings, "render_values", lambda ctx, values: pytest.fail("arcs drawn"))
+    rings.paint_frame(None, (12, 40, 71))
+    assert blitted == [(12, 40, 71)]
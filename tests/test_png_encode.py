@@ -0,0 +1,148 @@
+import struct
+import sys
+import zlib
+
+import pytest
+
+import terra_runtime
+
+
+class Surface:
+    """ARGB32-буфер в формате cairo (премультиплицированный, порядок байт машины)."""
+
+    def __init__(self, width, height, stride=None):
+        self.width, self.height = width, height
+        self.stride = stride or width * 4
+        self.data = bytearray(self.stride * height)
+
+    def set(self, x, y, r, g, b, a):
+        # r, g, b — уже умноженные на альфу, как у cairo
+        pixel = (b, g, r, a) if sys.byteorder == "little" else (a, r, g, b)
+        start = y * self.stride + x * 4
+        self.data[start : start + 4] = bytes(pixel)
+
+    def flush(self):
+        pass
+
+    def get_width(self):
+        return self.width
+
+    def get_height(self):
+        return self.height
+
+    def get_stride(self):
+        return self.stride
+
+    def get_data(self):
+        return memoryview(self.data)
+
+
+def decode_png(png):
+    """(ширина, высота, строки RGBA) без сторонних библиотек; фильтр строк — только 0."""
+    assert png[:8] == b"\x89PNG\r\n\x1a\n"
+    pos, chunks = 8, {}
+    while pos < len(png):
+        (length,) = struct.unpack(">I", png[pos : pos + 4])
+        kind = png[pos + 4 : pos + 8]
+        body = png[pos + 8 : pos + 8 + length]
+        (crc,) = struct.unpack(">I", png[pos + 8 + length : pos + 12 + length])
+        assert crc == zlib.crc32(kind + body)
+        chunks.setdefault(kind, b"")
+        chunks[kind] += body
+        pos += 12 + length
+    assert b"IEND" in chunks
+    width, height, depth, color, _, _, _ = struct.unpack(">IIBBBBB", chunks[b"IHDR"])
+    assert (depth, color) == (8, 6)
+    raw = zlib.decompress(chunks[b"IDAT"])
+    row_size = width * 4 + 1
+    assert len(raw) == row_size * height
+    rows = []
+    for y in range(height):
+        row = raw[y * row_size : (y + 1) * row_size]
+        assert row[0] == 0
+        rows.append([tuple(row[1 + i : 5 + i]) for i in range(0, width * 4, 4)])
+    return width, height, rows
+
+
+@pytest.fixture(params=["numpy", "python"])
+def encoder(request, monkeypatch):
+    if request.param == "python":
+        monkeypatch.setattr(terra_runtime, "np", None)
+    elif terra_runtime.np is None:
+        pytest.skip("NumPy не установлен")
+    return terra_runtime.encode_png_fast
+
+
+def test_opaque_and_partial_pixels_round_trip(encoder):
+    surface = Surface(3, 2, stride=16)
+    surface.set(0, 0, 255, 0, 0, 255)
+    surface.set(1, 0, 0, 128, 0, 128)
+    surface.set(2, 0, 32, 16, 8, 64)
+    surface.set(0, 1, 10, 20, 30, 255)
+    surface.set(1, 1, 0, 0, 1, 1)
+    surface.set(2, 1, 255, 255, 255, 255)
+    png, bbox = encoder(surface)
+    assert bbox == (0, 0, 3, 2)
+    assert decode_png(png) == (
+        3,
+        2,
+        [
+            [(255, 0, 0, 255), (0, 255, 0, 128), (127, 63, 31, 64)],
+            [(10, 20, 30, 255), (0, 0, 255, 1), (255, 255, 255, 255)],
+        ],
+    )
+
+
+def test_output_is_cropped_to_content(encoder):
+    surface = Surface(10, 8)
+    surface.set(3, 2, 200, 100, 50, 255)
+    surface.set(6, 4, 0, 0, 100, 200)
+    png, bbox = encoder(surface)
+    assert bbox == (3, 2, 4, 3)
+    width, height, rows = decode_png(png)
+    assert (width, height) == (4, 3)
+    assert rows[0][0] == (200, 100, 50, 255)
+    assert rows[2][3] == (0, 0, 127, 200)
+    assert sum(pixel != (0, 0, 0, 0) for row in rows for pixel in row) == 2
+
+
+def test_rect_encodes_exactly_that_area(encoder):
+    surface = Surface(10, 8)
+    surface.set(5, 5, 40, 40, 40, 255)
+    png, bbox = encoder(surface, rect=(4, 4, 3, 3))
+    assert bbox == (4, 4, 3, 3)
+    width, height, rows = decode_png(png)
+    assert (width, height) == (3, 3)
+    assert rows[1][1] == (40, 40, 40, 255)
+    assert rows[0] == [(0, 0, 0, 0)] * 3
+
+
+def test_rect_is_clamped_to_surface(encoder):
+    surface = Surface(10, 8)
+    surface.set(9, 7, 1, 2, 3, 255)
+    png, bbox = encoder(surface, rect=(8, 6, 5, 5))
+    assert bbox == (8, 6, 2, 2)
+    assert decode_png(png)[2][1][1] == (1, 2, 3, 255)
+
+
+def test_transparent_surface_encodes_one_pixel(encoder):
+    png, bbox = encoder(Surface(6, 4))
+    assert bbox == (0, 0, 1, 1)
+    assert decode_png(png) == (1, 1, [[(0, 0, 0, 0)]])
+
+
+def test_numpy_and_python_paths_match(monkeypatch):
+    if terra_runtime.np is None:
+        pytest.skip("NumPy не установлен")
+    surface = Surface(17, 9, stride=80)
+    for y in range(9):
+        for x in range(17):
+            a = (x * 37 + y * 11) % 256
+            surface.set(x, y, a * x // 17, a * y // 9, a // 2, a)
+    fast = terra_runtime.encode_png_fast(surface)
+    monkeypatch.setattr(terra_runtime, "np", None)
+    assert terra_runtime.encode_png_fast(surface) == fast
+
+
+def test_content_bbox_of_empty_buffer():
+    assert terra_runtime.content_bbox(bytes(64), 4, 4, 16) is None
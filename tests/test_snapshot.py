@@ -0,0 +1,85 @@
+import os
+import struct
+import time
+import types
+
+import pytest
+
+import terra_runtime
+
+
+def test_snapshot_round_trip():
+    terra_runtime.write_snapshot("test_round_trip", {"metrics": {"cpu": 12.5}})
+    terra_runtime.write_snapshot("test_round_trip", {"spotify": None})
+    assert terra_runtime.read_snapshot("test_round_trip") == {"spotify": None}
+
+
+def test_missing_snapshot():
+    assert terra_runtime.read_snapshot("test_missing") is None
+
+
+def test_reader_retries_while_writer_is_busy(monkeypatch):
+    terra_runtime.write_snapshot("test_busy", {"n": 1})
+    mm = terra_runtime.snapshot_map("test_busy", True)
+    seq = terra_runtime.SNAPSHOT_HEADER.unpack_from(mm)[0]
+    # Писатель начал запись: seq нечётный
+    struct.pack_into("<Q", mm, 0, seq + 1)
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        if len(sleeps) == 2:
+            struct.pack_into("<Q", mm, 0, seq + 2)
+
+    monkeypatch.setattr(terra_runtime, "time", types.SimpleNamespace(sleep=sleep, time=time.time))
+    assert terra_runtime.read_snapshot("test_busy") == {"n": 1}
+    assert len(sleeps) == 2
+
+
+def test_reader_gives_up_on_stuck_writer(monkeypatch):
+    terra_runtime.write_snapshot("test_stuck", {"n": 1})
+    mm = terra_runtime.snapshot_map("test_stuck", True)
+    struct.pack_into("<Q", mm, 0, terra_runtime.SNAPSHOT_HEADER.unpack_from(mm)[0] + 1)
+    monkeypatch.setattr(
+        terra_runtime, "time", types.SimpleNamespace(sleep=lambda s: None, time=time.time)
+    )
+    assert terra_runtime.read_snapshot("test_stuck") is None
+
+
+def test_stale_snapshot_is_ignored():
+    terra_runtime.write_snapshot("test_stale", {"n": 1})
+    mm = terra_runtime.snapshot_map("test_stale", True)
+    seq, _, length, version = terra_runtime.SNAPSHOT_HEADER.unpack_from(mm)
+    terra_runtime.SNAPSHOT_HEADER.pack_into(mm, 0, seq, time.time() - 10, length, version)
+    assert terra_runtime.read_snapshot("test_stale", max_age=3) is None
+    assert terra_runtime.read_snapshot("test_stale", max_age=60) == {"n": 1}
+
+
+def test_snapshot_of_other_version_is_ignored():
+    terra_runtime.write_snapshot("test_version", {"n": 1})
+    mm = terra_runtime.snapshot_map("test_version", True)
+    seq, published_at, length, version = terra_runtime.SNAPSHOT_HEADER.unpack_from(mm)
+    terra_runtime.SNAPSHOT_HEADER.pack_into(mm, 0, seq, published_at, length, version + 1)
+    assert terra_runtime.read_snapshot("test_version") is None
+
+
+def test_snapshot_with_corrupt_length_is_ignored():
+    terra_runtime.write_snapshot("test_length", {"n": 1})
+    mm = terra_runtime.snapshot_map("test_length", True)
+    seq, published_at, _, version = terra_runtime.SNAPSHOT_HEADER.unpack_from(mm)
+    terra_runtime.SNAPSHOT_HEADER.pack_into(
+        mm, 0, seq, published_at, terra_runtime.SNAPSHOT_SIZE, version
+    )
+    assert terra_runtime.read_snapshot("test_length") is None
+
+
+def test_snapshot_file_of_other_size_is_ignored():
+    with open(terra_runtime.runtime_path("test_size.snapshot"), "wb") as f:
+        f.write(b"\0" * 1024)
+    assert terra_runtime.read_snapshot("test_size") is None
+
+
+def test_oversized_snapshot_is_rejected():
+    with pytest.raises(ValueError):
+        terra_runtime.write_snapshot("test_large", {"blob": "x" * terra_runtime.SNAPSHOT_SIZE})
+    assert not os.path.exists(terra_runtime.runtime_path("test_large.snapshot"))
@@ -0,0 +1,119 @@
+import os
+import types
+
+import pytest
+
+pytest.importorskip("cairo")
+
+import benchmark
+import spotify_cover
+import terra_runtime
+
+
+class ListenerStopped(Exception):
+    pass
+
+
+@pytest.fixture
+def listener(monkeypatch):
+    """run_listener с записью публикаций; останавливается на втором перезапуске."""
+    events = []
+    monkeypatch.setattr(
+        spotify_cover, "publish_render", lambda data, on_cover=None: events.append(data)
+    )
+    monkeypatch.setattr(
+        terra_runtime, "publish_line", lambda name, line: events.append(line)
+    )
+    restarts = []
+
+    def sleep(seconds):
+        restarts.append(seconds)
+        if restarts.count(spotify_cover.LISTENER_RESTART_DELAY) >= 2:
+            raise ListenerStopped()
+
+    monkeypatch.setattr(spotify_cover, "time", types.SimpleNamespace(sleep=sleep))
+
+    def run():
+        with pytest.raises(ListenerStopped):
+            spotify_cover.run_listener()
+        return events, restarts
+
+    return run
+
+
+def scripted_playerctl(directory, lines):
+    path = os.path.join(directory, "playerctl")
+    with open(path, "w") as f:
+        f.write("#!/bin/sh\n" + "".join(f'echo "{line}"\n' for line in lines))
+    os.chmod(path, 0o755)
+    return path
+
+
+def test_get_metadata_reads_fake_playerctl(monkeypatch, tmp_path, stand_in):
+    monkeypatch.setattr(
+        spotify_cover, "PLAYERCTL", benchmark.write_fake_playerctl(str(tmp_path), stand_in)
+    )
+    assert spotify_cover.get_metadata() == [
+        "Playing",
+        f"{stand_in}/cover.png",
+        "Bench Title",
+        "Bench Artist",
+    ]
+
+
+def test_listener_restarts_after_playerctl_exits(monkeypatch, tmp_path, stand_in, listener):
+    monkeypatch.setattr(
+        spotify_cover, "PLAYERCTL", benchmark.write_fake_playerctl(str(tmp_path), stand_in)
+    )
+    events, restarts = listener()
+    data = ["Playing", f"{stand_in}/cover.png", "Bench Title", "Bench Artist"]
+    # Каждый запуск playerctl публикует трек, а его выход прячет блок до перезапуска
+    assert events == [data, "", data, ""]
+    assert restarts == [spotify_cover.LISTENER_RESTART_DELAY] * 2
+
+
+def test_listener_renders_only_changes(monkeypatch, tmp_path, listener):
+    a = "Playing||http://covers/a.png||A||Artist"
+    b = "Paused||http://covers/a.png||A||Artist"
+    monkeypatch.setattr(spotify_cover, "PLAYERCTL", scripted_playerctl(str(tmp_path), [a, a, b, b, a]))
+    events, _ = listener()
+    once = [a.split("||"), b.split("||"), a.split("||"), ""]
+    assert events == once + once
+
+
+def test_listener_survives_missing_playerctl(monkeypatch, tmp_path, listener):
+    monkeypatch.setattr(spotify_cover, "PLAYERCTL", str(tmp_path / "missing"))
+    events, restarts = listener()
+    assert events == ["", ""]
+    assert len(restarts) == 2
+
+
+def test_listener_retracts_palette_when_playerctl_exits(monkeypatch, tmp_path, listener):
+    monkeypatch.setattr(spotify_cover, "COVER_COLORS", True)
+    monkeypatch.setattr(spotify_cover, "PLAYERCTL", str(tmp_path / "missing"))
+    terra_runtime.publish_palette({"accent": [1, 0, 0]})
+    listener()
+    assert terra_runtime.read_palette() is None
+
+
+def test_listener_renders_from_sampler_while_it_runs(monkeypatch, tmp_path, listener):
+    a = ["Playing", "", "A", "Artist"]
+    b = ["Paused", "", "A", "Artist"]
+    snapshots = [{"spotify": a}, {"spotify": a}, {"spotify": a}, {"spotify": b}]
+    monkeypatch.setattr(
+        terra_runtime, "read_sampler", lambda: snapshots.pop(0) if snapshots else None
+    )
+    followed = []
+    follow = spotify_cover.follow_metadata
+
+    def counting_follow():
+        followed.append(True)
+        return follow()
+
+    monkeypatch.setattr(spotify_cover, "follow_metadata", counting_follow)
+    monkeypatch.setattr(spotify_cover, "PLAYERCTL", str(tmp_path / "missing"))
+    events, sleeps = listener()
+    # Пока сэмплер жив — только его снимок; потом свой playerctl (здесь его нет)
+    assert events == [a, b, "", ""]
+    assert sleeps[:3] == [spotify_cover.SAMPLER_POLL_INTERVAL] * 3
+    assert len(followed) == 2
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+cairo = pytest.importorskip("cairo")
+
+import spotify_cover
+import terra_runtime
+import text_metrics
+
+
+@pytest.fixture
+def metrics(monkeypatch, tmp_path):
+    """Пустой кэш размеров в отдельном каталоге."""
+    monkeypatch.setattr(terra_runtime, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(terra_runtime, "_cache_ready", False)
+    monkeypatch.setattr(text_metrics, "_metrics", None)
+    monkeypatch.setattr(text_metrics, "_added", {})
+    monkeypatch.setattr(text_metrics, "_used", set())
+    return text_metrics
+
+
+def ctx():
+    return cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 1, 1))
+
+
+def saved():
+    with open(terra_runtime.cache_path(text_metrics.METRICS_FILE), "r") as f:
+        return json.load(f)
+
+
+def test_save_merges_with_other_writers(metrics):
+    metrics.text_extents(ctx(), "Clash Display", "Bold", 20, "CPU")
+    # Тем временем другой виджет дописал свою строку
+    terra_runtime.atomic_write(
+        terra_runtime.cache_path(metrics.METRICS_FILE),
+        json.dumps({"Clash Display|Normal|18|-3°c": [0, -10, 30, 12, 31, 0]}),
+    )
+    metrics.save()
+    assert list(saved()) == ["Clash Display|Normal|18|-3°c", "Clash Display|Bold|20|CPU"]
+
+
+def test_overflow_evicts_least_recently_used(metrics, monkeypatch):
+    monkeypatch.setattr(metrics, "MAX_ENTRIES", 3)
+    c = ctx()
+    for text in ("a", "b", "c"):
+        metrics.text_extents(c, "F", "Normal", 10, text)
+    metrics.text_extents(c, "F", "Normal", 10, "a")
+    metrics.text_extents(c, "F", "Normal", 10, "d")
+    assert list(metrics.load_metrics()) == ["F|Normal|10|c", "F|Normal|10|a", "F|Normal|10|d"]
+    metrics.save()
+    assert list(saved()) == ["F|Normal|10|c", "F|Normal|10|a", "F|Normal|10|d"]
+
+
+def test_hits_alone_do_not_rewrite_file(metrics):
+    metrics.text_extents(ctx(), "F", "Normal", 10, "42%")
+    metrics.save()
+    path = terra_runtime.cache_path(metrics.METRICS_FILE)
+    terra_runtime.atomic_write(path, "{}")
+    metrics.text_extents(ctx(), "F", "Normal", 10, "42%")
+    metrics.save()
+    assert saved() == {}
+
+
+def test_fit_text_caches_only_final_width(metrics):
+    title = "A very long track title that never fits into the cover widget line"
+    fitted = spotify_cover.fit_text(title, spotify_cover.TITLE_SIZE)
+    assert fitted.endswith(spotify_cover.ELLIPSIS) and len(fitted) < len(title)
+    prefix = f"{spotify_cover.FONT}|Normal|{spotify_cover.TITLE_SIZE}|"
+    assert sorted(metrics.load_metrics()) == sorted([prefix + title, prefix + fitted])
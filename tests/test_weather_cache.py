@@ -0,0 +1,164 @@
+import json
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("cairo")
+
+import cache_manager
+import terra_runtime
+import weather_smart
+
+LOCATIONS = [{"name": "Berlin", "lat": "52.52", "lon": "13.41"}]
+
+
+@pytest.fixture
+def weather(monkeypatch, tmp_path, stand_in):
+    """weather_smart с пустыми кэшем и каталогом выполнения и локальным Open-Meteo."""
+    monkeypatch.setattr(terra_runtime, "CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(terra_runtime, "_cache_ready", False)
+    monkeypatch.setattr(terra_runtime, "RUNTIME_DIR", str(tmp_path / "runtime"))
+    monkeypatch.setattr(terra_runtime, "_dir_ready", False)
+    monkeypatch.setattr(
+        weather_smart,
+        "WEATHER_CACHE",
+        cache_manager.CacheManager(
+            str(tmp_path), weather_smart.WEATHER_CACHE_BUDGET_BYTES, manifest="weather_manifest.json"
+        ),
+    )
+    monkeypatch.setattr(weather_smart, "WEATHER_API_URL", f"{stand_in}/v1/forecast")
+    monkeypatch.setattr(weather_smart, "DEBUG", False)
+    return weather_smart
+
+
+@pytest.fixture
+def spawned(weather, monkeypatch):
+    """Наборы городов, для которых запускалось фоновое обновление."""
+    calls = []
+    monkeypatch.setattr(weather, "spawn_refresh", calls.append)
+    return calls
+
+
+def rewrite_cache(mod, change):
+    path = terra_runtime.cache_path(mod.weather_cache_name(LOCATIONS))
+    with open(path, "r") as f:
+        cached = json.load(f)
+    change(cached)
+    terra_runtime.atomic_write(path, json.dumps(cached))
+
+
+def test_missing_cache_returns_nothing_and_refreshes_in_background(weather, spawned):
+    assert weather.get_weather_data(LOCATIONS) == (None, None)
+    assert spawned == [LOCATIONS]
+
+
+def test_fresh_cache_is_served_without_refresh(weather, spawned):
+    assert weather.refresh_weather_cache(LOCATIONS)
+    rows, age = weather.get_weather_data(LOCATIONS)
+    assert age == 0
+    assert len(rows) == 1 and rows[0][2].startswith("Berlin · ")
+    assert spawned == []
+
+
+def test_expired_cache_is_served_and_revalidated(weather, spawned):
+    assert weather.refresh_weather_cache(LOCATIONS)
+
+    def expire(cached):
+        cached["fetched_at"] -= weather.SERIES_TTL + 1
+
+    rewrite_cache(weather, expire)
+    rows, _ = weather.get_weather_data(LOCATIONS)
+    assert rows
+    assert spawned == [LOCATIONS]
+
+
+def test_series_past_its_end_is_marked_stale(weather, spawned):
+    assert weather.refresh_weather_cache(LOCATIONS)
+    shift = (weather.SERIES_DAYS + 2) * 86400
+
+    def age(cached):
+        for series in cached["data"]:
+            series["start"] -= shift
+            series["sun"] = [[rise - shift, sunset - shift] for rise, sunset in series["sun"]]
+
+    rewrite_cache(weather, age)
+    rows = weather.weather_rows(LOCATIONS)
+    assert rows[0][2].endswith(" ago")
+    assert spawned == [LOCATIONS]
+
+
+def test_concurrent_refreshes_fetch_once(weather, monkeypatch):
+    calls = []
+    fetch = weather.fetch_all_weather
+
+    def slow_fetch(locations):
+        calls.append(locations)
+        time.sleep(0.3)
+        return fetch(locations)
+
+    monkeypatch.setattr(weather, "fetch_all_weather", slow_fetch)
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(weather.refresh_weather_cache(LOCATIONS)))
+        for _ in range(4)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert sorted(results) == [False, False, False, True]
+
+
+def test_refresh_skips_while_lock_is_held(weather, monkeypatch):
+    lock = terra_runtime.acquire_lock(f"{weather.weather_cache_name(LOCATIONS)}.refresh")
+    try:
+        assert not weather.refresh_weather_cache(LOCATIONS)
+        assert weather.load_weather_cache(LOCATIONS) is None
+    finally:
+        lock.close()
+    assert weather.refresh_weather_cache(LOCATIONS)
+
+
+def test_failed_refresh_keeps_cached_forecast(weather, monkeypatch):
+    assert weather.refresh_weather_cache(LOCATIONS)
+    before = weather.load_weather_cache(LOCATIONS)
+    monkeypatch.setattr(weather, "fetch_all_weather", lambda locations: None)
+    assert not weather.refresh_weather_cache(LOCATIONS)
+    assert weather.load_weather_cache(LOCATIONS) == before
+
+
+def backdate_failure(mod, seconds):
+    name = mod.weather_cache_name(LOCATIONS)
+    failure = mod.read_refresh_failure(name)
+    failure["failed_at"] -= seconds
+    terra_runtime.atomic_write(mod.failure_path(name), json.dumps(failure))
+
+
+def test_failed_refresh_backs_off_before_respawning(weather, spawned, monkeypatch):
+    monkeypatch.setattr(weather, "fetch_all_weather", lambda locations: None)
+    assert not weather.refresh_weather_cache(LOCATIONS)
+    for _ in range(3):
+        assert weather.get_weather_data(LOCATIONS) == (None, None)
+    assert spawned == []
+
+    backdate_failure(weather, weather.WEATHER_BACKOFF_SEC)
+    weather.get_weather_data(LOCATIONS)
+    assert spawned == [LOCATIONS]
+
+
+def test_backoff_doubles_and_clears_on_success(weather, spawned, monkeypatch):
+    fetch = weather.fetch_all_weather
+    monkeypatch.setattr(weather, "fetch_all_weather", lambda locations: None)
+    weather.refresh_weather_cache(LOCATIONS)
+    weather.refresh_weather_cache(LOCATIONS)
+    name = weather.weather_cache_name(LOCATIONS)
+    assert weather.read_refresh_failure(name)["failures"] == 2
+    backdate_failure(weather, weather.WEATHER_BACKOFF_SEC)
+    weather.get_weather_data(LOCATIONS)
+    assert spawned == []
+
+    monkeypatch.setattr(weather, "fetch_all_weather", fetch)
+    assert weather.refresh_weather_cache(LOCATIONS)
+    assert weather.read_refresh_failure(name) is None
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Кэш шрифтов и размеров текста для виджетов.
+
+Размеры строк ("42%", "CPU", "-3°c", описания погоды) повторяются весь
+день, поэтому text_extents считается один раз на (шрифт, начертание,
+размер, строка) и хранится в ~/.cache/terra-ui между запусками. Объекты
+шрифтов тоже создаются один раз: select_font_face на каждый вызов не нужен.
+
+Файл общий для всех виджетов: save() перечитывает его и дописывает только
+новые строки этого процесса, а при переполнении вытесняются самые давно
+использованные (порядок ключей в JSON — порядок использования).
+"""
+import json
+
+import cairo
+
+import terra_runtime
+
+METRICS_FILE = "text_metrics.json"
+# Защита от бесконечного роста при постоянно новых строках
+MAX_ENTRIES = 4096
+
+_faces = {}
+_metrics = None
+# Новые размеры и попадания этого процесса, ещё не записанные в файл
+_added = {}
+_used = set()
+
+
+def font_face(family, weight="Medium"):
+    key = (family, weight)
+    face = _faces.get(key)
+    if face is None:
+        face = cairo.ToyFontFace(
+            family,
+            cairo.FONT_SLANT_NORMAL,
+            cairo.FONT_WEIGHT_BOLD if weight == "Bold" else cairo.FONT_WEIGHT_NORMAL,
+        )
+        _faces[key] = face
+    return face
+
+
+def set_font(ctx, family, weight, size):
+    ctx.set_font_face(font_face(family, weight))
+    ctx.set_font_size(size)
+
+
+def read_metrics():
+    try:
+        with open(terra_runtime.cache_path(METRICS_FILE), "r") as f:
+            metrics = json.load(f)
+        return metrics if isinstance(metrics, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def load_metrics():
+    global _metrics
+    if _metrics is None:
+        _metrics = read_metrics()
+    return _metrics
+
+
+def trim(metrics):
+    # Первые ключи — самые давно использованные
+    while len(metrics) > MAX_ENTRIES:
+        del metrics[next(iter(metrics))]
+
+
+def text_extents(ctx, family, weight, size, text, store=True):
+    """cairo.TextExtents строки; при промахе ctx переключается на нужный шрифт.
+
+    store=False — промежуточные замеры (например, шаги двоичного поиска
+    в spotify_cover.fit_text): считаются, но в кэш не попадают.
+    """
+    metrics = load_metrics()
+    key = f"{family}|{weight}|{size}|{text}"
+    cached = metrics.pop(key, None)
+    if cached is None:
+        set_font(ctx, family, weight, size)
+        cached = list(ctx.text_extents(text))
+        if not store:
+            return cairo.TextExtents(*cached)
+        _added[key] = cached
+        metrics[key] = cached
+        trim(metrics)
+    else:
+        # Попадание переносит ключ в конец: он вытесняется последним
+        _used.add(key)
+        metrics[key] = cached
+    return cairo.TextExtents(*cached)
+
+
+def save():
+    """Сливает новые размеры с файлом (его могли дополнить другие виджеты)."""
+    global _metrics
+    if not _added:
+        return
+    metrics = read_metrics()
+    # Строки этого процесса переносятся в конец в порядке их использования
+    for key in list(_metrics):
+        if key in _added:
+            metrics.pop(key, None)
+            metrics[key] = _added[key]
+        elif key in _used and key in metrics:
+            metrics[key] = metrics.pop(key)
+    trim(metrics)
+    try:
+        terra_runtime.atomic_write(
+            terra_runtime.cache_path(METRICS_FILE), json.dumps(metrics)
+        )
+    except OSError:
+        return
+    _metrics = metrics
+    _added.clear()
+    _used.clear()
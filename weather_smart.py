@@ -1,4 +1,7 @@
 #!/usr/bin/env python3
+import argparse
+import asyncio
+import hashlib
 import json
 import os
 import sys
@@ -6,8 +9,15 @@ import time
 import urllib.request
 import cairo
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+import cache_manager
+import city_index
+import instrument
+import terra_runtime
+import text_metrics
+
 # --- НАСТРОЙКИ ---
 DEBUG = True
 WEATHER_RETRY_COUNT = 3
@@ -15,21 +25,77 @@ WEATHER_RETRY_DELAY_SEC = 1.5
 AUTO_DETECT = True
 DEFAULT_LAT = "52.54"
 DEFAULT_LON = "85.21"
-
-CACHE_FILE = os.path.expanduser("./weather_location.json")
+# Место без сети: LOCATION_CITY (латиницей, "Berlin", "New York") или, если
+# пусто, часовой пояс системы (/etc/localtime) ищутся в cities.idx
+# (city_index.py). ip-api — только запасной путь, если оба не нашлись.
+LOCATION_CITY = ""
+IP_FALLBACK = True
+
+# Кэш координат и прогнозов лежит в ~/.cache/terra-ui под общим менеджером
+# кэша: бюджет по размеру и LRU по манифесту (наборов городов может быть много)
+CACHE_FILE = "weather_location.json"
 LOCATION_UPDATE_INTERVAL = 14400
+WEATHER_CACHE_BUDGET_BYTES = 2 * 1024 * 1024
+WEATHER_CACHE = cache_manager.CacheManager(
+    terra_runtime.CACHE_DIR,
+    WEATHER_CACHE_BUDGET_BYTES,
+    manifest="weather_manifest.json",
+    prefixes=("weather_location", "weather_forecast"),
+)
+
+# ip-api и Open-Meteo (переменные окружения позволяют подставить локальный сервер)
+IP_API_URL = os.environ.get("TERRA_IP_API_URL", "http://ip-api.com/json/")
+WEATHER_API_URL = os.environ.get(
+    "TERRA_WEATHER_API_URL", "https://api.open-meteo.com/v1/forecast"
+)
+WEATHER_TIMEOUT_SEC = 5
+
+# Несколько городов в одном виджете: [{"name": "Berlin", "lat": "52.52", "lon": "13.41"}, ...]
+# Все точки запрашиваются одним запросом Open-Meteo. Пустой список — один
+# город по get_coords(). То же из командной строки: --location Berlin:52.52,13.41
+LOCATIONS = []
+
+# Кэш прогноза (stale-while-revalidate): виджет всегда рисует из кэша,
+# а при истёкшем TTL запускает фоновое обновление и не ждёт сеть
+WEATHER_CACHE_FILE = "weather_forecast.json"
+WEATHER_TTL = 600
+# После этого возраста рядом с описанием показывается, насколько данные старые
+WEATHER_STALE_AFTER = 3600
+# Без сети обновление тратит WEATHER_RETRY_COUNT попыток: после неудачи новое
+# не запускается WEATHER_BACKOFF_SEC, пауза удваивается до WEATHER_BACKOFF_MAX_SEC
+WEATHER_BACKOFF_SEC = 300
+WEATHER_BACKOFF_MAX_SEC = 3600
+
+# Режим рядов: раз в SERIES_TTL запрашиваются почасовые temperature_2m,
+# weather_code и is_day плюс восход и закат на SERIES_DAYS дней, а текущая
+# погода каждый тик берётся из сохранённого ряда (температура — линейной
+# интерполяцией). Вместо 144 запросов в сутки — около 8, и виджет остаётся
+# точным без сети, пока ряд не закончился. False — прежний запрос current=.
+FORECAST_SERIES = True
+SERIES_DAYS = 3
+SERIES_TTL = 3 * 3600
+# Обновляем раньше TTL, если в ряду осталось меньше стольких секунд вперёд
+SERIES_MIN_AHEAD = 12 * 3600
 
 # Графика
-TMP_DIR = "/tmp"
+OUTPUT_NAME = terra_runtime.instance_name("weather")
 IMG_WIDTH = 900
-IMG_HEIGHT = 100
+IMG_HEIGHT = terra_runtime.WEATHER_ROW_HEIGHT
 FONT_MAIN = "Clash Display"
 COLOR_PRIMARY_HEX = "#E0987A"
 COLOR_PRIMARY_RGB = (224 / 255, 152 / 255, 122 / 255)
+# Цвет текста и иконок из палитры обложки текущего трека (spotify_cover.COVER_COLORS).
+# Иконки не растрируются заново: кэшированная иконка служит маской для цвета.
+ACCENT_FROM_COVER = False
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 ICONS_DIR = os.path.join(SCRIPT_DIR, "weather_icons")
 
+# Иконки растрируются сразу в размер показа и кэшируются по
+# (имя, цвет, размер) в ~/.cache/terra-ui; прогрев: weather_smart.py --prewarm
+ICON_DISPLAY_SIZE = 64
+ICON_RENDER_DENSITY = 300
+
 # Маппинг кодов
 WEATHER_ICONS_MAP = {
     # 0-9: Явления без осадков (облачность, дым, пыль)
@@ -209,8 +275,7 @@ def log(msg):
 # --- ЛОГИКА ---
 def get_location_from_ip():
     try:
-        url = "http://ip-api.com/json/"
-        with urllib.request.urlopen(url, timeout=3) as response:
+        with urllib.request.urlopen(IP_API_URL, timeout=3) as response:
             data = json.load(response)
             if data["status"] == "success":
                 log(
@@ -222,117 +287,491 @@ def get_location_from_ip():
     return None
 
 
+def get_location_offline():
+    try:
+        if LOCATION_CITY:
+            coords = city_index.lookup(LOCATION_CITY)
+            if coords:
+                log(f"Location from LOCATION_CITY: {LOCATION_CITY} {coords}")
+                return tuple(map(str, coords))
+            log(f"{LOCATION_CITY!r} is not in the city index")
+        zone = city_index.system_timezone()
+        coords = city_index.lookup(zone) if zone else None
+        if coords:
+            log(f"Location from timezone: {zone} {coords}")
+            return tuple(map(str, coords))
+    except (OSError, ValueError) as e:
+        log(f"City index unavailable: {e}")
+    return None
+
+
 def get_coords():
     if not AUTO_DETECT:
         return DEFAULT_LAT, DEFAULT_LON
-    if os.path.exists(CACHE_FILE):
+    with instrument.stage("weather.city_lookup"):
+        loc = get_location_offline()
+    if loc:
+        return loc
+    if not IP_FALLBACK:
+        return DEFAULT_LAT, DEFAULT_LON
+    cache_path = WEATHER_CACHE.lookup(CACHE_FILE)
+    if cache_path:
         try:
-            mtime = os.path.getmtime(CACHE_FILE)
+            mtime = os.path.getmtime(cache_path)
             if (time.time() - mtime) < LOCATION_UPDATE_INTERVAL:
-                with open(CACHE_FILE, "r") as f:
+                with open(cache_path, "r") as f:
                     d = json.load(f)
                     return d["lat"], d["lon"]
         except:
             pass
-    loc = get_location_from_ip()
+    with instrument.stage("weather.ip_lookup"):
+        loc = get_location_from_ip()
     if loc:
         try:
-            with open(CACHE_FILE, "w") as f:
-                json.dump({"lat": loc[0], "lon": loc[1]}, f)
+            terra_runtime.atomic_write(
+                terra_runtime.cache_path(CACHE_FILE),
+                json.dumps({"lat": loc[0], "lon": loc[1]}),
+            )
+            WEATHER_CACHE.add(CACHE_FILE)
         except:
             pass
         return loc
     return DEFAULT_LAT, DEFAULT_LON
 
 
-def get_weather_data():
-    lat, lon = get_coords()
-    url = f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&current=temperature_2m,weather_code,is_day&timezone=auto"
-    for _ in range(WEATHER_RETRY_COUNT):
+def weather_url(lats, lons):
+    coords = f"latitude={','.join(lats)}&longitude={','.join(lons)}"
+    if FORECAST_SERIES:
+        return (
+            f"{WEATHER_API_URL}?{coords}&hourly=temperature_2m,weather_code,is_day"
+            f"&daily=sunrise,sunset&forecast_days={SERIES_DAYS}"
+            "&timezone=auto&timeformat=unixtime"
+        )
+    return f"{WEATHER_API_URL}?{coords}&current=temperature_2m,weather_code,is_day&timezone=auto"
+
+
+def has_weather(data):
+    return isinstance(data, dict) and ("hourly" if FORECAST_SERIES else "current") in data
+
+
+def fetch_json(url):
+    for attempt in range(WEATHER_RETRY_COUNT):
+        if attempt:
+            instrument.count("weather.retry")
+            time.sleep(WEATHER_RETRY_DELAY_SEC)
         try:
-            with urllib.request.urlopen(url, timeout=5) as response:
-                data = json.load(response)
-                curr = data.get("current", {})
-                temp = curr.get("temperature_2m", 0)
-                code = curr.get("weather_code", 0)
-                is_day = curr.get("is_day", 1)
-                desc = WEATHER_CODES_DESC.get(code, "Unknown")
-                return temp, code, desc, is_day
+            with urllib.request.urlopen(url, timeout=WEATHER_TIMEOUT_SEC) as response:
+                return json.load(response)
         except:
-            time.sleep(WEATHER_RETRY_DELAY_SEC)
-    return None, None, None, 1
+            pass
+    return None
 
 
-def prepare_icon(code, is_day):
-    pair = WEATHER_ICONS_MAP.get(code, ("wi-na", "wi-na"))
-    icon_name = pair[0] if is_day == 1 else pair[1]
-    svg_path = os.path.join(ICONS_DIR, f"{icon_name}.svg")
+def fetch_weather(lat, lon):
+    data = fetch_json(weather_url([lat], [lon]))
+    return data if has_weather(data) else None
 
-    if not os.path.exists(svg_path):
+
+def fetch_weather_batch(locations):
+    # Open-Meteo принимает списки координат и отвечает списком в том же порядке
+    data = fetch_json(
+        weather_url([loc["lat"] for loc in locations], [loc["lon"] for loc in locations])
+    )
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list) or len(data) != len(locations):
         return None
+    if not all(has_weather(d) for d in data):
+        return None
+    return data
+
+
+async def fetch_weather_async(locations):
+    return await asyncio.gather(
+        *(asyncio.to_thread(fetch_weather, loc["lat"], loc["lon"]) for loc in locations)
+    )
+
+
+def fetch_all_weather(locations):
+    if len(locations) == 1:
+        data = fetch_weather(locations[0]["lat"], locations[0]["lon"])
+        return [data] if data is not None else None
+
+    data = fetch_weather_batch(locations)
+    if data is None:
+        log("Batch weather request failed, falling back to concurrent requests")
+        data = asyncio.run(fetch_weather_async(locations))
+        if any(d is None for d in data):
+            return None
+    return data
+
+
+def parse_weather(data):
+    curr = data.get("current", {})
+    temp = curr.get("temperature_2m", 0)
+    code = curr.get("weather_code", 0)
+    is_day = curr.get("is_day", 1)
+    desc = WEATHER_CODES_DESC.get(code, "Unknown")
+    return temp, code, desc, is_day
+
+
+def compact_series(data):
+    """Ответ Open-Meteo -> компактный ряд: начало, шаг и плоские списки значений."""
+    hourly = data["hourly"]
+    times = hourly["time"]
+    daily = data.get("daily", {})
+    return {
+        "start": times[0],
+        "step": times[1] - times[0] if len(times) > 1 else 3600,
+        "temp": hourly["temperature_2m"],
+        "code": hourly["weather_code"],
+        "is_day": hourly["is_day"],
+        "sun": list(zip(daily.get("sunrise", []), daily.get("sunset", []))),
+    }
+
+
+def series_end(series):
+    return series["start"] + series["step"] * (len(series["temp"]) - 1)
+
+
+def series_conditions(series, now):
+    """(temp, code, desc, is_day) на момент now; за концом ряда — последний час."""
+    temps = series["temp"]
+    pos = min(max(0.0, (now - series["start"]) / series["step"]), len(temps) - 1)
+    i = int(pos)
+    j = min(i + 1, len(temps) - 1)
+    a, b = temps[i], temps[j]
+    if a is None or b is None:
+        temp = a if a is not None else b
+    else:
+        temp = a + (b - a) * (pos - i)
+    # Код погоды — за текущий час, без интерполяции
+    code = series["code"][i]
+    if series["sun"]:
+        is_day = int(any(rise <= now < sunset for rise, sunset in series["sun"]))
+    else:
+        is_day = series["is_day"][i]
+    return (
+        round(temp or 0, 1),
+        code,
+        WEATHER_CODES_DESC.get(code, "Unknown"),
+        is_day,
+    )
+
+
+def parse_location(value):
+    # "Berlin:52.52,13.41" -> {"name": "Berlin", "lat": "52.52", "lon": "13.41"};
+    # просто "Berlin" — координаты из индекса городов
+    if ":" not in value:
+        try:
+            coords = city_index.lookup(value)
+        except (OSError, ValueError):
+            coords = None
+        if coords is None:
+            raise argparse.ArgumentTypeError(
+                f"{value!r} нет в индексе городов, укажите Имя:широта,долгота"
+            )
+        return {"name": value, "lat": str(coords[0]), "lon": str(coords[1])}
+    name, coords = value.rsplit(":", 1)
+    lat, lon = coords.split(",")
+    return {"name": name, "lat": lat.strip(), "lon": lon.strip()}
+
+
+def normalize_location(loc):
+    # Один вид для хэша и для --refresh: числа и лишние ключи из LOCATIONS
+    # иначе дали бы родителю и фоновому процессу разные имена кэша
+    return {"name": str(loc.get("name") or ""), "lat": str(loc["lat"]), "lon": str(loc["lon"])}
+
+
+def weather_cache_name(locations):
+    # У каждого набора городов свой файл: несколько дисплеев не мешают друг другу
+    name = WEATHER_CACHE_FILE
+    if FORECAST_SERIES:
+        name = name.replace(".json", "_series.json")
+    if not locations:
+        return name
+    normalized = [normalize_location(loc) for loc in locations]
+    key = hashlib.sha1(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+    return name.replace(".json", f"_{key[:12]}.json")
+
+
+def load_weather_cache(locations):
+    try:
+        with open(WEATHER_CACHE.lookup(weather_cache_name(locations)), "r") as f:
+            cached = json.load(f)
+        if isinstance(cached.get("data"), list) and cached.get("series", False) == FORECAST_SERIES:
+            return cached
+    except:
+        pass
+    return None
+
+
+def failure_path(cache_name):
+    # Отметка неудачного обновления живёт в каталоге выполнения (до перезагрузки)
+    return terra_runtime.runtime_path(f"{cache_name}.failed")
+
+
+def read_refresh_failure(cache_name):
+    try:
+        with open(failure_path(cache_name), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def record_refresh_failure(cache_name):
+    failure = read_refresh_failure(cache_name) or {}
+    try:
+        terra_runtime.atomic_write(
+            failure_path(cache_name),
+            json.dumps({"failed_at": time.time(), "failures": failure.get("failures", 0) + 1}),
+        )
+    except OSError:
+        pass
+
+
+def clear_refresh_failure(cache_name):
+    try:
+        os.remove(failure_path(cache_name))
+    except FileNotFoundError:
+        pass
+
 
+def refresh_backed_off(cache_name, now):
+    failure = read_refresh_failure(cache_name)
+    if not failure:
+        return False
+    delay = min(
+        WEATHER_BACKOFF_MAX_SEC,
+        WEATHER_BACKOFF_SEC * 2 ** (failure.get("failures", 1) - 1),
+    )
+    return now - failure.get("failed_at", 0) < delay
+
+
+def refresh_weather_cache(locations):
+    # Одно обновление за раз: остальные фоновые процессы сразу выходят
+    cache_name = weather_cache_name(locations)
+    lock = terra_runtime.acquire_lock(f"{cache_name}.refresh")
+    if lock is None:
+        return False
+
+    if not locations:
+        lat, lon = get_coords()
+        locations = [{"name": None, "lat": lat, "lon": lon}]
+
+    with instrument.stage("weather.fetch"):
+        data = fetch_all_weather(locations)
+    if data is None:
+        instrument.count("weather.refresh_failed")
+        log("Weather refresh failed, keeping cached forecast")
+        record_refresh_failure(cache_name)
+        return False
+
+    if FORECAST_SERIES:
+        try:
+            data = [compact_series(d) for d in data]
+        except (KeyError, IndexError, TypeError):
+            log("Unexpected hourly forecast format, keeping cached forecast")
+            record_refresh_failure(cache_name)
+            return False
+
+    terra_runtime.atomic_write(
+        terra_runtime.cache_path(cache_name),
+        json.dumps(
+            {
+                "fetched_at": time.time(),
+                "series": FORECAST_SERIES,
+                "locations": locations,
+                "data": data,
+            },
+            separators=(",", ":"),
+        ),
+    )
+    WEATHER_CACHE.add(cache_name)
+    clear_refresh_failure(cache_name)
+    return True
+
+
+def spawn_refresh(locations):
+    # Отдельная сессия: conky не ждёт сеть и не убьёт процесс вместе с execpi
+    instrument.count("weather.refresh_spawn")
+    cmd = [sys.executable, os.path.abspath(__file__), "--refresh"]
+    for loc in map(normalize_location, locations):
+        cmd += ["--location", f"{loc['name']}:{loc['lat']},{loc['lon']}"]
     try:
-        with open(svg_path, "r") as f:
-            svg_content = f.read()
+        subprocess.Popen(
+            cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    except OSError as e:
+        log(f"Cannot start weather refresh: {e}")
+
+
+def request_refresh(locations, now):
+    # После неудачного обновления не запускаем новый процесс на каждом тике
+    if refresh_backed_off(weather_cache_name(locations), now):
+        instrument.count("weather.refresh_backoff")
+        return
+    spawn_refresh(locations)
+
+
+def get_weather_data(locations=None):
+    """Прогноз из кэша без ожидания сети: (строки (temp, code, desc, is_day), age_sec).
+
+    В режиме рядов age — сколько секунд прошло после конца сохранённого ряда
+    (0, пока ряд покрывает текущий момент).
+    """
+    if locations is None:
+        locations = LOCATIONS
+    with instrument.stage("weather.load_cache"):
+        cached = load_weather_cache(locations)
+    now = time.time()
+    if cached is None:
+        request_refresh(locations, now)
+        return None, None
+
+    if FORECAST_SERIES:
+        end = min(series_end(series) for series in cached["data"])
+        expired = now - cached["fetched_at"] >= SERIES_TTL or end - now < SERIES_MIN_AHEAD
+        age = max(0.0, now - end)
+    else:
+        age = now - cached["fetched_at"]
+        expired = age >= WEATHER_TTL
+    if expired:
+        request_refresh(locations, now)
+
+    rows = []
+    for loc, data in zip(cached["locations"], cached["data"]):
+        if FORECAST_SERIES:
+            temp, code, desc, is_day = series_conditions(data, now)
+        else:
+            temp, code, desc, is_day = parse_weather(data)
+        if loc.get("name"):
+            desc = f"{loc['name']} · {desc}"
+        rows.append((temp, code, desc, is_day))
+    return rows, age
+
+
+def format_age(age):
+    if age < 3600:
+        return f"{int(age // 60)}m"
+    if age < 86400:
+        return f"{int(age // 3600)}h"
+    return f"{int(age // 86400)}d"
+
+
+def weather_rows(locations=None):
+    """Строки для create_weather_image с отметкой возраста устаревших данных."""
+    rows, age = get_weather_data(locations)
+    if not rows:
+        return None
+    if age >= WEATHER_STALE_AFTER:
+        suffix = f" · {format_age(age)} ago"
+        rows = [(temp, code, desc + suffix, is_day) for temp, code, desc, is_day in rows]
+    return rows
+
+
+def icon_name_for(code, is_day):
+    pair = WEATHER_ICONS_MAP.get(code, ("wi-na", "wi-na"))
+    return pair[0] if is_day == 1 else pair[1]
+
+
+def icon_cache_path(icon_name, color_hex=COLOR_PRIMARY_HEX, size=ICON_DISPLAY_SIZE):
+    return terra_runtime.cache_path(
+        f"{icon_name}_{color_hex.lstrip('#')}_{size}.png"
+    )
 
-        colored_svg = svg_content.replace("<svg ", f'<svg fill="{COLOR_PRIMARY_HEX}" ')
 
-        temp_svg = os.path.join(TMP_DIR, "temp_weather_icon.svg")
-        with open(temp_svg, "w") as f:
-            f.write(colored_svg)
+def rasterize_icon(icon_name, color_hex=COLOR_PRIMARY_HEX, size=ICON_DISPLAY_SIZE):
+    svg_path = os.path.join(ICONS_DIR, f"{icon_name}.svg")
+    if not os.path.exists(svg_path):
+        return None
+
+    with open(svg_path, "r") as f:
+        svg_content = f.read()
 
-        temp_png = os.path.join(TMP_DIR, "temp_weather_icon.png")
+    colored_svg = svg_content.replace("<svg ", f'<svg fill="{color_hex}" ')
 
-        # High Quality Render
+    def write_png(tmp_path):
+        # SVG идёт через stdin: никаких общих временных файлов в /tmp
+        instrument.count("weather.convert_spawn")
         subprocess.run(
             [
                 "convert",
                 "-background",
                 "none",
                 "-density",
-                "300",  # Высокое разрешение
-                temp_svg,
+                str(ICON_RENDER_DENSITY),  # Высокое разрешение
+                "svg:-",
                 "-resize",
-                "256x256",  # Большой размер
-                temp_png,
+                f"{size}x{size}",
+                f"png:{tmp_path}",
             ],
+            input=colored_svg.encode("utf-8"),
             check=True,
         )
 
-        return temp_png
+    with instrument.stage("weather.convert"):
+        return terra_runtime.atomic_write_with(
+            icon_cache_path(icon_name, color_hex, size), write_png
+        )
+
+
+def prepare_icon(code, is_day):
+    icon_name = icon_name_for(code, is_day)
+    cached = icon_cache_path(icon_name)
+    if os.path.exists(cached):
+        instrument.count("weather.icon_hit")
+        return cached
+
+    instrument.count("weather.icon_miss")
+    try:
+        return rasterize_icon(icon_name)
     except Exception as e:
-        if DEBUG:
-            print(f"Icon error: {e}")
+        log(f"Icon error: {e}")
         return None
 
 
-def create_weather_image(temp, code, desc, is_day):
-    timestamp = int(time.time())
-    filename = os.path.join(TMP_DIR, f"conky_weather_{timestamp}.png")
+def prewarm_icons(workers=None):
+    # convert — отдельные процессы, поэтому потоков хватает, чтобы занять все ядра
+    names = sorted(f[:-4] for f in os.listdir(ICONS_DIR) if f.endswith(".svg"))
 
-    try:
-        for f in os.listdir(TMP_DIR):
-            if f.startswith("conky_weather_"):
-                os.remove(os.path.join(TMP_DIR, f))
-    except:
-        pass
+    def warm(icon_name):
+        try:
+            return rasterize_icon(icon_name) is not None
+        except Exception as e:
+            log(f"Icon error ({icon_name}): {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        done = sum(pool.map(warm, names))
+    log(f"Prewarmed {done}/{len(names)} icons into {terra_runtime.CACHE_DIR}")
+    return done
+
+
+def accent_rgb():
+    if ACCENT_FROM_COVER:
+        return terra_runtime.palette_color("accent", COLOR_PRIMARY_RGB)
+    return COLOR_PRIMARY_RGB
 
-    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, IMG_WIDTH, IMG_HEIGHT)
-    ctx = cairo.Context(surface)
 
+def draw_weather_row(ctx, temp, code, desc, is_day):
+    # Одна строка погоды в прямоугольнике IMG_WIDTH x IMG_HEIGHT от (0, 0)
     icon_png_path = prepare_icon(code, is_day)
+    color = accent_rgb()
 
-    ICON_DISPLAY_SIZE = 64
     FONT_SIZE = 48
 
     sign = ""
     temp_str = f"{sign}{temp:.0f}°c"
 
-    ctx.select_font_face(FONT_MAIN, cairo.FONT_SLANT_NORMAL, cairo.FONT_WEIGHT_NORMAL)
-    ctx.set_font_size(FONT_SIZE)
-
-    ext_temp = ctx.text_extents(temp_str)
-    ext_desc = ctx.text_extents(desc)
+    # Размеры строк берутся из постоянного кэша: они повторяются весь день
+    ext_temp = text_metrics.text_extents(ctx, FONT_MAIN, "Normal", FONT_SIZE, temp_str)
+    ext_desc = text_metrics.text_extents(ctx, FONT_MAIN, "Normal", FONT_SIZE, desc)
+    text_metrics.set_font(ctx, FONT_MAIN, "Normal", FONT_SIZE)
 
     GAP_ICON_TEMP = 20
     GAP_TEMP_PIPE = 25
@@ -364,13 +803,17 @@ def create_weather_image(temp, code, desc, is_day):
             ctx.save()
             ctx.translate(icon_x, icon_y)
 
-            # Масштабирование
+            # Масштабирование (для кэша в размере показа scale == 1)
             raw_w = img_surf.get_width()
             scale = ICON_DISPLAY_SIZE / float(raw_w)
 
             ctx.scale(scale, scale)
-            ctx.set_source_surface(img_surf, 0, 0)
-            ctx.paint()
+            if color == COLOR_PRIMARY_RGB:
+                ctx.set_source_surface(img_surf, 0, 0)
+                ctx.paint()
+            else:
+                ctx.set_source_rgb(*color)
+                ctx.mask_surface(img_surf, 0, 0)
             ctx.restore()
         except:
             pass
@@ -378,7 +821,7 @@ def create_weather_image(temp, code, desc, is_day):
     current_x = start_x + ICON_DISPLAY_SIZE + GAP_ICON_TEMP - 10
 
     # 2. Temp
-    ctx.set_source_rgb(*COLOR_PRIMARY_RGB)
+    ctx.set_source_rgb(*color)
     ctx.move_to(current_x, base_y)
     ctx.show_text(temp_str)
 
@@ -386,7 +829,7 @@ def create_weather_image(temp, code, desc, is_day):
 
     # 3. Separator
     ctx.set_line_width(PIPE_WIDTH)
-    r, g, b = COLOR_PRIMARY_RGB
+    r, g, b = color
     ctx.set_source_rgba(r, g, b, 0.4)
 
     pipe_h = 40
@@ -398,20 +841,78 @@ def create_weather_image(temp, code, desc, is_day):
     current_x += PIPE_WIDTH + GAP_PIPE_DESC
 
     # 4. Description
-    ctx.set_source_rgb(*COLOR_PRIMARY_RGB)
+    ctx.set_source_rgb(*color)
     ctx.move_to(current_x, base_y)
     ctx.show_text(desc)
 
-    surface.write_to_png(filename)
-    return filename
+
+def create_weather_image(rows):
+    """rows — список (temp, code, desc, is_day); города идут друг под другом.
+
+    Возвращает готовую строку ${image ...} для conky. Городов не больше
+    terra_runtime.WEATHER_ROWS: ниже начинаются кольца.
+    """
+    if len(rows) > terra_runtime.WEATHER_ROWS:
+        log(
+            f"{len(rows)} weather rows, room for {terra_runtime.WEATHER_ROWS}: "
+            "raise terra_runtime.WEATHER_ROWS"
+        )
+        rows = rows[: terra_runtime.WEATHER_ROWS]
+    surface = cairo.ImageSurface(
+        cairo.FORMAT_ARGB32, IMG_WIDTH, IMG_HEIGHT * len(rows)
+    )
+    ctx = cairo.Context(surface)
+
+    with instrument.stage("weather.render"):
+        for i, (temp, code, desc, is_day) in enumerate(rows):
+            ctx.save()
+            ctx.translate(0, i * IMG_HEIGHT)
+            draw_weather_row(ctx, temp, code, desc, is_day)
+            ctx.restore()
+
+    text_metrics.save()
+    with instrument.stage("weather.encode"):
+        _, line = terra_runtime.publish_image(OUTPUT_NAME, surface, 0, 300)
+    return line
 
 
 def main():
-    temp, code, desc, is_day = get_weather_data()
-    if temp is None:
+    parser = argparse.ArgumentParser(description="TERRA UI: погода")
+    parser.add_argument(
+        "--prewarm",
+        action="store_true",
+        help="растрировать все иконки weather_icons/ в кэш параллельно",
+    )
+    parser.add_argument(
+        "--location",
+        action="append",
+        type=parse_location,
+        help="город в виде Имя:широта,долгота или Имя из индекса городов (можно несколько раз)",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="синхронно обновить кэш прогноза (так работает фоновое обновление)",
+    )
+    args = parser.parse_args()
+
+    if args.prewarm:
+        prewarm_icons()
+        return
+    locations = args.location or LOCATIONS
+    if args.refresh:
+        refresh_weather_cache(locations)
+        instrument.flush(f"{OUTPUT_NAME}_refresh")
         return
-    img_path = create_weather_image(temp, code, desc, is_day)
-    print(f"${{image {img_path} -p 0,300d -s {IMG_WIDTH}x{IMG_HEIGHT}}}")
+
+    snapshot = terra_runtime.read_sampler() if not args.location else None
+    if snapshot and snapshot.get("weather"):
+        rows = snapshot["weather"]
+    else:
+        rows = weather_rows(locations)
+    if rows:
+        print(create_weather_image(rows))
+    instrument.flush(OUTPUT_NAME)
 
 
 if __name__ == "__main__":